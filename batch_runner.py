@@ -0,0 +1,111 @@
+from central_processing_unit import InputExhausted, ProgramTerminated
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from engines import DEFAULT_ENGINE, ENGINES
+from memory_storage import Memory
+from snapshot import state_hash
+from terminal_io import CaptureOutput, ScriptedInput
+import argparse
+import json
+import time
+
+JobResult = namedtuple('JobResult', ['job', 'output', 'state_hash', 'instructions', 'halt_reason', 'seconds'])
+
+# Set once in each worker process by init_worker, so the image is only sent to a worker once
+_worker_image = None
+_worker_engine = None
+
+
+def program_image(program, from_file=False):
+    """ returns 'program' as the bytes of a binary image, however it was given """
+    if from_file:
+        with open(program, 'rb') as f:
+            return f.read()
+
+    if isinstance(program, (bytes, bytearray, memoryview)):
+        return bytes(program)
+
+    return b''.join(value.to_bytes(length=2, byteorder='little') for value in program)
+
+
+def init_worker(image, engine_name):
+    """ runs once in each worker process """
+    global _worker_image, _worker_engine
+    _worker_image = image
+    _worker_engine = ENGINES[engine_name]
+
+
+def run_job(job, script, image=None, engine=None):
+    """ runs a fresh cpu on the program image with 'script' as its input, returns a JobResult """
+    image = image if image is not None else _worker_image
+    engine = engine if engine is not None else _worker_engine
+
+    started = time.perf_counter()
+    output = CaptureOutput()
+    cpu = engine(output=output, input_source=ScriptedInput(script))
+    cpu.memory.load_image(cpu.memory.get_words_from_bytes(image))
+    cpu.clear_caches()
+
+    try:
+        cpu.execute()
+        halt_reason = 'ended'
+    except ProgramTerminated:
+        halt_reason = 'halted'
+    except InputExhausted:
+        halt_reason = 'input_exhausted'
+    except Exception as e:
+        halt_reason = f"error: {e.__class__.__name__}: {e}"
+
+    return JobResult(job, output.getvalue(), state_hash(cpu), cpu.instruction_count, halt_reason,
+                     time.perf_counter() - started)
+
+
+def run_batch(program, scripts, from_file=False, engine_name=DEFAULT_ENGINE, max_workers=None):
+    """
+    Runs one cpu per script in 'scripts' across a pool of processes
+    yields a JobResult for each one as it finishes, 'job' is the index of its script
+    """
+    image = program_image(program, from_file)
+    if len(image) // 2 > Memory.SIZE:
+        raise IndexError("Program does not fit in memory!")
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(image, engine_name)) as executor:
+        futures = [executor.submit(run_job, job, list(script)) for job, script in enumerate(scripts)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def read_script(file_name):
+    """ returns the lines of the script in 'file_name' """
+    with open(file_name) as f:
+        return f.read().splitlines()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Run a program once for each of many input scripts, in parallel")
+    parser.add_argument('program', help="binary to run")
+    parser.add_argument('scripts', nargs='+', metavar='SCRIPT', help="input script for one run")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                        help="which CPU implementation to run the program on")
+    parser.add_argument('--workers', type=int, help="number of worker processes, defaults to one per core")
+    parser.add_argument('--no-output', action='store_true', help="leave the program output out of the results")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """ writes one line of json per run to stdout as the runs finish """
+    args = parse_args(args)
+    scripts = [read_script(file_name) for file_name in args.scripts]
+
+    for result in run_batch(args.program, scripts, from_file=True, engine_name=args.engine,
+                            max_workers=args.workers):
+        line = result._asdict()
+        line['script'] = args.scripts[result.job]
+        if args.no_output:
+            del line['output']
+        print(json.dumps(line), flush=True)
+
+
+if __name__ == '__main__':
+    main()
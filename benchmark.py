@@ -0,0 +1,183 @@
+from central_processing_unit import InputExhausted, ProgramTerminated
+from collections import namedtuple
+from engines import ENGINES
+from profiler import ProfilingCentralProcessingUnit
+from terminal_io import NullOutput, ScriptedInput
+from test_helpers import TestPrograms
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# How far below the baseline instructions per second may fall before it counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# A fixed walk through the start of the game, so the challenge run is the same every time
+CHALLENGE_SCRIPT = [
+    'take tablet', 'use tablet', 'look', 'doorway', 'north', 'north', 'bridge', 'continue', 'down',
+    'east', 'take empty lantern', 'west', 'west', 'passage', 'ladder', 'west', 'south', 'north',
+]
+
+Benchmark = namedtuple('Benchmark', ['name', 'program', 'from_file', 'script'])
+
+BENCHMARKS = [
+    Benchmark('tight_loop', TestPrograms.count_down(10000, times=30), False, []),
+    Benchmark('memory', TestPrograms.copy_memory(10000, times=10), False, []),
+    Benchmark('recursion', TestPrograms.recurse(depth=1000, times=50), False, []),
+    Benchmark('challenge', 'challenge.bin', True, CHALLENGE_SCRIPT),
+]
+
+
+def run_once(engine, benchmark):
+    """
+    Runs 'benchmark' from start to finish on a new cpu of 'engine'
+    returns the cpu with the seconds taken to create it, load the program and run it
+    """
+    started = time.perf_counter()
+    cpu = engine(output=NullOutput(), input_source=ScriptedInput(benchmark.script))
+    created = time.perf_counter()
+
+    cpu.memory.load_program(benchmark.program, benchmark.from_file)
+    cpu.clear_caches()
+    # an engine that translates programs ahead of time does it as part of the load, only the first run translates
+    if hasattr(cpu, 'translate'):
+        cpu.translate()
+    loaded = time.perf_counter()
+
+    try:
+        cpu.execute()
+    except (ProgramTerminated, InputExhausted):
+        pass
+    finished = time.perf_counter()
+
+    return cpu, created - started, loaded - created, finished - loaded
+
+
+def count_instructions(benchmark):
+    """ the number of instructions 'benchmark' runs, which is the same on every engine """
+    cpu, startup, load, run = run_once(ProfilingCentralProcessingUnit, benchmark)
+    return cpu.profile.instructions
+
+
+def peak_memory(engine, benchmark):
+    """ the most memory allocated at once while 'benchmark' runs on 'engine' """
+    tracemalloc.start()
+    try:
+        run_once(engine, benchmark)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure(engine, benchmark, instructions, repeat=3):
+    """ returns the measurements for 'benchmark' on 'engine', taking the best of 'repeat' runs """
+    runs = [run_once(engine, benchmark)[1:] for _ in range(repeat)]
+    startup = min(run[0] for run in runs)
+    load = min(run[1] for run in runs)
+    run = min(run[2] for run in runs)
+
+    return {
+        'instructions': instructions,
+        'startup_seconds': startup,
+        'load_seconds': load,
+        'run_seconds': run,
+        'instructions_per_second': instructions / run if run else 0.0,
+        'peak_memory_bytes': peak_memory(engine, benchmark),
+    }
+
+
+def run_benchmarks(engine_names=None, benchmark_names=None, repeat=3):
+    """ returns {engine name: {benchmark name: measurements}} """
+    engine_names = engine_names or sorted(ENGINES)
+    benchmarks = [benchmark for benchmark in BENCHMARKS
+                  if not benchmark_names or benchmark.name in benchmark_names]
+
+    results = {engine_name: {} for engine_name in engine_names}
+    for benchmark in benchmarks:
+        instructions = count_instructions(benchmark)
+        for engine_name in engine_names:
+            results[engine_name][benchmark.name] = measure(ENGINES[engine_name], benchmark, instructions, repeat)
+    return results
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """ returns a message for every result that runs slower than the baseline allows """
+    regressions = []
+    for engine_name, benchmarks in results.items():
+        for benchmark_name, measurements in benchmarks.items():
+            expected = baseline.get(engine_name, {}).get(benchmark_name)
+            if expected is None:
+                continue
+
+            allowed = expected['instructions_per_second'] * (1 - tolerance)
+            if measurements['instructions_per_second'] < allowed:
+                regressions.append(
+                    f"{engine_name}/{benchmark_name}: {measurements['instructions_per_second']:,.0f} instructions/s, "
+                    f"baseline {expected['instructions_per_second']:,.0f}"
+                )
+    return regressions
+
+
+def format_results(results):
+    """ returns the results as a table, one line per engine and benchmark """
+    lines = [f"{'engine':<10} {'benchmark':<12} {'instructions':>12} {'instr/s':>12} "
+             f"{'startup ms':>10} {'load ms':>8} {'peak KiB':>9}"]
+    for engine_name, benchmarks in results.items():
+        for benchmark_name, measurements in benchmarks.items():
+            lines.append(
+                f"{engine_name:<10} {benchmark_name:<12} {measurements['instructions']:>12,} "
+                f"{measurements['instructions_per_second']:>12,.0f} {measurements['startup_seconds'] * 1000:>10.3f} "
+                f"{measurements['load_seconds'] * 1000:>8.3f} {measurements['peak_memory_bytes'] / 1024:>9,.0f}"
+            )
+    return '\n'.join(lines)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Synacor virtual machine engines")
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                        help="engine to benchmark, may be given more than once, defaults to all of them")
+    parser.add_argument('--benchmark', action='append', choices=[benchmark.name for benchmark in BENCHMARKS],
+                        help="benchmark to run, may be given more than once, defaults to all of them")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the best one is kept")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="fraction below the baseline instructions/s that still passes")
+    parser.add_argument('--json', metavar='FILE', help="also write the results to FILE as json")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """ runs the benchmarks, returns 1 if any of them regressed against the baseline """
+    args = parse_args(args)
+    results = run_benchmarks(args.engine, args.benchmark, args.repeat)
+    print(format_results(results))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, nothing to compare against")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,47 +1,72 @@
 class ValueXBit(object):
-    """ Generic class used to define a value stored in X bits """
-
-    def __init__(self, num_bits, value):
-        self.min = 0
-        self.max = 2 ** num_bits - 1
-
-        try:
-            self.value = int.from_bytes(value, 'little')
-        except TypeError:
-            self.value = value
+    """
+    Generic class used to define a value stored in X bits
+    every value a subclass can hold is made together the first time one is built, after that building one is
+    a range check and a lookup. The instances are shared, so they cannot be changed once made
+    """
+    __slots__ = ('_value',)
+
+    NUM_BITS = 0
+    MIN = 0
+    MAX = -1
+
+    # every value of the class, indexed by its int value, None until the first one is built
+    _interned = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.MAX = 2 ** cls.NUM_BITS - 1
+        cls._interned = None
+
+    @classmethod
+    def _intern(cls):
+        """ makes every value of the class, done on first use so importing the class costs nothing """
+        cls._interned = tuple(cls._make(value) for value in range(cls.MIN, cls.MAX + 1))
+        return cls._interned
+
+    @classmethod
+    def _make(cls, value):
+        instance = object.__new__(cls)
+        instance._value = value
+        return instance
+
+    def __new__(cls, value):
+        """ returns the value for the int 'value' or the little-endian bytes 'value' if it is in range """
+        if not isinstance(value, int):
+            value = int.from_bytes(value, 'little')
+
+        if value < cls.MIN:
+            raise ValueError(f"Value cannot be below {cls.MIN}")
+
+        if value > cls.MAX:
+            raise ValueError(f"Value cannot be above {cls.MAX}")
+
+        return (cls._interned or cls._intern())[value]
 
     @property
     def value(self):
         return self._value
 
-    @value.setter
-    def value(self, value):
-        if value < self.min:
-            raise ValueError(f"Value cannot be below {self.min}")
-
-        if value > self.max:
-            raise ValueError(f"Value cannot be above {self.max}")
-
-        self._value = value
+    def __reduce__(self):
+        return self.__class__, (self._value,)
 
     def __hash__(self):
-        return hash(self.value)
+        return hash(self._value)
 
     def __eq__(self, other):
-        return self.__class__ == other.__class__ and self.value == other.value
+        return self.__class__ == other.__class__ and self._value == other._value
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._value})"
 
 
 class Value15Bit(ValueXBit):
     """ Class used to define values stored in 15 bits """
-
-    def __init__(self, value):
-        super(Value15Bit, self).__init__(15, value)
+    __slots__ = ()
+    NUM_BITS = 15
 
 
 class Value16Bit(ValueXBit):
     """ Class used to define values stored in 16 bits """
-
-    def __init__(self, value):
-        super(Value16Bit, self).__init__(16, value)
-
-
+    __slots__ = ()
+    NUM_BITS = 16
@@ -0,0 +1,359 @@
+from central_processing_unit import NO_LIMIT, CentralProcessingUnit, EmptyStackError, NoCommandError, ProgramTerminated
+from instruction_cache import OPERAND_COUNTS, WRITES_REGISTER
+from memory_storage import EMPTY, PAGE_BITS, Registers
+
+# Opcodes that end a basic block, control does not simply fall through to the next instruction
+# wmem also ends a block so a write to code that follows it is seen before that code runs
+BLOCK_TERMINATORS = {6, 7, 8, 16, 17, 18}
+
+# Opcodes that are never compiled, they run through the reference implementation instead
+INTERPRETED_OPCODES = {0, 20}
+
+
+class BlockExit(Exception):
+    """ Raised from a block to stop the run, with the program pointer and completed_in_block already set """
+
+
+# Errors raised with the program pointer already set to where the program stopped
+VM_ERRORS = (ProgramTerminated, NoCommandError, EmptyStackError, EOFError, BlockExit)
+
+# completed_in_block while the block running has not reached an instruction that can fail
+NOTHING_RECORDED = -1
+
+
+def operand_source(word):
+    """ returns python source that reads the operand 'word' """
+    if Registers.MIN_ADDRESS <= word <= Registers.MAX_ADDRESS:
+        return f"regs[{word - Registers.MIN_ADDRESS}]"
+    return str(word)
+
+
+def is_register_target(word):
+    """ whether 'word' names a register to write to, a register address or, as Registers allows, a register number """
+    return 0 <= word < Registers.SIZE or Registers.MIN_ADDRESS <= word <= Registers.MAX_ADDRESS
+
+
+def target_source(word):
+    """ returns python source for the register that the operand 'word' writes to """
+    return f"regs[{word if word < Registers.SIZE else word - Registers.MIN_ADDRESS}]"
+
+
+def record_source(address, completed):
+    """
+    returns the lines of python source that point the cpu at the instruction at 'address' before it runs,
+    so the run stops exactly there if it raises
+    """
+    return [f"cpu.program_pointer = {address}", f"cpu.completed_in_block = {completed}"]
+
+
+def instruction_source(opcode, operands, address, next_address, completed):
+    """
+    returns the lines of python source that run one instruction
+    the last line is a return statement if the instruction ends the block
+    'completed' is the number of instructions in the block before this one
+    instructions that can raise, dividing by zero or writing out say, record where they are first
+    """
+    a, b, c = (list(operands) + [None, None, None])[:3]
+    read = operand_source
+
+    if opcode == 1:
+        return [f"{target_source(a)} = {read(b)}"]
+    if opcode == 2:
+        return [f"push({read(a)})"]
+    if opcode == 3:
+        return [
+            "if not stack:",
+            f"    cpu.program_pointer = {address}",
+            f"    cpu.completed_in_block = {completed}",
+            "    raise EmptyStackError('Cannot pop from an empty stack')",
+            f"{target_source(a)} = pop()",
+        ]
+    if opcode == 4:
+        return [f"{target_source(a)} = 1 if {read(b)} == {read(c)} else 0"]
+    if opcode == 5:
+        return [f"{target_source(a)} = 1 if {read(b)} > {read(c)} else 0"]
+    if opcode == 6:
+        return [f"return {read(a)}"]
+    if opcode == 7:
+        return [f"if {read(a)} != 0:", f"    return {read(b)}", f"return {next_address}"]
+    if opcode == 8:
+        return [f"if {read(a)} == 0:", f"    return {read(b)}", f"return {next_address}"]
+    if opcode == 9:
+        return [f"{target_source(a)} = ({read(b)} + {read(c)}) & 32767"]
+    if opcode == 10:
+        return [f"{target_source(a)} = ({read(b)} * {read(c)}) & 32767"]
+    if opcode == 11:
+        return record_source(address, completed) + [f"{target_source(a)} = {read(b)} % {read(c)}"]
+    if opcode == 12:
+        return [f"{target_source(a)} = {read(b)} & {read(c)}"]
+    if opcode == 13:
+        return [f"{target_source(a)} = {read(b)} | {read(c)}"]
+    if opcode == 14:
+        return [f"{target_source(a)} = ~{read(b)} & 32767"]
+    if opcode == 15:
+        # memory that has never been written reads as 0
+        return record_source(address, completed) + [
+            f"value = mem[{read(b)}]",
+            f"{target_source(a)} = value if value >= 0 else 0",
+        ]
+    if opcode == 16:
+        return [
+            f"address = {read(a)}",
+            *record_source(address, completed),
+            f"mem[address] = {read(b)}",
+            f"written[address >> {PAGE_BITS}] = cpu.memory.generation",
+            "if address in covered:",
+            "    invalidate(address)",
+            "forget(address)",
+            f"return {next_address}",
+        ]
+    if opcode == 17:
+        return [f"push({next_address})", f"return {read(a)}"]
+    if opcode == 18:
+        return [
+            "if not stack:",
+            f"    cpu.program_pointer = {next_address}",
+            f"    cpu.completed_in_block = {completed}",
+            "    raise ProgramTerminated()",
+            "return pop()",
+        ]
+    if opcode == 19:
+        return record_source(address, completed) + [f"write_output(chr({read(a)}))"]
+    if opcode == 21:
+        return []
+
+    raise ValueError(f"Opcode [{opcode}] cannot be compiled")
+
+
+class CompiledCentralProcessingUnit(CentralProcessingUnit):
+    """
+    Models the CPU by compiling each basic block of the program into a python function the first time it runs
+    compiled blocks are cached by their entry address and dropped when a wmem writes into them
+    """
+
+    # returns the lines of python source for one instruction, subclasses may add to it
+    instruction_source = staticmethod(instruction_source)
+
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None, image=None):
+        super(CompiledCentralProcessingUnit, self).__init__(capture_terminal_log, output, input_source, image)
+
+        # (compiled block function, number of instructions in it) keyed by entry address
+        self.blocks = {}
+        # the address just past the end of each compiled block, keyed by entry address
+        self.block_ends = {}
+        # every address inside a compiled block mapped to the entry addresses of the blocks covering it
+        self.covered = {}
+
+        # The stack as plain ints while blocks run and the deepest it has been, compiled blocks hold on to these lists
+        self._block_stack = []
+        self._block_peak = [0]
+
+        # Set by a block to the number of its instructions that completed before the one that raised,
+        # or before the one that can raise that it is running, NOTHING_RECORDED until it reaches one
+        self.completed_in_block = 0
+
+    def read_block(self, address):
+        """
+        Decodes the basic block starting at 'address'
+        returns a list of (address, opcode, operands) and the address just past the block
+        """
+        read_word = self.memory.read_word
+        instructions = []
+
+        while True:
+            opcode = read_word(address)
+            if opcode not in OPERAND_COUNTS or opcode in INTERPRETED_OPCODES:
+                break
+
+            operands = []
+            for offset in range(1, OPERAND_COUNTS[opcode] + 1):
+                word = read_word(address + offset) if address + offset < self.memory.SIZE else EMPTY
+                if word == EMPTY:
+                    break
+                operands.append(word)
+
+            if len(operands) < OPERAND_COUNTS[opcode]:
+                # runs into memory that holds no value, leave it to the interpreter
+                break
+
+            if opcode in WRITES_REGISTER and not is_register_target(operands[0]):
+                # writes to something that is not a register, leave it to the interpreter to raise the error
+                break
+
+            next_address = address + 1 + len(operands)
+            instructions.append((address, opcode, operands))
+            address = next_address
+
+            if opcode in BLOCK_TERMINATORS:
+                break
+
+        return instructions, address
+
+    def block_source(self, address):
+        """
+        returns the python source defining the function for the basic block starting at 'address',
+        the number of instructions in it and the address just past it
+        or None if the instruction at 'address' has to be interpreted
+        """
+        instructions, end = self.read_block(address)
+        if not instructions:
+            return None
+
+        # the stack is deepest in the block just after this instruction, None if the block never grows it
+        deepest = None
+        depth = rise = 0
+        for position, (instruction_address, opcode, operands) in enumerate(instructions):
+            if opcode in (2, 17):
+                depth += 1
+            elif opcode == 3:
+                depth -= 1
+            if depth > rise:
+                rise = depth
+                deepest = position
+
+        lines = []
+        for completed, (instruction_address, opcode, operands) in enumerate(instructions):
+            next_address = instruction_address + 1 + len(operands)
+            instruction_lines = self.instruction_source(opcode, operands, instruction_address, next_address,
+                                                        completed)
+            if completed == deepest:
+                # push and call both push first, call then returns
+                instruction_lines[1:1] = ["if len(stack) > peak[0]:", "    peak[0] = len(stack)"]
+            lines.extend(instruction_lines)
+
+        if instructions[-1][1] not in BLOCK_TERMINATORS:
+            lines.append(f"return {end}")
+
+        body = '\n'.join('    ' + line for line in lines)
+        source = (
+            f"def block_{address}(regs=regs, mem=mem, stack=stack, push=push, pop=pop, peak=peak, covered=covered,\n"
+            f"        written=written, invalidate=invalidate, forget=forget, write_output=write_output, cpu=cpu):\n"
+            f"{body}\n"
+        )
+        return source, len(instructions), end
+
+    def compile_block(self, address):
+        """
+        Compiles the basic block starting at 'address' and caches it
+        returns the block function and the number of instructions in it
+        or None if the instruction at 'address' has to be interpreted
+        """
+        compiled = self.block_source(address)
+        if compiled is None:
+            return None
+
+        source, size, end = compiled
+        namespace = self.block_namespace()
+        exec(compile(source, f"<block {address}>", 'exec'), namespace)
+        return self.install_block(address, namespace[f"block_{address}"], size, end)
+
+    def install_block(self, address, block, size, end):
+        """ caches 'block', running the 'size' instructions from 'address' up to 'end', returns its entry """
+        self.blocks[address] = (block, size)
+        self.block_ends[address] = end
+        for covered_address in range(address, end):
+            self.covered.setdefault(covered_address, []).append(address)
+
+        return self.blocks[address]
+
+    def block_namespace(self):
+        """ returns the names compiled blocks are run with """
+        stack = self._block_stack
+        return {
+            'regs': self.registers._memory,
+            'mem': self.memory._memory,
+            'stack': stack,
+            'push': stack.append,
+            'pop': stack.pop,
+            'peak': self._block_peak,
+            'covered': self.covered,
+            'written': self.memory.page_writes,
+            'invalidate': self.invalidate,
+            'forget': self.instruction_cache.invalidate,
+            'write_output': self.output.write,
+            'cpu': self,
+            'EmptyStackError': EmptyStackError,
+            'ProgramTerminated': ProgramTerminated,
+        }
+
+    def invalidate(self, address):
+        """ Drops every compiled block that covers 'address' """
+        for start in self.covered.pop(address, ()):
+            if self.blocks.pop(start, None) is None:
+                continue
+
+            for covered_address in range(start, self.block_ends.pop(start)):
+                starts = self.covered.get(covered_address)
+                if starts and start in starts:
+                    starts.remove(start)
+                    if not starts:
+                        del self.covered[covered_address]
+
+    def write_memory(self, address, value):
+        """ writes 'value' to memory 'address' and drops any compiled block or decoded instruction that covered it """
+        super(CompiledCentralProcessingUnit, self).write_memory(address, value)
+        self.invalidate(address)
+
+    def clear_caches(self):
+        """ Drops every compiled block as well as the decoded instructions """
+        super(CompiledCentralProcessingUnit, self).clear_caches()
+        self.blocks.clear()
+        self.block_ends.clear()
+        self.covered.clear()
+
+    def run_instructions(self, limit=None):
+        """
+        runs from the current program pointer until the program stops or the count reaches 'limit'
+        the limit is checked between blocks, so the count can go past it by the rest of a block
+        """
+        blocks = self.blocks
+        compile_block = self.compile_block
+        get_instruction = self.instruction_cache.get
+
+        self._block_stack[:] = self.stack.values()
+        self._block_peak[0] = self.stack.peak_depth
+        pc = self.program_pointer
+        count = self.instruction_count
+        limit = NO_LIMIT if limit is None else limit
+        try:
+            while count < limit:
+                self.completed_in_block = NOTHING_RECORDED
+                entry = blocks.get(pc)
+                if entry is None:
+                    entry = compile_block(pc)
+
+                if entry is not None:
+                    block, size = entry
+                    pc = block()
+                    count += size
+                    continue
+
+                # Not compilable, run this one instruction through the reference implementation
+                instruction = get_instruction(pc)
+                if instruction is None:
+                    # Ran into memory that holds no value, the program has ended
+                    break
+
+                self.program_pointer = pc
+                self.execute_command(instruction)
+                pc = self.program_pointer
+                count += 1
+        except VM_ERRORS:
+            # the block or the interpreter has already pointed the cpu at the right instruction
+            count += max(self.completed_in_block, 0)
+            raise
+        except BaseException:
+            if self.completed_in_block == NOTHING_RECORDED:
+                # nothing that can fail has run since 'pc', an interrupt between instructions say
+                self.program_pointer = pc
+            else:
+                # the block pointed the cpu at the instruction that raised before running it
+                count += self.completed_in_block
+            raise
+        else:
+            self.program_pointer = pc
+        finally:
+            self.completed_in_block = 0
+            self.instruction_count = count
+            self.stack.peak_depth = self._block_peak[0]
+            self.stack.replace(self._block_stack)
@@ -1,4 +1,23 @@
-from memory_storage import Memory, Registers, Stack
+from collections import namedtuple
+from instruction_cache import InstructionCache
+from memory_storage import EMPTY, EmptyStackError, Memory, Registers, Stack
+from terminal_io import CaptureOutput, TeeOutput, TerminalInput, TerminalOutput
+import snapshot
+import sys
+
+# The instruction count a run stops at when it is not given a limit
+NO_LIMIT = sys.maxsize
+
+# Why a call to run returned
+BUDGET_EXHAUSTED = 'budget_exhausted'
+WAITING_FOR_INPUT = 'waiting_for_input'
+HALTED = 'halted'
+ENDED = 'ended'
+UNTIL = 'until'
+ERROR = 'error'
+
+# 'instructions' is how many ran in the call and 'error' the exception that stopped it, for ERROR only
+RunResult = namedtuple('RunResult', ['status', 'instructions', 'error'])
 
 
 class ProgramTerminated(Exception):
@@ -9,95 +28,278 @@ class NoCommandError(Exception):
     pass
 
 
+class InputExhausted(EOFError):
+    """ raised by 'in' when there is no more input, the program is left pointing at the 'in' """
+    pass
+
+
 class CentralProcessingUnit(object):
     """ Models the CPU """
 
     MAX_VALUE = 32768
 
-    def __init__(self, capture_terminal_log=False):
-        # Initialize all the memory
-        self.memory = Memory()
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None, image=None):
+        # Initialize all the memory, as a view of the SharedImage 'image' if there is one
+        self.memory = Memory(image)
         self.registers = Registers()
         self.stack = Stack()
 
+        # Registers start out holding 0
+        for register_num in range(Registers.SIZE):
+            self.registers.write_word(register_num, 0)
+
         self.program_pointer = 0
 
+        # Set once the program runs a halt, run does nothing more after that
+        self.halted = False
+
+        # Instructions run to completion, an instruction that raises is not counted
+        self.instruction_count = 0
+
+        # Where 'in' reads lines from, the terminal unless told otherwise
+        self.input_source = input_source if input_source is not None else TerminalInput()
+
+        # Characters of the current input line that have not been read by 'in' yet
+        self.pending_input = ''
+
+        # The state_hash of the last snapshot saved or loaded and the memory mark taken with it, see save_delta
+        self.last_snapshot = None
+
+        # Decoded instructions keyed by address, see write_memory for invalidation
+        self.instruction_cache = InstructionCache(self.memory, self.opcodes)
+
+        # Where 'out' writes to, a buffered terminal unless told otherwise
+        self.output = output if output is not None else TerminalOutput()
+
         # Just for debugging
         self.capture_terminal_log = capture_terminal_log
-        self.terminal_log = ''
+        self.terminal_capture = CaptureOutput()
+        if capture_terminal_log:
+            self.output = TeeOutput(self.terminal_capture, self.output)
+
+    @classmethod
+    def from_image(cls, image, *args, **kwargs):
+        """ returns a new cpu made with 'args' and 'kwargs', its memory a copy-on-write view of SharedImage 'image' """
+        cpu = cls(*args, image=image, **kwargs)
+        cpu.clear_caches()
+        return cpu
+
+    @property
+    def terminal_log(self):
+        """ everything written by 'out' so far, if it is being captured """
+        return self.terminal_capture.getvalue()
 
     def get_value(self, a):
         """
-        'a' represents a register address or a literal value
-        attempt to use 'a' as a register address and if that fails return the
-        literal value
+        'a' is a decoded operand representing a register or a literal value
+        return the value held in the register or the literal value
         """
-        try:
-            return self.registers.read_from(a).value
-        except (AttributeError, IndexError):
-            return a
+        if a.register is None:
+            return a.literal
+
+        return self.registers.read_word(a.register)
+
+    def write_memory(self, address, value):
+        """ writes 'value' to memory 'address' and drops any decoded instruction that covered it """
+        self.memory.write_word(address, value)
+        self.instruction_cache.invalidate(address)
+
+    def write_output(self, ascii_char):
+        """ writes 'ascii_char' to the output, and to the terminal log if it is being captured """
+        self.output.write(ascii_char)
+
+    def read_input(self):
+        """
+        returns the ascii code of the next input character
+        a whole line is read from the input whenever the previous one has been used up
+        raises InputExhausted if there is no more input
+        """
+        if not self.pending_input:
+            self.output.flush()
+            self.pending_input = self.input_source.readline()
+            if not self.pending_input:
+                raise InputExhausted("No more input")
+
+        ascii_char = self.pending_input[0]
+        self.pending_input = self.pending_input[1:]
+        return ord(ascii_char)
 
     def halt(self):
         """ stop execution and terminate the program """
         raise ProgramTerminated()
 
-    def out(self):
+    def out(self, a):
         """
         out: 19 a
         write the character represented by ascii code <a> to the terminal
         if there is no value at that address, do nothing
         """
-        a = next(self.current_program)
         value = self.get_value(a)
         ascii_char = str(chr(value))
+        self.write_output(ascii_char)
 
-        if self.capture_terminal_log:
-            self.terminal_log += ascii_char
+    def set(self, a, b):
+        """
+        set: 1 a b
+        set register <a> to the value of <b>
+        """
+        self.registers.write_word(a.literal, self.get_value(b))
+
+    def push(self, a):
+        """
+        push: 2 a
+        push <a> onto the stack
+        """
+        self.stack.push(self.get_value(a))
+
+    def pop(self, a):
+        """
+        pop: 3 a
+        remove the top element from the stack and write it into <a>; empty stack = error
+        """
+        self.registers.write_word(a.literal, self.stack.pop())
+
+    def eq(self, a, b, c):
+        """
+        eq: 4 a b c
+        set <a> to 1 if <b> is equal to <c>; set it to 0 otherwise
+        """
+        result = 1 if self.get_value(b) == self.get_value(c) else 0
+        self.registers.write_word(a.literal, result)
+
+    def gt(self, a, b, c):
+        """
+        gt: 5 a b c
+        set <a> to 1 if <b> is greater than <c>; set it to 0 otherwise
+        """
+        result = 1 if self.get_value(b) > self.get_value(c) else 0
+        self.registers.write_word(a.literal, result)
+
+    def mult(self, a, b, c):
+        """
+        mult: 10 a b c
+        store into <a> the product of <b> and <c> (modulo MAX_VALUE)
+        """
+        result = (self.get_value(b) * self.get_value(c)) % self.MAX_VALUE
+        self.registers.write_word(a.literal, result)
+
+    def mod(self, a, b, c):
+        """
+        mod: 11 a b c
+        store into <a> the remainder of <b> divided by <c>
+        """
+        result = self.get_value(b) % self.get_value(c)
+        self.registers.write_word(a.literal, result)
+
+    def and_(self, a, b, c):
+        """
+        and: 12 a b c
+        stores into <a> the bitwise and of <b> and <c>
+        """
+        result = self.get_value(b) & self.get_value(c)
+        self.registers.write_word(a.literal, result)
 
-        print(ascii_char, end="")
+    def or_(self, a, b, c):
+        """
+        or: 13 a b c
+        stores into <a> the bitwise or of <b> and <c>
+        """
+        result = self.get_value(b) | self.get_value(c)
+        self.registers.write_word(a.literal, result)
+
+    def not_(self, a, b):
+        """
+        not: 14 a b
+        stores 15-bit bitwise inverse of <b> in <a>
+        """
+        result = ~self.get_value(b) & (self.MAX_VALUE - 1)
+        self.registers.write_word(a.literal, result)
+
+    def rmem(self, a, b):
+        """
+        rmem: 15 a b
+        read memory at address <b> and write it to <a>
+        memory that has never been written reads as 0
+        """
+        value = self.memory.read_word(self.get_value(b))
+        if value == EMPTY:
+            value = 0
+
+        self.registers.write_word(a.literal, value)
+
+    def wmem(self, a, b):
+        """
+        wmem: 16 a b
+        write the value from <b> into memory at address <a>
+        """
+        self.write_memory(self.get_value(a), self.get_value(b))
+
+    def call(self, a):
+        """
+        call: 17 a
+        write the address of the next instruction to the stack and jump to <a>
+        """
+        self.stack.push(self.program_pointer)
+        self.program_pointer = self.get_value(a)
+
+    def ret(self):
+        """
+        ret: 18
+        remove the top element from the stack and jump to it; empty stack = halt
+        """
+        if not self.stack:
+            self.halt()
+
+        self.program_pointer = self.stack.pop()
+
+    def in_(self, a):
+        """
+        in: 20 a
+        read a character from the terminal and write its ascii code to <a>
+        """
+        self.registers.write_word(a.literal, self.read_input())
 
     def noop(self):
         """ no operation """
         pass
 
-    def add(self):
+    def add(self, a, b, c):
         """
         add: 9 a b c
         assign into <a> the sum of <b> and <c> (modulo MAX_VALUE)
         """
-        reg_a = next(self.current_program)
-        b = self.get_value(next(self.current_program))
-        c = self.get_value(next(self.current_program))
+        b = self.get_value(b)
+        c = self.get_value(c)
 
         result = (b + c) % self.MAX_VALUE
-        self.registers.write_to(address_or_register=reg_a, value=result)
+        self.registers.write_word(a.literal, result)
 
-    def jmp(self):
+    def jmp(self, a):
         """
         jmp: 6 a
         jump to <a>
         """
-        a = self.get_value(next(self.current_program))
+        a = self.get_value(a)
         self.program_pointer = a
 
-    def jt(self):
+    def jt(self, a, b):
         """
         jt: 7 a b
         if <a> is nonzero, jump to <b>
         """
-        a = self.get_value(next(self.current_program))
-        b = self.get_value(next(self.current_program))
+        a = self.get_value(a)
+        b = self.get_value(b)
 
         if not a == 0:
             self.program_pointer = b
 
-    def jf(self):
+    def jf(self, a, b):
         """
         jf: 8 a b
         if <a> is zero, jump to <b>
         """
-        a = self.get_value(next(self.current_program))
-        b = self.get_value(next(self.current_program))
+        a = self.get_value(a)
+        b = self.get_value(b)
 
         if a == 0:
             self.program_pointer = b
@@ -106,44 +308,168 @@ class CentralProcessingUnit(object):
     # maps the opcode # to the associated function
     opcodes = {
         0: halt,
+        1: set,
+        2: push,
+        3: pop,
+        4: eq,
+        5: gt,
         6: jmp,
         7: jt,
         8: jf,
         9: add,
+        10: mult,
+        11: mod,
+        12: and_,
+        13: or_,
+        14: not_,
+        15: rmem,
+        16: wmem,
+        17: call,
+        18: ret,
         19: out,
+        20: in_,
         21: noop,
     }
 
-    def execute_command(self, opcode):
+    def execute_command(self, instruction):
+        """
+        excecute the decoded 'instruction'
+        if there is no command for its opcode raises a NoCommandError
+        """
+        if instruction.handler is None:
+            raise NoCommandError(f"No command for opcode [{instruction.opcode}]")
+
+        self.program_pointer = instruction.next_address
+        try:
+            instruction.handler(self, *instruction.operands)
+        except ProgramTerminated:
+            raise
+        except BaseException:
+            # Point back at the instruction so it can run again, once there is more input say
+            self.program_pointer = instruction.address
+            raise
+
+    def clear_caches(self):
+        """ Drops everything derived from the contents of memory, call it whenever memory is replaced wholesale """
+        self.instruction_cache.clear()
+
+    def execute(self, max_instructions=None):
+        """
+        runs from the current program pointer until the program stops, flushing the output however it stops
+        with 'max_instructions' it also returns once that many more instructions have run,
+        engines that run whole blocks at a time may run a few more to finish the block
+        """
+        limit = None if max_instructions is None else self.instruction_count + max_instructions
+        try:
+            self.run_instructions(limit)
+        finally:
+            self.output.flush()
+
+    def run_instructions(self, limit=None):
         """
-        excecute the command defined by 'opcode'
-        if there is no command for that opcode raises a NoCommandError
+        the loop that runs instructions until the program stops or 'instruction_count' reaches 'limit'
+        an engine that can stop a run for a reason of its own returns the status for run to stop with, otherwise None
         """
+        get_instruction = self.instruction_cache.get
+        limit = NO_LIMIT if limit is None else limit
+        while self.instruction_count < limit:
+            instruction = get_instruction(self.program_pointer)
+            if instruction is None:
+                break
+            self.execute_command(instruction)
+            self.instruction_count += 1
+
+    def run(self, max_instructions=None, until=None, check_every=1):
+        """
+        runs from wherever the last run stopped and returns a RunResult saying why it stopped this time:
+        BUDGET_EXHAUSTED once 'max_instructions' have run, WAITING_FOR_INPUT when 'in' has no input left,
+        HALTED after a halt, ENDED on memory that holds no instruction, ERROR when an instruction raised,
+        or UNTIL once 'until', called with the cpu every 'check_every' instructions, returns true
+        nothing is lost between calls, so after feeding more input, say, run carries on exactly where it stopped
+        engines that run whole blocks at a time may run a few more instructions to finish the block
+        """
+        started = self.instruction_count
+        if self.halted:
+            return RunResult(HALTED, 0, None)
+
+        limit = NO_LIMIT if max_instructions is None else started + max_instructions
+        status = error = None
         try:
-            self.opcodes[opcode](self)
-        except KeyError:
-            raise NoCommandError(f"No command for opcode [{opcode}]")
-
-    def get_current_program_value(self):
-        """ Returns the value currently pointed to in the program then increases the pointer """
-        while True:
-            value = self.memory.read_from(self.program_pointer)
-            if value:
-                self.program_pointer += 1
-                yield value.value
-            else:
+            while True:
+                step_limit = limit if until is None else min(limit, self.instruction_count + check_every)
+                status = self.run_instructions(step_limit)
+                if status is not None:
+                    break
+                if until is not None and until(self):
+                    status = UNTIL
+                elif self.instruction_count < step_limit:
+                    status = ENDED
+                elif self.instruction_count >= limit:
+                    status = BUDGET_EXHAUSTED
+                else:
+                    continue
                 break
+        except InputExhausted:
+            status = WAITING_FOR_INPUT
+        except ProgramTerminated:
+            status = HALTED
+            self.halted = True
+        except Exception as e:
+            status = ERROR
+            error = e
+        finally:
+            self.output.flush()
+
+        return RunResult(status, self.instruction_count - started, error)
+
+    def save_state(self, file_name=None):
+        """
+        Returns the whole state of the machine as a snapshot
+        if 'file_name' is given the snapshot is written to that file as well
+        """
+        data = snapshot.dump_state(self)
+        self.snapshot_taken()
+        if file_name is not None:
+            with open(file_name, 'wb') as f:
+                f.write(data)
+        return data
+
+    def save_delta(self, file_name=None):
+        """
+        Returns a delta snapshot holding only the memory pages written since the last snapshot was saved or loaded
+        it loads into a cpu in the state of that snapshot, see snapshot.load_delta
+        """
+        if self.last_snapshot is None:
+            raise ValueError("A delta snapshot needs a snapshot to be taken against")
+
+        parent, marker = self.last_snapshot
+        data = snapshot.dump_delta(self, parent, self.memory.pages_written_since(marker))
+        self.snapshot_taken()
+        if file_name is not None:
+            with open(file_name, 'wb') as f:
+                f.write(data)
+        return data
+
+    def snapshot_taken(self):
+        """ remembers the state as it is now as the one the next delta snapshot is taken against """
+        self.last_snapshot = (snapshot.state_hash(self), self.memory.mark())
+
+    def load_state(self, data=None, file_name=None):
+        """ Restores the whole state of the machine from a snapshot or delta snapshot, or from one in 'file_name' """
+        if file_name is not None:
+            with open(file_name, 'rb') as f:
+                data = f.read()
+
+        snapshot.load_state(self, data)
+        self.snapshot_taken()
+        self.halted = False
+        self.clear_caches()
 
     def run_program(self, program, from_file=False):
         """ runs the program which is models as an iterable of numbers """
 
         self.program_pointer = 0
+        self.halted = False
         self.memory.load_program(program, from_file)
-        self.current_program = self.get_current_program_value()
-
-        while True:
-            try:
-                opcode = next(self.current_program)
-                self.execute_command(opcode)
-            except StopIteration:
-                break
+        self.clear_caches()
+        self.execute()
@@ -0,0 +1,9 @@
+import pytest
+import translator
+
+
+@pytest.fixture(autouse=True)
+def translation_cache(tmp_path, monkeypatch):
+    """ keeps the modules the translated engine writes out of the repository, in a cache for each test """
+    monkeypatch.setattr(translator, '_loaded', {})
+    monkeypatch.setattr(translator.TranslatedCentralProcessingUnit, 'cache_dir', str(tmp_path / '__translated__'))
@@ -0,0 +1,232 @@
+from block_compiler import BlockExit, CompiledCentralProcessingUnit, instruction_source
+from collections import namedtuple
+from instruction_cache import WRITES_REGISTER
+from memory_storage import Registers
+
+BREAKPOINT = 'breakpoint'
+MEMORY = 'memory'
+REGISTER = 'register'
+
+# The status run returns when a hit paused the run
+PAUSED = 'paused'
+
+# 'kind' is BREAKPOINT, MEMORY or REGISTER and 'target' the address or register number it is set on
+# 'condition' is called with the cpu and the watch only stops the run when it returns true
+# 'callback' is called with the cpu and the Hit, with no callback the run pauses instead
+Watch = namedtuple('Watch', ['kind', 'target', 'condition', 'callback'])
+
+# 'old' and 'new' are the value written over and the value written, both None for a breakpoint
+Hit = namedtuple('Hit', ['watch', 'old', 'new'])
+
+
+class DebugStop(BlockExit):
+    """ Raised to stop the run when a breakpoint or watchpoint is hit """
+
+
+class DebuggingCentralProcessingUnit(CompiledCentralProcessingUnit):
+    """
+    Models the CPU with compiled blocks, stopping on breakpoints and on writes to watched memory and registers
+    blocks are split so a breakpoint always starts one, and its entry in the block table is swapped for one that
+    checks the breakpoint first. Only blocks that write a watched register, and wmem while memory is watched,
+    are compiled with a check, so code that is not being watched runs exactly as on the compiled engine
+
+    conditions are checked as the run goes, when the cpu's stack is not up to date
+    callbacks are called with the run stopped and the whole of the cpu up to date, they may change any of it
+    the run carries on once they return, unless a hit has no callback or a callback calls pause,
+    then execute returns with 'hits' holding what stopped it and calling execute again carries on from there,
+    run returns PAUSED
+    """
+
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None, image=None):
+        super(DebuggingCentralProcessingUnit, self).__init__(capture_terminal_log, output, input_source, image)
+
+        # watches keyed by the address or register number they are set on
+        self.breakpoints = {}
+        self.memory_watches = {}
+        self.register_watches = {}
+
+        # the hits that paused the run, empty if it stopped for any other reason
+        self.hits = []
+
+        # hits found by the running blocks, waiting to be handled once the run has stopped
+        self._pending = []
+        # a breakpoint that was just handled, so the run carries on from it instead of stopping there again
+        self._resume_from = None
+        self._paused = False
+
+    def add_breakpoint(self, address, condition=None, callback=None):
+        """ stops the run before the instruction at 'address' runs """
+        watch = Watch(BREAKPOINT, address, condition, callback)
+        self.breakpoints.setdefault(address, []).append(watch)
+        # the block covering 'address' is split there when it is next compiled
+        self.invalidate(address)
+        return watch
+
+    def watch_memory(self, address, condition=None, callback=None):
+        """ stops the run after each wmem to 'address' """
+        if address < 0 or address >= self.memory.SIZE:
+            raise IndexError(f"Memory address must be between 0 and {self.memory.SIZE - 1}")
+
+        watch = Watch(MEMORY, address, condition, callback)
+        self.memory_watches.setdefault(address, []).append(watch)
+        self.clear_caches()
+        return watch
+
+    def watch_register(self, register, condition=None, callback=None):
+        """ stops the run after each instruction that writes register number 'register' """
+        if register < 0 or register >= Registers.SIZE:
+            raise IndexError(f"Register number must be between 0 and {Registers.SIZE - 1}")
+
+        watch = Watch(REGISTER, register, condition, callback)
+        self.register_watches.setdefault(register, []).append(watch)
+        self.clear_caches()
+        return watch
+
+    def remove(self, watch):
+        """ removes a breakpoint or watchpoint """
+        watches = {BREAKPOINT: self.breakpoints, MEMORY: self.memory_watches, REGISTER: self.register_watches}
+        by_target = watches[watch.kind]
+        by_target[watch.target].remove(watch)
+        if not by_target[watch.target]:
+            del by_target[watch.target]
+
+        if watch.kind == BREAKPOINT:
+            self.invalidate(watch.target)
+        else:
+            self.clear_caches()
+
+    def pause(self):
+        """ called from a callback, stops the run once the callbacks for this hit have returned """
+        self._paused = True
+
+    def check(self, watches, old=None, new=None):
+        """ queues a Hit for each of 'watches' whose condition holds, returns whether there were any """
+        hits = [Hit(watch, old, new) for watch in watches if watch.condition is None or watch.condition(self)]
+        self._pending.extend(hits)
+        return bool(hits)
+
+    def check_register(self, register, old, new):
+        return self.check(self.register_watches[register], old, new)
+
+    def check_memory(self, address, old, new):
+        watches = self.memory_watches.get(address)
+        return watches is not None and self.check(watches, old, new)
+
+    def instruction_source(self, opcode, operands, address, next_address, completed):
+        """ the compiled source for an instruction, followed by a check if it writes anything watched """
+        lines = instruction_source(opcode, operands, address, next_address, completed)
+        stop = [
+            f"    cpu.program_pointer = {next_address}",
+            f"    cpu.completed_in_block = {completed + 1}",
+            "    raise DebugStop()",
+        ]
+
+        if opcode == 16 and self.memory_watches:
+            # the first lines work out the address and record where the cpu is, the last one returns
+            return (lines[:3] + ["old = mem[address]"] + lines[3:-1] +
+                    ["if check_memory(address, old, mem[address]):"] + stop + lines[-1:])
+
+        if opcode in WRITES_REGISTER:
+            register = operands[0] - Registers.MIN_ADDRESS
+            if register in self.register_watches:
+                return ([f"old = regs[{register}]"] + lines +
+                        [f"if check_register({register}, old, regs[{register}]):"] + stop)
+
+        return lines
+
+    def block_namespace(self):
+        namespace = super(DebuggingCentralProcessingUnit, self).block_namespace()
+        namespace['check_memory'] = self.check_memory
+        namespace['check_register'] = self.check_register
+        namespace['DebugStop'] = DebugStop
+        return namespace
+
+    def read_block(self, address):
+        """ as the compiled engine, but ends the block before any breakpoint so each one starts a block """
+        instructions, end = super(DebuggingCentralProcessingUnit, self).read_block(address)
+        for position, (instruction_address, opcode, operands) in enumerate(instructions):
+            if position and instruction_address in self.breakpoints:
+                return instructions[:position], instruction_address
+        return instructions, end
+
+    def compile_block(self, address):
+        """ as the compiled engine, but a block starting on a breakpoint checks it before running """
+        entry = super(DebuggingCentralProcessingUnit, self).compile_block(address)
+        watches = self.breakpoints.get(address)
+        if entry is None or watches is None:
+            return entry
+
+        block, size = entry
+
+        def breakpoint_block():
+            if self._resume_from == address:
+                self._resume_from = None
+            elif self.check(watches):
+                self.program_pointer = address
+                self.completed_in_block = 0
+                raise DebugStop()
+            return block()
+
+        self.blocks[address] = (breakpoint_block, size)
+        return self.blocks[address]
+
+    def execute_command(self, instruction):
+        """ as the reference implementation, checking breakpoints and watches on instructions that are not compiled """
+        address = instruction.address
+        watches = self.breakpoints.get(address)
+        if watches is not None:
+            if self._resume_from == address:
+                self._resume_from = None
+            elif self.check(watches):
+                self.program_pointer = address
+                self.completed_in_block = 0
+                raise DebugStop()
+
+        opcode = instruction.opcode
+        operands = instruction.operands
+        if opcode in WRITES_REGISTER and operands and operands[0].register in self.register_watches:
+            register = operands[0].register
+            old = self.registers._memory[register]
+            super(DebuggingCentralProcessingUnit, self).execute_command(instruction)
+            if self.check_register(register, old, self.registers._memory[register]):
+                self.completed_in_block = 1
+                raise DebugStop()
+        elif opcode == 16 and self.memory_watches:
+            target = self.get_value(operands[0])
+            old = self.memory._memory[target] if 0 <= target < self.memory.SIZE else None
+            super(DebuggingCentralProcessingUnit, self).execute_command(instruction)
+            if self.check_memory(target, old, self.memory._memory[target]):
+                self.completed_in_block = 1
+                raise DebugStop()
+        else:
+            super(DebuggingCentralProcessingUnit, self).execute_command(instruction)
+
+    def run_instructions(self, limit=None):
+        """
+        runs from the current program pointer until the program stops or the count reaches 'limit',
+        or returns PAUSED once a hit pauses the run
+        """
+        if self._resume_from != self.program_pointer:
+            self._resume_from = None
+        self.hits = []
+
+        while True:
+            try:
+                super(DebuggingCentralProcessingUnit, self).run_instructions(limit)
+                return
+            except DebugStop:
+                hits, self._pending = self._pending, []
+
+            self._paused = False
+            for hit in hits:
+                if hit.watch.callback is None:
+                    self._paused = True
+                else:
+                    hit.watch.callback(self, hit)
+
+            if hits[0].watch.kind == BREAKPOINT and self.program_pointer == hits[0].watch.target:
+                self._resume_from = self.program_pointer
+
+            if self._paused:
+                self.hits = hits
+                return PAUSED
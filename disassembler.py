@@ -0,0 +1,190 @@
+"""
+Static disassembly of a Memory image, without running any of it
+
+memory is swept once from the start, decoding an instruction at each address that holds a known opcode
+and treating every other word as data, so nothing here depends on which addresses the program really reaches
+"""
+from collections import namedtuple
+from instruction_cache import OPCODE_NAMES, OPERAND_COUNTS, decode_operand
+from memory_storage import EMPTY, Memory
+import argparse
+import sys
+
+# opcodes whose last operand is where they may go next, jmp, jt, jf and call
+JUMP_OPCODES = {6: 0, 7: 1, 8: 1, 17: 0}
+
+# opcodes that never go on to the next instruction, halt, jmp and ret
+END_OPCODES = {0, 6, 18}
+
+# 'opcode' is None for a word that is not an instruction, which is then the only operand
+# 'operands' are instruction_cache.Operand, 'target' is the literal address a jump or call goes to, or None
+Disassembled = namedtuple('Disassembled', ['address', 'opcode', 'operands', 'target', 'next_address'])
+
+# a run of 'out' instructions with literal operands, printing 'text'
+OutRun = namedtuple('OutRun', ['address', 'text', 'next_address'])
+
+
+def decode(memory, address):
+    """
+    Decodes the instruction at 'address' of 'memory'
+    returns None if the address holds no value, or a data word if there is no valid instruction there
+    """
+    opcode = memory.read_word(address)
+    if opcode == EMPTY:
+        return None
+
+    operand_count = OPERAND_COUNTS.get(opcode)
+    if operand_count is None or address + operand_count >= memory.SIZE:
+        return Disassembled(address, None, (decode_operand(opcode),), None, address + 1)
+
+    operands = []
+    for offset in range(1, operand_count + 1):
+        word = memory.read_word(address + offset)
+        if word == EMPTY:
+            return Disassembled(address, None, (decode_operand(opcode),), None, address + 1)
+        operands.append(decode_operand(word))
+
+    target = None
+    if opcode in JUMP_OPCODES:
+        operand = operands[JUMP_OPCODES[opcode]]
+        if operand.register is None:
+            target = operand.literal
+
+    return Disassembled(address, opcode, tuple(operands), target, address + 1 + operand_count)
+
+
+def sweep(memory, start=0, end=None):
+    """ yields every decoded instruction and data word from 'start' up to 'end', skipping addresses with no value """
+    end = memory.SIZE if end is None else end
+    address = start
+    while address < end:
+        instruction = decode(memory, address)
+        if instruction is None:
+            address += 1
+            continue
+        yield instruction
+        address = instruction.next_address
+
+
+def is_literal_out(instruction):
+    return instruction.opcode == 19 and instruction.operands[0].register is None
+
+
+def group_out_runs(instructions):
+    """ yields 'instructions' with each run of back to back literal outs replaced by one OutRun """
+    run = []
+    for instruction in instructions:
+        if is_literal_out(instruction) and (not run or run[-1].next_address == instruction.address):
+            run.append(instruction)
+            continue
+
+        if run:
+            yield out_run(run)
+            run = []
+
+        if is_literal_out(instruction):
+            run.append(instruction)
+        else:
+            yield instruction
+
+    if run:
+        yield out_run(run)
+
+
+def out_run(instructions):
+    text = ''.join(chr(instruction.operands[0].literal) for instruction in instructions)
+    return OutRun(instructions[0].address, text, instructions[-1].next_address)
+
+
+def format_operand(operand):
+    if operand.register is not None:
+        return f"r{operand.register}"
+    return str(operand.literal)
+
+
+def format_line(entry):
+    """ returns one line of the listing for an instruction, data word or OutRun """
+    if isinstance(entry, OutRun):
+        return f"{entry.address:5}: out {entry.text!r}"
+
+    if entry.opcode is None:
+        return f"{entry.address:5}: data {entry.operands[0].literal}"
+
+    parts = [OPCODE_NAMES[entry.opcode]] + [format_operand(operand) for operand in entry.operands]
+    if entry.opcode == 19 and entry.operands[0].register is None:
+        parts[1] = repr(chr(entry.operands[0].literal))
+    return f"{entry.address:5}: {' '.join(parts)}"
+
+
+def listing(memory, start=0, end=None):
+    """ yields the listing line by line, so an image can be written out without holding all of it """
+    for entry in group_out_runs(sweep(memory, start, end)):
+        yield format_line(entry)
+
+
+class InstructionIndex(object):
+    """
+    Everything sweep finds in a Memory, keyed by address
+    'referrers' maps each jump or call target to the addresses that go there
+    'routines' are the targets of calls, 'strings' are the OutRuns, the literal outs in them are instructions too
+    """
+
+    def __init__(self, memory):
+        self.instructions = {}
+        self.referrers = {}
+        self.routines = set()
+
+        decoded = list(sweep(memory))
+        self.strings = [entry for entry in group_out_runs(decoded) if isinstance(entry, OutRun)]
+
+        for entry in decoded:
+            self.instructions[entry.address] = entry
+            if entry.opcode is not None and entry.target is not None:
+                self.referrers.setdefault(entry.target, []).append(entry.address)
+                if entry.opcode == 17:
+                    self.routines.add(entry.target)
+
+    def get(self, address):
+        """ returns what was decoded at 'address', or None """
+        return self.instructions.get(address)
+
+    def successors(self, address):
+        """ returns the addresses the instruction at 'address' may go to next, as far as can be known statically """
+        instruction = self.instructions[address]
+        successors = []
+        if instruction.opcode not in END_OPCODES:
+            successors.append(instruction.next_address)
+        if instruction.target is not None:
+            successors.append(instruction.target)
+        return successors
+
+    def __contains__(self, address):
+        return address in self.instructions
+
+    def __len__(self):
+        return len(self.instructions)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Write out a listing of a Synacor program without running it")
+    parser.add_argument('program', nargs='?', default='challenge.bin', help="binary to disassemble")
+    parser.add_argument('--start', type=int, default=0, help="first address to list")
+    parser.add_argument('--end', type=int, help="address to stop listing at")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    memory = Memory()
+    memory.load_program(args.program, from_file=True)
+
+    try:
+        for line in listing(memory, args.start, args.end):
+            sys.stdout.write(line + '\n')
+    except BrokenPipeError:
+        # piped into something like head that stopped reading
+        sys.stderr.close()
+
+
+if __name__ == '__main__':
+    main()
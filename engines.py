@@ -0,0 +1,14 @@
+from block_compiler import CompiledCentralProcessingUnit
+from central_processing_unit import CentralProcessingUnit
+from fast_processing_unit import FastCentralProcessingUnit
+from translator import TranslatedCentralProcessingUnit
+
+# maps the engine name used on the command line to the CPU class that implements it
+ENGINES = {
+    'reference': CentralProcessingUnit,
+    'fast': FastCentralProcessingUnit,
+    'compiled': CompiledCentralProcessingUnit,
+    'translated': TranslatedCentralProcessingUnit,
+}
+
+DEFAULT_ENGINE = 'fast'
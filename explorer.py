@@ -0,0 +1,271 @@
+"""
+Explores every state a text adventure can reach from a starting point, by trying commands breadth or depth first
+
+each state is kept as a delta snapshot against one root snapshot, so the frontier costs a few KB a state, and
+branching a child is loading the root and the parent's delta into a cpu and typing one more command.
+batches of the frontier are expanded across a pool of processes, each holding the root once.
+states are told apart by a hash of memory, registers, stack and program pointer, leaving out any memory that
+only echoes the command typed, so commands that change nothing lead nowhere new
+"""
+from array import array
+from batch_runner import read_script
+from central_processing_unit import WAITING_FOR_INPUT
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from engines import DEFAULT_ENGINE, ENGINES
+from snapshot import dump_delta, state_hash
+from terminal_io import CaptureOutput, ScriptedInput
+import argparse
+import hashlib
+import os
+import re
+import struct
+import sys
+
+BFS = 'bfs'
+DFS = 'dfs'
+
+# Where challenge.bin keeps the line being typed, the length word and 32 characters
+CHALLENGE_INPUT_BUFFER = (25974, 26007)
+
+# A command that keeps running past this many instructions is given up on, the teleporter check say
+DEFAULT_COMMAND_BUDGET = 5000000
+
+# 'path' is the commands typed from the root, 'state' the delta snapshot against the root, empty for the root
+# and 'output' what the last command printed
+Node = namedtuple('Node', ['path', 'state', 'output'])
+
+# 'command' is what was typed in the parent, 'status' why the run stopped and 'key' the dedup hash
+Child = namedtuple('Child', ['command', 'status', 'output', 'key', 'state'])
+
+# 'kind' is ROOM or CODE
+Found = namedtuple('Found', ['kind', 'value', 'path'])
+ROOM = 'room'
+CODE = 'code'
+
+ROOM_PATTERN = re.compile(r'^== (.+) ==$', re.MULTILINE)
+# codes are 12 letters and digits, mixed case so ordinary words are not taken for one
+CODE_PATTERN = re.compile(r'\b(?=[A-Za-z0-9]*[a-z])(?=[A-Za-z0-9]*[A-Z])[A-Za-z0-9]{12}\b')
+LIST_PATTERN = re.compile(
+    r'^(Things of interest here|Your inventory|There (?:are \d+ exits|is 1 exit)):\n((?:- .+\n)+)', re.MULTILINE)
+# how each kind of list is turned into commands
+LIST_VERBS = {'Things of interest here': 'take', 'Your inventory': 'use'}
+
+# Typed after every command so the output lists the exits, the things here and the inventory
+LOOK_COMMANDS = ['look', 'inv']
+
+# Set once in each worker process by init_worker, so the root is only sent to a worker once
+_worker_root = None
+_worker_root_hash = None
+_worker_engine = None
+_worker_ignore = ()
+_worker_budget = DEFAULT_COMMAND_BUDGET
+
+
+def commands_for(output):
+    """ returns the commands worth trying after 'output', going every way, taking every thing and using all held """
+    commands = []
+    for heading, items in LIST_PATTERN.findall(output):
+        verb = LIST_VERBS.get(heading, 'go')
+        for item in items.splitlines():
+            command = f"{verb} {item[2:]}"
+            if command not in commands:
+                commands.append(command)
+    return commands
+
+
+def state_key(cpu, ignore=()):
+    """
+    returns a hash of everything that decides what 'cpu' does next, except the memory in the 'ignore' ranges
+    the pending input is left out, as every state is taken waiting for a new line
+    """
+    memory = cpu.memory._memory
+    if ignore:
+        memory = array('i', memory)
+        for start, end in ignore:
+            memory[start:end] = array('i', [0]) * (end - start)
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(memory)
+    digest.update(cpu.registers._memory)
+    digest.update(cpu.stack._stack)
+    digest.update(struct.pack('<I', cpu.program_pointer))
+    return digest.digest()
+
+
+def init_worker(root, engine_name, ignore=(), budget=DEFAULT_COMMAND_BUDGET):
+    """ runs once in each worker process, and once in this one when exploring without a pool """
+    global _worker_root, _worker_root_hash, _worker_engine, _worker_ignore, _worker_budget
+    _worker_engine = ENGINES[engine_name]
+    _worker_root = root
+    _worker_ignore = tuple(ignore)
+    _worker_budget = budget
+
+    cpu = _worker_engine(output=CaptureOutput(), input_source=ScriptedInput())
+    cpu.load_state(root)
+    _worker_root_hash = state_hash(cpu)
+
+
+def expand(state, commands):
+    """ returns a Child for each of 'commands' typed in the state with the delta snapshot 'state' """
+    children = []
+    for command in commands:
+        output = CaptureOutput()
+        script = ScriptedInput([command])
+        cpu = _worker_engine(output=output, input_source=script)
+        cpu.load_state(_worker_root)
+        root_marker = cpu.last_snapshot[1]
+        if state:
+            cpu.load_state(state)
+
+        status = cpu.run(max_instructions=_worker_budget).status
+        if status == WAITING_FOR_INPUT:
+            # list where the command left things, these only change the line being typed
+            script.feed(LOOK_COMMANDS)
+            status = cpu.run(max_instructions=_worker_budget).status
+        delta = dump_delta(cpu, _worker_root_hash, cpu.memory.pages_written_since(root_marker))
+        children.append(Child(command, status, output.getvalue(), state_key(cpu, _worker_ignore), delta))
+    return children
+
+
+class Explorer(object):
+    """
+    Explores the states reachable from 'root', a snapshot of a cpu waiting for input that printed 'output'
+    the commands tried in each state are those commands_for finds in what it printed, then 'commands'
+    """
+
+    def __init__(self, root, output='', commands=(), order=BFS, engine_name=DEFAULT_ENGINE, ignore=(),
+                 budget=DEFAULT_COMMAND_BUDGET, max_workers=None, batch_size=None):
+        if order not in (BFS, DFS):
+            raise ValueError(f"Order must be [{BFS}] or [{DFS}]")
+
+        self.root = root
+        self.output = output
+        self.commands = list(commands)
+        self.order = order
+        self.engine_name = engine_name
+        self.ignore = tuple(ignore)
+        self.budget = budget
+        # 1 explores in this process, without a pool
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+        # the first path found to each room and code, and the dedup hash of every state reached
+        self.rooms = {}
+        self.codes = {}
+        cpu = ENGINES[engine_name](output=CaptureOutput(), input_source=ScriptedInput())
+        cpu.load_state(root)
+        self.seen = {state_key(cpu, self.ignore)}
+
+    @classmethod
+    def from_program(cls, program, from_file=False, script=(), engine_name=DEFAULT_ENGINE, **kwargs):
+        """ returns an Explorer rooted where the program first waits for input once 'script' has been typed """
+        output = CaptureOutput()
+        cpu = ENGINES[engine_name](output=output, input_source=ScriptedInput(script))
+        cpu.memory.load_program(program, from_file)
+        cpu.clear_caches()
+        status = cpu.run().status
+        if status != WAITING_FOR_INPUT:
+            raise ValueError(f"Program stopped with [{status}] instead of waiting for input")
+
+        return cls(cpu.save_state(), output.getvalue(), engine_name=engine_name, **kwargs)
+
+    def commands_for(self, output):
+        commands = commands_for(output)
+        return commands + [command for command in self.commands if command not in commands]
+
+    def found(self, path, output):
+        """ yields a Found for each room and code in 'output' that has not been seen before """
+        for kind, pattern, known in [(ROOM, ROOM_PATTERN, self.rooms), (CODE, CODE_PATTERN, self.codes)]:
+            for value in pattern.findall(output):
+                if value not in known:
+                    known[value] = path
+                    yield Found(kind, value, path)
+
+    def explore(self, max_depth=None, max_states=None):
+        """
+        explores until there is nothing new left, every state 'max_depth' commands deep has been reached
+        or 'max_states' states have been, yielding a Found for each new room and code as it is reached
+        """
+        if self.max_workers == 1:
+            init_worker(self.root, self.engine_name, self.ignore, self.budget)
+            yield from self._explore(None, max_depth, max_states)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker,
+                                 initargs=(self.root, self.engine_name, self.ignore, self.budget)) as executor:
+            yield from self._explore(executor, max_depth, max_states)
+
+    def _explore(self, executor, max_depth, max_states):
+        yield from self.found((), self.output)
+        frontier = deque([Node((), b'', self.output)])
+        # enough nodes at a time to keep every worker busy
+        batch_size = self.batch_size or (self.max_workers or os.cpu_count() or 1) * 4
+        take = frontier.popleft if self.order == BFS else frontier.pop
+
+        while frontier:
+            batch = [take() for _ in range(min(batch_size, len(frontier)))]
+            if executor is None:
+                results = [expand(node.state, self.commands_for(node.output)) for node in batch]
+            else:
+                results = executor.map(expand, [node.state for node in batch],
+                                       [self.commands_for(node.output) for node in batch])
+
+            for node, children in zip(batch, results):
+                for child in children:
+                    if child.key in self.seen:
+                        continue
+                    self.seen.add(child.key)
+
+                    path = node.path + (child.command,)
+                    yield from self.found(path, child.output)
+                    if max_states is not None and len(self.seen) >= max_states:
+                        return
+
+                    if child.status == WAITING_FOR_INPUT and (max_depth is None or len(path) < max_depth):
+                        frontier.append(Node(path, child.state, child.output))
+
+
+def parse_range(text):
+    start, end = text.split(':')
+    return int(start), int(end)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Explore the states a text adventure can reach, reporting new "
+                                                 "rooms and codes")
+    parser.add_argument('program', nargs='?', default='challenge.bin', help="binary to explore")
+    parser.add_argument('--script', help="commands to type before exploring, one per line")
+    parser.add_argument('--command', action='append', default=[], dest='commands',
+                        help="a command to try in every state as well as those the game lists, can be repeated")
+    parser.add_argument('--order', choices=[BFS, DFS], default=BFS, help="breadth or depth first")
+    parser.add_argument('--max-depth', type=int, help="most commands to type past the script")
+    parser.add_argument('--max-states', type=int, help="stop after reaching this many states")
+    parser.add_argument('--ignore', type=parse_range, action='append', metavar='START:END',
+                        help=f"memory to leave out when telling states apart, can be repeated, "
+                             f"{CHALLENGE_INPUT_BUFFER[0]}:{CHALLENGE_INPUT_BUFFER[1]} by default")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                        help="which CPU implementation to run on")
+    parser.add_argument('--workers', type=int, help="number of processes, all cores by default")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    script = read_script(args.script) if args.script else []
+    ignore = args.ignore if args.ignore is not None else [CHALLENGE_INPUT_BUFFER]
+
+    explorer = Explorer.from_program(args.program, from_file=True, script=script, engine_name=args.engine,
+                                     commands=args.commands, order=args.order, ignore=ignore,
+                                     max_workers=args.workers)
+    try:
+        for found in explorer.explore(args.max_depth, args.max_states):
+            sys.stdout.write(f"{found.kind} {found.value!r}: {', '.join(found.path) or '(start)'}\n")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    sys.stderr.write(f"{len(explorer.seen)} states, {len(explorer.rooms)} rooms, {len(explorer.codes)} codes\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+from central_processing_unit import NO_LIMIT, CentralProcessingUnit, EmptyStackError, NoCommandError, ProgramTerminated
+from memory_storage import PAGE_BITS
+
+
+class FastCentralProcessingUnit(CentralProcessingUnit):
+    """
+    Models the CPU with a single dispatch loop instead of a method per opcode
+    instructions are read straight from memory on every step, so the instruction cache is not used
+    the program pointer is kept in a local while the loop runs and written back to the CPU whenever it stops,
+    however it stops, the stack is worked on where it is so stopping often, as run does to check 'until',
+    never copies it
+    """
+
+    def run_instructions(self, limit=None):
+        """ runs from the current program pointer until the program stops or the count reaches 'limit' """
+        mem = self.memory._memory
+        written = self.memory.page_writes
+        generation = self.memory.generation
+        regs = self.registers._memory
+        # only needed for a target that is not a register address, to raise the error the reference does
+        register_number = self.registers.register_number
+        stack = self.stack._stack
+        push = stack.append
+        pop = stack.pop
+        write_output = self.output.write
+        read_input = self.read_input
+
+        pc = self.program_pointer
+        count = self.instruction_count
+        peak = self.stack.peak_depth
+        limit = NO_LIMIT if limit is None else limit
+        try:
+            while count < limit:
+                count += 1
+                op = mem[pc]
+
+                # Ordered by how often each opcode runs in challenge.bin
+                if op == 2:
+                    # push a
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    push(a)
+                    if len(stack) > peak:
+                        peak = len(stack)
+                    pc += 2
+                elif op == 3:
+                    # pop a
+                    if not stack:
+                        raise EmptyStackError("Cannot pop from an empty stack")
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = pop()
+                    pc += 2
+                elif op == 12:
+                    # and a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = b & c
+                    pc += 4
+                elif op == 17:
+                    # call a
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    push(pc + 2)
+                    if len(stack) > peak:
+                        peak = len(stack)
+                    pc = a
+                elif op == 18:
+                    # ret
+                    if not stack:
+                        pc += 1
+                        raise ProgramTerminated()
+                    pc = pop()
+                elif op == 14:
+                    # not a b
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = ~b & 32767
+                    pc += 3
+                elif op == 13:
+                    # or a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = b | c
+                    pc += 4
+                elif op == 9:
+                    # add a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = (b + c) & 32767
+                    pc += 4
+                elif op == 15:
+                    # rmem a b
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    value = mem[b]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = value if value >= 0 else 0
+                    pc += 3
+                elif op == 1:
+                    # set a b
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = b
+                    pc += 3
+                elif op == 8:
+                    # jf a b
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    if a == 0:
+                        b = mem[pc + 2]
+                        if 32767 < b < 32776:
+                            b = regs[b - 32768]
+                        pc = b
+                    else:
+                        pc += 3
+                elif op == 4:
+                    # eq a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = 1 if b == c else 0
+                    pc += 4
+                elif op == 16:
+                    # wmem a b
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    mem[a] = b
+                    written[a >> PAGE_BITS] = generation
+                    pc += 3
+                elif op == 10:
+                    # mult a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = (b * c) & 32767
+                    pc += 4
+                elif op == 7:
+                    # jt a b
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    if a != 0:
+                        b = mem[pc + 2]
+                        if 32767 < b < 32776:
+                            b = regs[b - 32768]
+                        pc = b
+                    else:
+                        pc += 3
+                elif op == 19:
+                    # out a
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    write_output(chr(a))
+                    pc += 2
+                elif op == 5:
+                    # gt a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = 1 if b > c else 0
+                    pc += 4
+                elif op == 6:
+                    # jmp a
+                    a = mem[pc + 1]
+                    if 32767 < a < 32776:
+                        a = regs[a - 32768]
+                    pc = a
+                elif op == 21:
+                    # noop
+                    pc += 1
+                elif op == 11:
+                    # mod a b c
+                    b = mem[pc + 2]
+                    if 32767 < b < 32776:
+                        b = regs[b - 32768]
+                    c = mem[pc + 3]
+                    if 32767 < c < 32776:
+                        c = regs[c - 32768]
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = b % c
+                    pc += 4
+                elif op == 20:
+                    # in a
+                    # pc is only moved on once a character has been read
+                    value = read_input()
+                    a = mem[pc + 1] - 32768
+                    if not 0 <= a < 8:
+                        a = register_number(a + 32768)
+                    regs[a] = value
+                    pc += 2
+                elif op == 0:
+                    # halt
+                    pc += 1
+                    raise ProgramTerminated()
+                elif op < 0:
+                    # Ran into memory that holds no value, the program has ended
+                    count -= 1
+                    break
+                else:
+                    raise NoCommandError(f"No command for opcode [{op}]")
+        except BaseException:
+            # The instruction that raised did not complete
+            count -= 1
+            raise
+        finally:
+            self.program_pointer = pc
+            self.instruction_count = count
+            self.stack.peak_depth = peak
@@ -0,0 +1,140 @@
+from collections import namedtuple
+from memory_storage import EMPTY, Registers
+
+# Number of operands that follow each opcode, from the arch-spec opcode listing
+OPERAND_COUNTS = {
+    0: 0,   # halt
+    1: 2,   # set
+    2: 1,   # push
+    3: 1,   # pop
+    4: 3,   # eq
+    5: 3,   # gt
+    6: 1,   # jmp
+    7: 2,   # jt
+    8: 2,   # jf
+    9: 3,   # add
+    10: 3,  # mult
+    11: 3,  # mod
+    12: 3,  # and
+    13: 3,  # or
+    14: 2,  # not
+    15: 2,  # rmem
+    16: 2,  # wmem
+    17: 1,  # call
+    18: 0,  # ret
+    19: 1,  # out
+    20: 1,  # in
+    21: 0,  # noop
+}
+
+# Name of each opcode, from the arch-spec opcode listing
+OPCODE_NAMES = {
+    0: 'halt',
+    1: 'set',
+    2: 'push',
+    3: 'pop',
+    4: 'eq',
+    5: 'gt',
+    6: 'jmp',
+    7: 'jt',
+    8: 'jf',
+    9: 'add',
+    10: 'mult',
+    11: 'mod',
+    12: 'and',
+    13: 'or',
+    14: 'not',
+    15: 'rmem',
+    16: 'wmem',
+    17: 'call',
+    18: 'ret',
+    19: 'out',
+    20: 'in',
+    21: 'noop',
+}
+
+# Opcodes that write their result into the register <a>, set, pop, eq, gt, add, mult, mod, and, or, not, rmem and in
+WRITES_REGISTER = {1, 3, 4, 5, 9, 10, 11, 12, 13, 14, 15, 20}
+
+# The longest instruction is an opcode followed by three operands
+MAX_INSTRUCTION_LENGTH = 4
+
+# 'register' is the register number 0..7 or None for a literal
+# 'literal' is always the raw word as it appears in memory
+Operand = namedtuple('Operand', ['register', 'literal'])
+
+# 'handler' is called with the cpu followed by 'operands'
+Instruction = namedtuple('Instruction', ['address', 'opcode', 'handler', 'operands', 'next_address'])
+
+
+def decode_operand(word):
+    """ splits a raw word into a register number or a literal """
+    if Registers.MIN_ADDRESS <= word <= Registers.MAX_ADDRESS:
+        return Operand(word - Registers.MIN_ADDRESS, word)
+
+    return Operand(None, word)
+
+
+class InstructionCache(object):
+    """
+    Caches decoded instructions by address so hot code is only decoded once
+    entries covering a written address must be dropped with 'invalidate'
+    """
+
+    def __init__(self, memory, handlers):
+        self.memory = memory
+        self.handlers = handlers
+        self._instructions = {}
+
+    def decode(self, address):
+        """
+        Decodes the instruction at 'address'
+        returns None if the instruction runs into memory that holds no value
+        'handler' is None for an opcode with no command
+        """
+        read_word = self.memory.read_word
+
+        opcode = read_word(address)
+        if opcode == EMPTY:
+            return None
+
+        handler = self.handlers.get(opcode)
+        if handler is None:
+            return Instruction(address, opcode, None, (), address + 1)
+
+        operands = []
+        for offset in range(1, OPERAND_COUNTS[opcode] + 1):
+            try:
+                word = read_word(address + offset)
+            except IndexError:
+                return None
+            if word == EMPTY:
+                return None
+            operands.append(decode_operand(word))
+
+        return Instruction(address, opcode, handler, tuple(operands), address + 1 + len(operands))
+
+    def get(self, address):
+        """ Returns the decoded instruction at 'address', decoding it on the first request """
+        instruction = self._instructions.get(address)
+        if instruction is not None:
+            return instruction
+
+        instruction = self.decode(address)
+        if instruction is not None and instruction.handler is not None:
+            self._instructions[address] = instruction
+        return instruction
+
+    def invalidate(self, address):
+        """ Drops every cached instruction that covers 'address' """
+        for start in range(address - MAX_INSTRUCTION_LENGTH + 1, address + 1):
+            instruction = self._instructions.get(start)
+            if instruction is not None and instruction.next_address > address:
+                del self._instructions[start]
+
+    def clear(self):
+        """ Drops every cached instruction """
+        self._instructions.clear()
+
+    def __len__(self):
+        return len(self._instructions)
@@ -1,4 +1,79 @@
-from central_processing_unit import CentralProcessingUnit
+from central_processing_unit import ProgramTerminated
+from engines import DEFAULT_ENGINE, ENGINES
+from memoization import MemoizingCentralProcessingUnit
+from profiler import ProfilingCentralProcessingUnit
+from terminal_io import ScriptedInput
+from tracer import TracingCentralProcessingUnit
+import argparse
 
-cpu = CentralProcessingUnit()
-cpu.run_program('challenge.bin', from_file=True)
\ No newline at end of file
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Run a program on the Synacor virtual machine")
+    parser.add_argument('program', nargs='?', default='challenge.bin', help="binary to run")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                        help="which CPU implementation to run the program on")
+    parser.add_argument('--script', metavar='FILE',
+                        help="read input from FILE instead of the terminal, stopping when it runs out")
+    parser.add_argument('--load-state', metavar='FILE',
+                        help="resume from a snapshot instead of running the program from the start")
+    parser.add_argument('--save-state', metavar='FILE',
+                        help="write a snapshot of the machine to FILE when it stops")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="profile the run and write a json report to FILE, overrides --engine")
+    parser.add_argument('--profile-folded', metavar='FILE',
+                        help="profile the run and write folded call stacks for a flamegraph to FILE")
+    parser.add_argument('--memoize', action='store_true',
+                        help="skip calls to pure routines whose result is already known, overrides --engine")
+    parser.add_argument('--trace', type=int, metavar='N',
+                        help="keep the last N instructions run and write them to stderr if the run stops on an error, "
+                             "overrides --engine")
+    args = parser.parse_args(args)
+
+    # each of these runs on an engine of its own, so only one of them can be used at a time
+    instrumented = [option for option, used in [('--profile/--profile-folded', args.profile or args.profile_folded),
+                                                ('--memoize', args.memoize), ('--trace', args.trace)] if used]
+    if len(instrumented) > 1:
+        parser.error(f"{' and '.join(instrumented)} cannot be used together")
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    input_source = ScriptedInput.from_file(args.script) if args.script else None
+    profiling = args.profile or args.profile_folded
+    if profiling:
+        engine = ProfilingCentralProcessingUnit
+    elif args.memoize:
+        engine = MemoizingCentralProcessingUnit
+    else:
+        engine = ENGINES[args.engine]
+
+    if args.trace:
+        cpu = TracingCentralProcessingUnit(input_source=input_source, trace_size=args.trace)
+    else:
+        cpu = engine(input_source=input_source)
+    if args.load_state:
+        cpu.load_state(file_name=args.load_state)
+    try:
+        if args.load_state:
+            cpu.execute()
+        else:
+            cpu.run_program(args.program, from_file=True)
+    except (ProgramTerminated, EOFError, KeyboardInterrupt):
+        # Halted, ran out of input or was interrupted at the keyboard
+        pass
+    finally:
+        # saved however the run stopped, an error included, so it can be looked at or carried on from
+        if args.save_state:
+            cpu.save_state(args.save_state)
+
+    if args.profile:
+        cpu.profile.write_report(args.profile)
+
+    if args.profile_folded:
+        cpu.profile.write_folded(args.profile_folded)
+
+
+if __name__ == '__main__':
+    main()
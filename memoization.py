@@ -0,0 +1,294 @@
+from central_processing_unit import CentralProcessingUnit
+from collections import OrderedDict, namedtuple
+from disassembler import JUMP_OPCODES, decode
+from instruction_cache import WRITES_REGISTER
+
+# Routines are cached on this many distinct inputs before the least recently used results are dropped
+DEFAULT_CACHE_SIZE = 1 << 20
+
+# halt, rmem, wmem, out and in either read or change something other than the registers
+IMPURE_OPCODES = {0, 15, 16, 19, 20}
+
+# which operands each opcode reads, by position
+READ_OPERANDS = {
+    1: (1,), 2: (0,), 3: (), 4: (1, 2), 5: (1, 2), 6: (0,), 7: (0, 1), 8: (0, 1),
+    9: (1, 2), 10: (1, 2), 11: (1, 2), 12: (1, 2), 13: (1, 2), 14: (1,), 17: (0,), 18: (), 21: (),
+}
+
+# 'inputs' are the register numbers whose values decide the result, 'outputs' the registers the result is left in
+# 'addresses' covers every word of the routine's code, or is empty for a routine that was declared pure
+PureRoutine = namedtuple('PureRoutine', ['address', 'inputs', 'outputs', 'addresses'])
+
+
+def read_code(memory, address):
+    """
+    walks every instruction reachable from 'address' without leaving the routine
+    returns {address: (opcode, operands, successors)} and the routines it calls,
+    or None if the routine does anything that is not pure
+    """
+    code = {}
+    callees = set()
+    depths = {address: 0}
+    work = [address]
+
+    while work:
+        instruction_address = work.pop()
+        if instruction_address in code:
+            continue
+
+        instruction = decode(memory, instruction_address)
+        if instruction is None or instruction.opcode is None or instruction.opcode in IMPURE_OPCODES:
+            return None
+
+        opcode, operands, next_address = instruction.opcode, instruction.operands, instruction.next_address
+        depth = depths[instruction_address]
+
+        # the routine must only pop what it pushed and must return with the stack as it found it
+        if opcode == 2:
+            depth += 1
+        elif opcode == 3:
+            depth -= 1
+            if depth < 0:
+                return None
+        elif opcode == 18 and depth != 0:
+            return None
+
+        # jump and call targets have to be known without running the routine
+        if opcode in JUMP_OPCODES and instruction.target is None:
+            return None
+
+        if opcode == 6:
+            successors = (instruction.target,)
+        elif opcode in (7, 8):
+            successors = (next_address, instruction.target)
+        elif opcode == 18:
+            successors = ()
+        else:
+            successors = (next_address,)
+
+        if opcode == 17:
+            callees.add(instruction.target)
+
+        for successor in successors:
+            if depths.setdefault(successor, depth) != depth:
+                return None
+            work.append(successor)
+
+        code[instruction_address] = (opcode, operands, successors)
+
+    return code, callees
+
+
+def find_inputs(code, outputs, called):
+    """
+    returns the registers that are read before they are written on some path through 'code'
+    'called' maps each routine called to its (inputs, outputs)
+    a ret reads every output, so an output that is not always written is an input as well
+    """
+    live_in = {address: set() for address in code}
+    changed = True
+    while changed:
+        changed = False
+        for address, (opcode, operands, successors) in code.items():
+            uses = {operands[i].register for i in READ_OPERANDS[opcode]} - {None}
+            defs = {operands[0].register} - {None} if opcode in WRITES_REGISTER else set()
+
+            if opcode == 17:
+                callee_inputs, callee_outputs = called[operands[0].literal]
+                uses |= set(callee_inputs)
+                defs = set(callee_outputs)
+            elif opcode == 18:
+                uses |= set(outputs)
+
+            live_out = set()
+            for successor in successors:
+                live_out |= live_in[successor]
+
+            registers = uses | (live_out - defs)
+            if registers != live_in[address]:
+                live_in[address] = registers
+                changed = True
+
+    return live_in
+
+
+def analyse_routine(memory, address, known=None, _calling=()):
+    """
+    Works out whether the routine at 'address' is a pure function of its registers
+    returns a PureRoutine, or None if it reads or writes memory, does i/o, jumps somewhere only known
+    when it runs, or leaves the stack different from how it found it
+    'known' caches results by address across calls
+    """
+    known = {} if known is None else known
+    if address in known:
+        return known[address]
+
+    walked = read_code(memory, address)
+    if walked is None:
+        known[address] = None
+        return None
+    code, callees = walked
+
+    called = {}
+    outputs = set()
+    for callee in callees - {address}:
+        if callee in _calling:
+            # mutual recursion is not worked out, treat it as impure
+            known[address] = None
+            return None
+
+        routine = analyse_routine(memory, callee, known, _calling + (address,))
+        if routine is None:
+            known[address] = None
+            return None
+        called[callee] = (routine.inputs, routine.outputs)
+        outputs |= set(routine.outputs)
+
+    for opcode, operands, successors in code.values():
+        if opcode in WRITES_REGISTER:
+            outputs.add(operands[0].register)
+    outputs.discard(None)
+
+    # a routine that calls itself reads whatever it reads, grow its inputs until they settle
+    inputs = set()
+    while True:
+        called[address] = (inputs, outputs)
+        live_in = find_inputs(code, outputs, called)
+        if live_in[address] == inputs:
+            break
+        inputs = live_in[address]
+
+    addresses = frozenset(
+        word_address for instruction_address, (opcode, operands, successors) in code.items()
+        for word_address in range(instruction_address, instruction_address + 1 + len(operands))
+    )
+    routine = PureRoutine(address, tuple(sorted(inputs)), tuple(sorted(outputs)), addresses)
+    known[address] = routine
+    return routine
+
+
+class LRUCache(object):
+    """ Maps keys to values, dropping the least recently used once there are more than 'size' of them """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """ returns the value for 'key' or None """
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """ stores 'value' for 'key' """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class MemoizingCentralProcessingUnit(CentralProcessingUnit):
+    """
+    Models the CPU with the reference implementation, caching the results of calls to pure routines
+    a call to a pure routine with inputs it has seen before sets its output registers and carries on
+    without running it, instructions skipped like this are not counted
+    routines are pure when declared in 'pure_routines' as {address: (inputs, outputs)}
+    or, with 'detect' on, when analyse_routine can show they are
+    """
+
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None,
+                 pure_routines=None, detect=True, cache_size=DEFAULT_CACHE_SIZE, image=None):
+        super(MemoizingCentralProcessingUnit, self).__init__(capture_terminal_log, output, input_source, image)
+
+        self.declared_routines = {
+            address: PureRoutine(address, tuple(inputs), tuple(outputs), frozenset())
+            for address, (inputs, outputs) in (pure_routines or {}).items()
+        }
+        self.detect = detect
+
+        # analysis results by address, None for routines that are not pure
+        self.analysed_routines = {}
+        # every code address of an analysed pure routine
+        self.routine_code = set()
+
+        self.results = LRUCache(cache_size)
+        self.hits = 0
+        self.misses = 0
+
+        # (routine, key, stack depth before the call) for each pure call being run that has not returned yet
+        self._frames = []
+
+    def pure_routine(self, address):
+        """ returns the PureRoutine at 'address', or None if it is not known to be pure """
+        routine = self.declared_routines.get(address)
+        if routine is not None or not self.detect:
+            return routine
+
+        if address not in self.analysed_routines:
+            routine = analyse_routine(self.memory, address, self.analysed_routines)
+            for known in self.analysed_routines.values():
+                if known is not None:
+                    self.routine_code |= known.addresses
+
+        return self.analysed_routines[address]
+
+    def write_memory(self, address, value):
+        """ writes 'value' to memory 'address', forgetting what was worked out about any routine it rewrites """
+        super(MemoizingCentralProcessingUnit, self).write_memory(address, value)
+        if address in self.routine_code:
+            self.clear_caches()
+
+    def clear_caches(self):
+        """ Drops analysed routines and their results as well as the decoded instructions """
+        super(MemoizingCentralProcessingUnit, self).clear_caches()
+        self.analysed_routines.clear()
+        self.routine_code.clear()
+        self.results.clear()
+        self._frames.clear()
+
+    def call(self, a):
+        """
+        call: 17 a
+        as the reference call, unless <a> is a pure routine whose result for these inputs is known
+        """
+        target = self.get_value(a)
+        routine = self.pure_routine(target)
+        if routine is None:
+            return CentralProcessingUnit.call(self, a)
+
+        registers = self.registers._memory
+        key = (target,) + tuple(registers[register] for register in routine.inputs)
+        result = self.results.get(key)
+        if result is not None:
+            self.hits += 1
+            for register, value in zip(routine.outputs, result):
+                registers[register] = value
+            return
+
+        self.misses += 1
+        self._frames.append((routine, key, len(self.stack)))
+        CentralProcessingUnit.call(self, a)
+
+    def ret(self):
+        """
+        ret: 18
+        as the reference ret, storing the result when a pure routine returns
+        """
+        CentralProcessingUnit.ret(self)
+
+        if self._frames and len(self.stack) == self._frames[-1][2]:
+            routine, key, depth = self._frames.pop()
+            registers = self.registers._memory
+            self.results.put(key, tuple(registers[register] for register in routine.outputs))
+
+    opcodes = dict(CentralProcessingUnit.opcodes)
+    opcodes[17] = call
+    opcodes[18] = ret
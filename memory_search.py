@@ -0,0 +1,251 @@
+"""
+Bulk queries over snapshots of the machine, for finding where a program keeps its state
+
+every query works on whole arrays of memory at once with numpy, so narrowing 32768 candidate addresses
+across a handful of snapshots is a few array operations rather than a loop over Memory.read_word.
+numpy is only needed here, the rest of the vm runs without it
+"""
+from central_processing_unit import CentralProcessingUnit
+from collections import namedtuple
+from memory_storage import EMPTY, Memory
+import argparse
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 'address' is where the length word of a length prefixed string is, 'text' is what follows it
+FoundString = namedtuple('FoundString', ['address', 'text'])
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("memory_search needs numpy, install it with 'pip install numpy'")
+
+
+class MachineState(object):
+    """ The memory, registers and stack of a cpu at one moment, as numpy arrays """
+
+    def __init__(self, memory, registers, stack, program_pointer):
+        self.memory = memory
+        self.registers = registers
+        self.stack = stack
+        self.program_pointer = program_pointer
+
+    @classmethod
+    def from_cpu(cls, cpu):
+        """ returns a copy of the state 'cpu' is in now """
+        require_numpy()
+        return cls(np.array(cpu.memory._memory, dtype=np.int32), np.array(cpu.registers._memory, dtype=np.int32),
+                   np.array(cpu.stack._stack, dtype=np.int32), cpu.program_pointer)
+
+    @classmethod
+    def from_snapshots(cls, snapshots):
+        """
+        returns the state of each snapshot in 'snapshots', taken in order so each delta snapshot
+        is loaded on top of the one before it
+        """
+        cpu = CentralProcessingUnit()
+        states = []
+        for data in snapshots:
+            cpu.load_state(data)
+            states.append(cls.from_cpu(cpu))
+        return states
+
+    @classmethod
+    def from_files(cls, file_names):
+        """ as from_snapshots, reading each snapshot from a file """
+        def read_files():
+            for file_name in file_names:
+                with open(file_name, 'rb') as f:
+                    yield f.read()
+
+        return cls.from_snapshots(read_files())
+
+
+def find_value(state, value):
+    """ returns every address holding 'value' """
+    return np.flatnonzero(state.memory == value)
+
+
+def find_sequence(state, words):
+    """ returns every address the run of 'words' starts at """
+    words = np.asarray(words, dtype=np.int32)
+    if not len(words):
+        raise ValueError("Nothing to look for")
+
+    # narrow down with the first word, then check the rest at each of those addresses only
+    starts = np.flatnonzero(state.memory[:len(state.memory) - len(words) + 1] == words[0])
+    for offset in range(1, len(words)):
+        starts = starts[state.memory[starts + offset] == words[offset]]
+    return starts
+
+
+def find_text(state, text):
+    """ returns every address the ascii 'text' starts at, one character per word """
+    return find_sequence(state, [ord(char) for char in text])
+
+
+def printable(memory):
+    """ returns a mask of the words holding printable ascii or a newline """
+    return ((memory >= 32) & (memory < 127)) | (memory == 10)
+
+
+def find_strings(state, min_length=3, max_length=1000):
+    """
+    returns a FoundString for every length prefixed string, a length word followed by that many printable words
+    once a string is found the words it covers are not looked at again, so letters are never taken for lengths
+    """
+    memory = state.memory
+    size = len(memory)
+    addresses = np.arange(size)
+    min_length = max(min_length, 1)
+
+    # how many printable words in a row start at each address
+    breaks = np.append(np.flatnonzero(~printable(memory)), size)
+    runs = breaks[np.searchsorted(breaks, addresses)] - addresses
+
+    lengths = memory
+    fits = (lengths >= min_length) & (lengths <= max_length) & (addresses + lengths < size)
+    candidates = np.flatnonzero(fits)
+    candidates = candidates[runs[candidates + 1] >= lengths[candidates]]
+
+    found = []
+    end = 0
+    for address in candidates.tolist():
+        if address < end:
+            continue
+        length = int(lengths[address])
+        text = ''.join(map(chr, memory[address + 1:address + 1 + length].tolist()))
+        found.append(FoundString(address, text))
+        end = address + 1 + length
+    return found
+
+
+def string_tables(strings, min_count=2):
+    """ groups 'strings', as found by find_strings, into the runs of them that sit back to back in memory """
+    tables = []
+    table = []
+    for string in strings:
+        if table and table[-1].address + 1 + len(table[-1].text) != string.address:
+            if len(table) >= min_count:
+                tables.append(table)
+            table = []
+        table.append(string)
+
+    if len(table) >= min_count:
+        tables.append(table)
+    return tables
+
+
+def diff(before, after):
+    """ returns the addresses that differ between two states, with what they held in each """
+    changed = np.flatnonzero(before.memory != after.memory)
+    return changed, before.memory[changed], after.memory[changed]
+
+
+class Search(object):
+    """
+    Narrows down the addresses that could hold some piece of state, across states taken as the program runs
+    start with every address, add a state after each step of the program and keep the addresses that behaved
+    as the piece of state should have, say 'increased' after picking something up
+    every narrowing returns the search, so they can be chained
+    """
+
+    def __init__(self, state, candidates=None):
+        require_numpy()
+        self.states = [state]
+        self.candidates = np.arange(Memory.SIZE) if candidates is None else np.asarray(candidates)
+
+    def add(self, state):
+        """ adds the state the next narrowings compare against the one before it """
+        self.states.append(state)
+        return self
+
+    def _keep(self, mask):
+        self.candidates = self.candidates[mask]
+        return self
+
+    def _values(self, back=1):
+        return self.states[-back].memory[self.candidates]
+
+    def equal(self, value):
+        """ keeps the addresses holding 'value' now """
+        return self._keep(self._values() == value)
+
+    def not_equal(self, value):
+        """ keeps the addresses not holding 'value' now """
+        return self._keep(self._values() != value)
+
+    def changed(self):
+        """ keeps the addresses that changed since the state before """
+        return self._keep(self._values() != self._values(2))
+
+    def unchanged(self):
+        """ keeps the addresses that did not change since the state before """
+        return self._keep(self._values() == self._values(2))
+
+    def increased(self, by=None):
+        """ keeps the addresses that went up since the state before, by exactly 'by' if it is given """
+        change = self._values() - self._values(2)
+        return self._keep(change > 0 if by is None else change == by)
+
+    def decreased(self, by=None):
+        """ keeps the addresses that went down since the state before, by exactly 'by' if it is given """
+        change = self._values(2) - self._values()
+        return self._keep(change > 0 if by is None else change == by)
+
+    def written(self):
+        """ keeps the addresses that hold a value, dropping those never written """
+        return self._keep(self._values() != EMPTY)
+
+    @property
+    def addresses(self):
+        return self.candidates.tolist()
+
+    def __len__(self):
+        return len(self.candidates)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Search and compare snapshots of the machine")
+    parser.add_argument('command', choices=['find', 'text', 'strings', 'diff'],
+                        help="find a value, find ascii text, list length prefixed strings or diff two snapshots")
+    parser.add_argument('snapshots', nargs='+', metavar='SNAPSHOT',
+                        help="snapshot files in the order they were taken, so delta snapshots load")
+    parser.add_argument('--value', type=int, help="value to find")
+    parser.add_argument('--text', help="text to find")
+    parser.add_argument('--min-length', type=int, default=3, help="shortest string to list")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    require_numpy()
+    states = MachineState.from_files(args.snapshots)
+    state = states[-1]
+
+    try:
+        if args.command == 'find':
+            for address in find_value(state, args.value).tolist():
+                sys.stdout.write(f"{address}\n")
+        elif args.command == 'text':
+            for address in find_text(state, args.text).tolist():
+                sys.stdout.write(f"{address}\n")
+        elif args.command == 'strings':
+            for string in find_strings(state, args.min_length):
+                sys.stdout.write(f"{string.address:5d}: {string.text!r}\n")
+        else:
+            if len(states) < 2:
+                raise SystemExit("diff needs two snapshots")
+            for address, old, new in zip(*(values.tolist() for values in diff(states[-2], state))):
+                sys.stdout.write(f"{address:5d}: {old} -> {new}\n")
+    except BrokenPipeError:
+        # piped into something like head that stopped reading
+        sys.stderr.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,82 +1,181 @@
-from bit_values import Value16Bit, Value15Bit
-from collections import deque
+from array import array
+from bit_values import Value16Bit
+import hashlib
+import mmap
+import sys
+import tempfile
+
+# Marker stored in a word that has never been written to
+EMPTY = -1
+
+# Memory is tracked for writes in pages of PAGE_SIZE words, the page of an address is address >> PAGE_BITS
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+
+
+def image_digest(words):
+    """ returns a digest of the buffer of program words 'words', naming the image they were loaded from """
+    return hashlib.blake2b(memoryview(words).cast('B'), digest_size=16).digest()
+
+
+class EmptyStackError(Exception):
+    pass
 
 
 class RandomAccessMemory(object):
     """
     Models RAM allows you to write and read from addressed memory
-    Assumes 16-bit values
+    Assumes 16-bit values, held as plain ints in one preallocated buffer of SIZE words
     """
+    SIZE = 0
+    MAX_VALUE = 65535
 
     def __init__(self):
-        self._memory = {}
+        # 'i' rather than 'H' so that EMPTY can sit alongside every valid 16-bit value
+        self._memory = array('i', [EMPTY]) * self.SIZE
+
+    def write_word(self, address, value):
+        """ writes the int 'value' to memory 'address' if both are valid """
+        if address < 0 or address >= self.SIZE:
+            raise IndexError(f"Address [{address}] is out of range!")
+
+        if value < 0 or value > self.MAX_VALUE:
+            raise IndexError(f"Value [{value}] is out of range!")
+
+        self._memory[address] = value
+
+    def read_word(self, address):
+        """
+        Returns the int stored in 'address'
+        if there is no value for 'address' return EMPTY
+        """
+        if address < 0 or address >= self.SIZE:
+            raise IndexError(f"Address [{address}] is out of range!")
+
+        return self._memory[address]
 
     def write_to(self, address, value):
         """ writes 'value' to memory 'address' if both are valid """
         try:
-            value = Value16Bit(value)
+            value = Value16Bit(value).value
         except ValueError:
             raise IndexError(f"Value [{value}] is out of range!")
 
-        self._memory[address] = value
+        self.write_word(address, value)
 
     def read_from(self, address):
         """
         Returns value stored in 'address'
         if  there is no value for 'address' return None
         """
-        try:
-            return self._memory[address]
-        except KeyError:
+        value = self.read_word(address)
+        if value == EMPTY:
             return None
 
+        return Value16Bit(value)
 
-class Memory(RandomAccessMemory):
-    """ A type of RAM with a 15-bit memory space """
 
-    def __init__(self):
-        super(Memory, self).__init__()
+class Memory(RandomAccessMemory):
+    """
+    A type of RAM with a 15-bit memory space
+    every page is stamped with the generation it was last written in, and mark starts a new generation,
+    so the pages written since any mark can be listed without comparing the words themselves
+    anything that writes to '_memory' directly has to stamp 'page_writes' with 'generation' too
+    """
+    SIZE = 32768
+    PAGES = SIZE // PAGE_SIZE
+    # 32776..65535 are invalid in a program image
+    MAX_PROGRAM_VALUE = 32775
+
+    def __init__(self, image=None):
+        """ with a SharedImage 'image' the memory is a view of it, so no words of its own are allocated first """
+        if image is None:
+            super(Memory, self).__init__()
         self.occupied_memory_addresses = 0
+        # the image_digest of the program last loaded, None before one is, snapshots carry it along with memory
+        self.origin = None
 
-    def write_to(self, address, value):
-        """ checks if address is in possible range and then tries to write 'value' to memory 'address'"""
-        try:
-            address = Value15Bit(address)
-        except ValueError:
-            raise IndexError(f"Address [{address}] is out of range!")
+        self.generation = 1
+        # the generation each page was last written in, 0 for never
+        self.page_writes = array('I', [0]) * self.PAGES
 
-        super(Memory, self).write_to(address, value)
+        if image is not None:
+            self.load_shared(image)
 
-    def read_from(self, address):
+    def write_word(self, address, value):
+        """ writes the int 'value' to memory 'address' if both are valid """
+        super(Memory, self).write_word(address, value)
+        self.page_writes[address >> PAGE_BITS] = self.generation
+
+    def mark(self):
+        """ starts a new generation and returns it, pass it to pages_written_since to see what is written after """
+        self.generation += 1
+        return self.generation
+
+    def pages_written_since(self, marker):
+        """ returns the numbers of the pages written since mark returned 'marker' """
+        return [page for page, generation in enumerate(self.page_writes) if generation >= marker]
+
+    def touch_all(self):
+        """ stamps every page as written now, for when the whole of memory is replaced """
+        self.page_writes[:] = array('I', [self.generation]) * self.PAGES
+
+    def read_page(self, page):
+        """ returns a copy of the words in page number 'page' """
+        if page < 0 or page >= self.PAGES:
+            raise IndexError(f"Page [{page}] is out of range!")
+
+        return array('i', self._memory[page << PAGE_BITS:(page + 1) << PAGE_BITS])
+
+    def get_words_from_bytes(self, data):
         """
-        Returns value stored in 'address'
-        if 'address' is out of acceptable range throws an error
-        if 'address' is in acceptable range but there is no value for it, return None
+        Returns a view of 'data' as 16-bit little-endian words
+        on little-endian hosts this is a cast of the buffer rather than a copy
         """
-        try:
-            address = Value15Bit(address)
-        except ValueError:
-            raise IndexError(f"Address [{address}] is out of range!")
+        if len(data) % 2:
+            # A trailing odd byte is a word with no high byte
+            data = bytes(data) + b'\x00'
+
+        if sys.byteorder == 'little':
+            return memoryview(data).cast('B').cast('H')
 
-        return super(Memory, self).read_from(address)
+        words = array('H')
+        words.frombytes(data)
+        words.byteswap()
+        return words
 
-    def get_bytes_from_file(self, file_name):
-        """ generator that yields 16bits / 2bytes from file at a time """
+    def get_words_from_file(self, file_name):
+        """ reads the whole file in one call and returns it as 16-bit words """
         with open(file_name, 'rb') as f:
-            while True:
-                b = f.read(2)
-                if b:
-                    yield b
-                else:
-                    break
+            return self.get_words_from_bytes(f.read())
+
+    def load_image(self, words):
+        """
+        Loads a buffer of 16-bit words into memory starting at address 0
+        the whole image is range checked in one pass before anything is written
+        """
+        if len(words) > self.SIZE:
+            raise IndexError(f"Program of [{len(words)}] words does not fit in memory!")
+
+        if len(words) and max(words) > self.MAX_PROGRAM_VALUE:
+            raise IndexError(f"Program contains invalid value [{max(words)}]!")
+
+        self._memory[:len(words)] = array('i', words)
+        self.occupied_memory_addresses = len(words)
+        self.origin = image_digest(self._memory[:len(words)])
+        self.touch_all()
 
     def load_program(self, program, from_file=False):
         """
         Loads program (iterable) into memory
         if 'from_file' is True program should be a file_name
+        bytes-like programs are treated as a binary image
         """
         if from_file:
-            program = self.get_bytes_from_file(program)
+            return self.load_image(self.get_words_from_file(program))
+
+        if isinstance(program, (bytes, bytearray, memoryview)):
+            return self.load_image(self.get_words_from_bytes(program))
 
         memory_pointer = 0
         for value in program:
@@ -84,16 +183,59 @@ class Memory(RandomAccessMemory):
             memory_pointer += 1
 
         self.occupied_memory_addresses = memory_pointer
+        self.origin = image_digest(self._memory[:memory_pointer])
+
+    def load_shared(self, image):
+        """
+        Swaps the buffer for a private copy-on-write view of the SharedImage 'image'
+        anything holding on to the old buffer has to pick up the new one, so call the cpu's clear_caches after
+        """
+        self._memory = image.map()
+        self.occupied_memory_addresses = image.occupied_memory_addresses
+        self.origin = image.origin
+        self.touch_all()
 
     def __str__(self):
         return f"Memory: occupied addresses {self.occupied_memory_addresses}"
 
 
+class SharedImage(object):
+    """
+    A program loaded once and shared read-only by any number of Memory instances, see Memory.load_shared
+    each one maps the image copy-on-write, so the operating system only gives a memory a private copy of a page
+    the first time it writes to that page, and a new one costs a mapping rather than a load and a copy
+    """
+
+    def __init__(self, program, from_file=False):
+        memory = Memory()
+        memory.load_program(program, from_file)
+        self.occupied_memory_addresses = memory.occupied_memory_addresses
+        self.origin = memory.origin
+
+        # every word of memory, unwritten ones holding EMPTY, in an anonymous file the mappings share
+        self.size = len(memory._memory) * memory._memory.itemsize
+        self._file = tempfile.TemporaryFile()
+        self._file.write(memory._memory.tobytes())
+        self._file.flush()
+
+    def map(self):
+        """ returns a new private copy-on-write view of the image as a flat buffer of words """
+        # before 3.13 every mapping holds a duplicate of the file descriptor
+        options = {'trackfd': False} if sys.version_info >= (3, 13) else {}
+        mapping = mmap.mmap(self._file.fileno(), self.size, access=mmap.ACCESS_COPY, **options)
+        return memoryview(mapping).cast('i')
+
+    def close(self):
+        """ closes the file behind the image, memories already mapped from it keep working """
+        self._file.close()
+
+
 class Registers(RandomAccessMemory):
     """
     Models the eight registers
     There are 7 registers (0...7) addressed as (32768..32775)
     """
+    SIZE = 8
     MIN_ADDRESS = 32768
     MAX_ADDRESS = 32775
 
@@ -114,44 +256,63 @@ class Registers(RandomAccessMemory):
         # find the corresponding register num
         return address_or_register - self.MIN_ADDRESS
 
-    def write_to(self, address_or_register, value):
-        """
-        Writes 'value' to the register that maps to that 'address_or_register'
-        """
+    def register_number(self, address_or_register):
+        """ as get_register_num, but raises the IndexError reading or writing a register that does not exist raises """
         try:
-            register_num = self.get_register_num(address_or_register)
+            return self.get_register_num(address_or_register)
         except ValueError:
             raise IndexError(f"Address or register [{address_or_register}] is out of range")
 
-        super(Registers, self).write_to(register_num, value)
-
-    def read_from(self, address_or_register):
+    def write_word(self, address_or_register, value):
         """
-        Returns value stored at 'address_or_register'
-        If both address and register_num are defined will default to using 'address
+        Writes the int 'value' to the register that maps to that 'address_or_register'
         """
-        try:
-            register_num = self.get_register_num(address_or_register)
-        except ValueError:
-            raise IndexError(f"Address or register [{address_or_register}] is out of range")
+        super(Registers, self).write_word(self.register_number(address_or_register), value)
 
-        return super(Registers, self).read_from(register_num)
+    def read_word(self, address_or_register):
+        """
+        Returns the int stored at 'address_or_register', EMPTY if it has never been written
+        """
+        return super(Registers, self).read_word(self.register_number(address_or_register))
 
 
 class Stack(object):
-    """ Models 16 bit values stored in stack memory """
+    """
+    Models 16 bit values stored in stack memory, held as plain ints in a growable array
+    'peak_depth' is the deepest the stack has been
+    """
+    MAX_VALUE = 65535
 
     def __init__(self):
-        self._stack = deque()
+        self._stack = array('H')
+        self.peak_depth = 0
 
     def push(self, value):
         """ Pushes 'value' onto the stack if it is in acceptable range """
-        self._stack.append(Value16Bit(value))
+        if value < 0 or value > self.MAX_VALUE:
+            raise ValueError(f"Value [{value}] is out of range!")
+
+        stack = self._stack
+        stack.append(value)
+        if len(stack) > self.peak_depth:
+            self.peak_depth = len(stack)
 
     def pop(self):
-        """ Removes and returns the top value of the stack, if stack is empty return None """
-        try:
-            return self._stack.pop()
-        except IndexError:
-            return None
+        """ Removes and returns the top value of the stack, raises EmptyStackError if the stack is empty """
+        if not self._stack:
+            raise EmptyStackError("Cannot pop from an empty stack")
+
+        return self._stack.pop()
+
+    def values(self):
+        """ returns the ints on the stack as a list, bottom of the stack first """
+        return self._stack.tolist()
+
+    def replace(self, values):
+        """ replaces everything on the stack with the ints 'values', bottom of the stack first """
+        self._stack = array('H', values)
+        if len(self._stack) > self.peak_depth:
+            self.peak_depth = len(self._stack)
 
+    def __len__(self):
+        return len(self._stack)
@@ -0,0 +1,147 @@
+from array import array
+from central_processing_unit import NO_LIMIT, CentralProcessingUnit
+from instruction_cache import OPCODE_NAMES
+from memory_storage import Memory
+import json
+import time
+
+# The bottom of the call stack, everything that runs outside of a call
+ROOT_FRAME = 'main'
+
+
+def routine_name(address):
+    """ the name a routine is reported under """
+    return f"sub_{address}"
+
+
+class Profile(object):
+    """
+    Counters gathered while a program runs under ProfilingCentralProcessingUnit
+    'call' and 'ret' are tracked on a shadow call stack so instructions can be charged to the routines running them
+    """
+
+    def __init__(self):
+        self.instructions = 0
+        self.seconds = 0.0
+
+        self.address_hits = array('L', [0]) * Memory.SIZE
+        self.opcode_counts = [0] * len(OPCODE_NAMES)
+
+        # routine address -> [number of calls, instructions run inside it including the routines it calls]
+        self.routines = {}
+
+        # call stack as a tuple of routine addresses -> instructions run with exactly that stack
+        self.folded = {}
+
+        # (routine address, instruction count when it was called) for each call that has not returned yet
+        self._frames = []
+        self._charged = 0
+
+    def charge(self, count):
+        """ charges every instruction run since the last call or ret to the current call stack """
+        stack = tuple(address for address, entered in self._frames)
+        self.folded[stack] = self.folded.get(stack, 0) + count - self._charged
+        self._charged = count
+
+    def enter(self, address, count):
+        """ a call to 'address' was made after 'count' instructions """
+        self.charge(count)
+        self._frames.append((address, count))
+
+    def leave(self, count):
+        """ a ret was made after 'count' instructions """
+        self.charge(count)
+        if not self._frames:
+            return
+
+        address, entered = self._frames.pop()
+        routine = self.routines.setdefault(address, [0, 0])
+        routine[0] += 1
+        routine[1] += count - entered
+
+    def report(self, top=20):
+        """ returns the profile as a dict that can be written out as json """
+        self.charge(self.instructions)
+
+        hot_addresses = sorted(range(len(self.address_hits)), key=self.address_hits.__getitem__, reverse=True)
+        routines = sorted(self.routines.items(), key=lambda item: item[1][1], reverse=True)
+
+        return {
+            'instructions': self.instructions,
+            'seconds': self.seconds,
+            'instructions_per_second': self.instructions / self.seconds if self.seconds else 0.0,
+            'opcodes': {OPCODE_NAMES[opcode]: count for opcode, count in enumerate(self.opcode_counts)},
+            'hot_addresses': [
+                {'address': address, 'hits': self.address_hits[address]}
+                for address in hot_addresses[:top] if self.address_hits[address]
+            ],
+            'routines': [
+                {'address': address, 'calls': calls, 'inclusive_instructions': inclusive}
+                for address, (calls, inclusive) in routines[:top]
+            ],
+        }
+
+    def write_report(self, file_name, top=20):
+        """ writes the report to 'file_name' as json """
+        with open(file_name, 'w') as f:
+            json.dump(self.report(top), f, indent=2)
+
+    def folded_lines(self):
+        """ yields the profile in the folded stack format that flamegraph tools read """
+        self.charge(self.instructions)
+        for stack, count in sorted(self.folded.items()):
+            if count:
+                frames = [ROOT_FRAME] + [routine_name(address) for address in stack]
+                yield f"{';'.join(frames)} {count}"
+
+    def write_folded(self, file_name):
+        """ writes the folded stacks to 'file_name' """
+        with open(file_name, 'w') as f:
+            for line in self.folded_lines():
+                f.write(line + '\n')
+
+
+class ProfilingCentralProcessingUnit(CentralProcessingUnit):
+    """
+    Models the CPU using the reference implementation of each opcode, counting everything it runs into 'profile'
+    profiling has a loop of its own so the other engines pay nothing for it
+    """
+
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None, image=None):
+        super(ProfilingCentralProcessingUnit, self).__init__(capture_terminal_log, output, input_source, image)
+        self.profile = Profile()
+
+    def run_instructions(self, limit=None):
+        """ runs from the current program pointer until the program stops or 'instruction_count' reaches 'limit' """
+        profile = self.profile
+        address_hits = profile.address_hits
+        opcode_counts = profile.opcode_counts
+        get_instruction = self.instruction_cache.get
+        execute_command = self.execute_command
+
+        count = profile.instructions
+        started = time.perf_counter()
+        limit = NO_LIMIT if limit is None else limit
+        try:
+            while self.instruction_count < limit:
+                pc = self.program_pointer
+                instruction = get_instruction(pc)
+                if instruction is None:
+                    break
+
+                execute_command(instruction)
+                self.instruction_count += 1
+
+                # counted once it has run, a halt or an 'in' waiting for input does not count, as on the cpu
+                count += 1
+                address_hits[pc] += 1
+                opcode = instruction.opcode
+                opcode_counts[opcode] += 1
+
+                if opcode == 18:
+                    profile.leave(count)
+                elif opcode == 17:
+                    profile.enter(self.program_pointer, count)
+        finally:
+            profile.instructions = count
+            profile.seconds += time.perf_counter() - started
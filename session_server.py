@@ -0,0 +1,165 @@
+"""
+Hosts many independent sessions of one program in a single process, one per connection
+
+each session runs its own cpu a slice of instructions at a time and then lets the others run, so none of them
+starve the rest. 'in' reads the lines the client sends and 'out' is sent back to it as each slice finishes
+"""
+from central_processing_unit import BUDGET_EXHAUSTED, ERROR, WAITING_FOR_INPUT
+from engines import DEFAULT_ENGINE, ENGINES
+from memory_storage import SharedImage
+from terminal_io import ScriptedInput
+import argparse
+import asyncio
+
+# Instructions a session runs before it gives the other sessions a turn
+DEFAULT_SLICE = 20000
+
+
+class StreamOutput(object):
+    """ Output for 'out' that buffers characters and hands them to an asyncio stream writer when flushed """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._buffer = []
+
+    def write(self, ascii_char):
+        """ buffers 'ascii_char' """
+        self._buffer.append(ascii_char)
+
+    def flush(self):
+        """ queues everything buffered on the writer, which sends it without blocking """
+        if self._buffer and not self.writer.is_closing():
+            self.writer.write(''.join(self._buffer).encode('utf-8'))
+        self._buffer.clear()
+
+
+class Session(object):
+    """ One cpu running the program for one connection """
+
+    def __init__(self, image, engine, reader, writer, slice_size=DEFAULT_SLICE):
+        self.reader = reader
+        self.writer = writer
+        self.slice_size = slice_size
+
+        self.input = ScriptedInput()
+        self.cpu = engine.from_image(image, output=StreamOutput(writer), input_source=self.input)
+
+        # how many slices the session has run and why it stopped, None while it is running
+        self.slices = 0
+        self.halt_reason = None
+
+    async def run(self):
+        """ runs the program until it stops or the client goes away, returns why it stopped """
+        while True:
+            status, instructions, error = self.cpu.run(max_instructions=self.slice_size)
+            self.slices += 1
+
+            if status == WAITING_FOR_INPUT:
+                # the 'in' runs again once the client has sent another line
+                await self.writer.drain()
+                line = await self.reader.readline()
+                if not line:
+                    self.halt_reason = 'disconnected'
+                    return self.halt_reason
+                self.input.feed(line.decode('ascii', errors='ignore'))
+                continue
+
+            if status == ERROR:
+                self.halt_reason = f"error: {error.__class__.__name__}: {error}"
+                return self.halt_reason
+
+            if status != BUDGET_EXHAUSTED:
+                self.halt_reason = status
+                return self.halt_reason
+
+            await self.writer.drain()
+            if self.writer.is_closing():
+                self.halt_reason = 'disconnected'
+                return self.halt_reason
+
+            # let every other session run a slice
+            await asyncio.sleep(0)
+
+
+class SessionServer(object):
+    """ Accepts connections on tcp or unix sockets, starting a new Session of the program for each one """
+
+    def __init__(self, program, from_file=False, engine_name=DEFAULT_ENGINE, slice_size=DEFAULT_SLICE):
+        # every session maps the one image, only copying the pages it writes to
+        self.image = SharedImage(program, from_file)
+
+        self.engine = ENGINES[engine_name]
+        self.slice_size = slice_size
+
+        # every running Session mapped to the task running it
+        self.sessions = {}
+
+    async def handle(self, reader, writer):
+        """ runs a session for one connection, closing it once the session stops """
+        session = Session(self.image, self.engine, reader, writer, self.slice_size)
+        self.sessions[session] = asyncio.current_task()
+        try:
+            await session.run()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.pop(session, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def shutdown(self):
+        """ closes the connection of every session and waits for them all to stop """
+        tasks = list(self.sessions.values())
+        for session in list(self.sessions):
+            session.writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """ returns the asyncio server listening on 'host' and 'port', port 0 picks a free one """
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def start_unix(self, path):
+        """ returns the asyncio server listening on the unix socket at 'path' """
+        return await asyncio.start_unix_server(self.handle, path)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Serve sessions of a program to many clients from one process")
+    parser.add_argument('program', nargs='?', default='challenge.bin', help="binary each session runs")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=7000, help="tcp port to listen on")
+    parser.add_argument('--unix', metavar='PATH', help="listen on a unix socket at PATH instead of tcp")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                        help="which CPU implementation the sessions run on")
+    parser.add_argument('--slice', type=int, default=DEFAULT_SLICE,
+                        help="instructions a session runs before the others get a turn")
+    return parser.parse_args(args)
+
+
+async def serve(args):
+    session_server = SessionServer(args.program, from_file=True, engine_name=args.engine, slice_size=args.slice)
+    if args.unix:
+        server = await session_server.start_unix(args.unix)
+    else:
+        server = await session_server.start_tcp(args.host, args.port)
+
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            await session_server.shutdown()
+
+
+def main(args=None):
+    try:
+        asyncio.run(serve(parse_args(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Compact binary snapshots of the whole state of a CentralProcessingUnit
+
+layout, all little-endian:
+    header       see HEADER below, the origin is the image_digest of the program memory was loaded with
+    registers    8 x int32
+    stack        stack depth x uint16, bottom of the stack first
+    input        the pending input line as utf-8
+    memory       32768 x int32, zlib compressed, unwritten words hold EMPTY
+
+a delta snapshot holds only the memory pages written since the snapshot it was taken against, its parent,
+and can only be loaded into a cpu in exactly the parent's state, whose origin it keeps.
+The layout is the same apart from:
+    header       see DELTA_HEADER below, the parent is named by its state_hash
+    memory       zlib compressed page count x uint16 page numbers, then page count x PAGE_SIZE x int32 words
+"""
+from array import array
+from memory_storage import PAGE_BITS, PAGE_SIZE
+import hashlib
+import struct
+import sys
+import zlib
+
+MAGIC = b'SYNV'
+VERSION = 2
+
+# magic, version, origin, program pointer, occupied memory addresses, stack depth, pending input bytes,
+# memory bytes. The origin is all zeros when memory was never loaded with a program
+HEADER = struct.Struct('<4sH16sIIIII')
+
+# version 1 snapshots, from before the origin was kept, still load
+HEADER_V1 = struct.Struct('<4sHIIIII')
+
+# the origin of a memory that was never loaded with a program
+NO_ORIGIN = bytes(16)
+
+DELTA_MAGIC = b'SYND'
+DELTA_VERSION = 1
+
+# magic, version, parent state hash, program pointer, occupied memory addresses, stack depth,
+# pending input bytes, page count, memory bytes
+DELTA_HEADER = struct.Struct('<4sH16sIIIIII')
+
+
+def to_little_endian(words):
+    """ returns the bytes of the array or memoryview 'words' in little-endian order """
+    if sys.byteorder == 'big':
+        # memory shared with an image is a memoryview rather than an array
+        words = array(getattr(words, 'typecode', None) or words.format, words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def from_little_endian(typecode, data):
+    """ returns an array of 'typecode' holding the little-endian 'data' """
+    words = array(typecode)
+    words.frombytes(data)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+
+def dump_machine(cpu):
+    """ returns the registers, stack and pending input of 'cpu' as they are laid out in a snapshot """
+    return [
+        to_little_endian(cpu.registers._memory),
+        to_little_endian(cpu.stack._stack),
+        cpu.pending_input.encode('utf-8'),
+    ]
+
+
+def dump_state(cpu):
+    """ returns a snapshot of 'cpu' as bytes """
+    registers, stack, pending_input = dump_machine(cpu)
+    memory = zlib.compress(to_little_endian(cpu.memory._memory))
+
+    header = HEADER.pack(MAGIC, VERSION, cpu.memory.origin or NO_ORIGIN, cpu.program_pointer,
+                         cpu.memory.occupied_memory_addresses, len(cpu.stack), len(pending_input), len(memory))
+
+    return b''.join([header, registers, stack, pending_input, memory])
+
+
+def dump_delta(cpu, parent, pages):
+    """
+    returns a delta snapshot of 'cpu' as bytes, taken against the snapshot whose state_hash is 'parent'
+    'pages' are the numbers of every page written since the parent was taken
+    """
+    registers, stack, pending_input = dump_machine(cpu)
+    pages = array('H', sorted(pages))
+    memory = zlib.compress(b''.join([to_little_endian(pages)] +
+                                    [to_little_endian(cpu.memory.read_page(page)) for page in pages]))
+
+    header = DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, bytes.fromhex(parent), cpu.program_pointer,
+                               cpu.memory.occupied_memory_addresses, len(cpu.stack), len(pending_input),
+                               len(pages), len(memory))
+
+    return b''.join([header, registers, stack, pending_input, memory])
+
+
+def load_machine(cpu, data, header_size, stack_depth, input_size, memory_size):
+    """
+    checks the size of the snapshot 'data' and returns its registers, stack and pending input,
+    and the offset its memory starts at
+    """
+    registers_size = cpu.registers.SIZE * cpu.registers._memory.itemsize
+    stack_size = stack_depth * 2
+    expected_size = header_size + registers_size + stack_size + input_size + memory_size
+    if len(data) != expected_size:
+        raise ValueError(f"Snapshot should be [{expected_size}] bytes but is [{len(data)}]")
+
+    offset = header_size
+    registers = from_little_endian('i', data[offset:offset + registers_size])
+    offset += registers_size
+    stack = from_little_endian('H', data[offset:offset + stack_size])
+    offset += stack_size
+    pending_input = bytes(data[offset:offset + input_size]).decode('utf-8')
+    offset += input_size
+    return registers, stack, pending_input, offset
+
+
+def restore_machine(cpu, registers, stack, pending_input, program_pointer, occupied):
+    """ puts everything but memory back into 'cpu' """
+    cpu.memory.occupied_memory_addresses = occupied
+    cpu.registers._memory[:] = registers
+    cpu.stack.replace(stack)
+    cpu.pending_input = pending_input
+    cpu.program_pointer = program_pointer
+
+
+def load_state(cpu, data):
+    """
+    restores 'cpu' from the snapshot or delta snapshot 'data'
+    memory and registers are copied into the existing buffers, so anything holding on to them stays valid
+    """
+    data = memoryview(data)
+    if data[:len(DELTA_MAGIC)] == DELTA_MAGIC:
+        return load_delta(cpu, data)
+
+    try:
+        magic, version = HEADER_V1.unpack_from(data)[:2]
+        if version == 1:
+            header_size = HEADER_V1.size
+            origin = NO_ORIGIN
+            program_pointer, occupied, stack_depth, input_size, memory_size = HEADER_V1.unpack_from(data)[2:]
+        else:
+            header_size = HEADER.size
+            origin, program_pointer, occupied, stack_depth, input_size, memory_size = HEADER.unpack_from(data)[2:]
+    except struct.error:
+        raise ValueError("Snapshot is truncated")
+
+    if magic != MAGIC:
+        raise ValueError("Not a snapshot")
+
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported snapshot version [{version}]")
+
+    registers, stack, pending_input, offset = load_machine(cpu, data, header_size, stack_depth, input_size,
+                                                           memory_size)
+    memory = from_little_endian('i', zlib.decompress(data[offset:]))
+
+    if len(memory) != cpu.memory.SIZE:
+        raise ValueError("Snapshot memory is the wrong size")
+
+    cpu.memory._memory[:] = memory
+    cpu.memory.origin = origin if origin != NO_ORIGIN else None
+    cpu.memory.touch_all()
+    restore_machine(cpu, registers, stack, pending_input, program_pointer, occupied)
+
+
+def load_delta(cpu, data):
+    """
+    brings 'cpu' from the state the delta snapshot 'data' was taken against to the state it was taken in
+    raises ValueError if 'cpu' is not in exactly the parent's state
+    """
+    try:
+        (magic, version, parent, program_pointer, occupied, stack_depth, input_size, page_count,
+         memory_size) = DELTA_HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError("Snapshot is truncated")
+
+    if version != DELTA_VERSION:
+        raise ValueError(f"Unsupported snapshot version [{version}]")
+
+    registers, stack, pending_input, offset = load_machine(cpu, data, DELTA_HEADER.size, stack_depth, input_size,
+                                                           memory_size)
+    memory = zlib.decompress(data[offset:])
+    pages = from_little_endian('H', memory[:page_count * 2])
+    words = from_little_endian('i', memory[page_count * 2:])
+
+    if len(words) != page_count * PAGE_SIZE or (pages and max(pages) >= cpu.memory.PAGES):
+        raise ValueError("Snapshot memory is the wrong size")
+
+    if state_hash(cpu) != parent.hex():
+        raise ValueError("Delta snapshot was taken against a different state")
+
+    mem = cpu.memory._memory
+    for index, page in enumerate(pages):
+        mem[page << PAGE_BITS:(page + 1) << PAGE_BITS] = words[index * PAGE_SIZE:(index + 1) * PAGE_SIZE]
+        cpu.memory.page_writes[page] = cpu.memory.generation
+    restore_machine(cpu, registers, stack, pending_input, program_pointer, occupied)
+
+
+def delta_pages(data):
+    """ returns the numbers of the pages held by the delta snapshot 'data' """
+    data = memoryview(data)
+    header = DELTA_HEADER.unpack_from(data)
+    if header[0] != DELTA_MAGIC:
+        raise ValueError("Not a delta snapshot")
+
+    page_count, memory_size = header[-2:]
+    return from_little_endian('H', zlib.decompress(data[len(data) - memory_size:])[:page_count * 2]).tolist()
+
+
+def state_hash(cpu):
+    """
+    returns a short hex digest of everything that decides what 'cpu' does next
+    two machines with the same hash will behave the same given the same input
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(cpu.memory._memory)
+    digest.update(cpu.registers._memory)
+    digest.update(cpu.stack._stack)
+    digest.update(struct.pack('<I', cpu.program_pointer))
+    digest.update(cpu.pending_input.encode('utf-8'))
+    return digest.hexdigest()
@@ -0,0 +1,147 @@
+from collections import deque
+import sys
+
+
+class TerminalOutput(object):
+    """
+    Buffers characters written by 'out' and writes them to 'stream' a whole line at a time
+    the cpu also flushes it before reading input and whenever the program stops
+    with no 'stream' it writes to whatever sys.stdout is at the time
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._buffer = []
+
+    def write(self, ascii_char):
+        """ buffers 'ascii_char', writing out the buffer at the end of a line """
+        self._buffer.append(ascii_char)
+        if ascii_char == '\n':
+            self.flush()
+
+    def flush(self):
+        """ writes out anything that is buffered """
+        stream = self.stream if self.stream is not None else sys.stdout
+        if self._buffer:
+            stream.write(''.join(self._buffer))
+            self._buffer.clear()
+        stream.flush()
+
+
+class CaptureOutput(object):
+    """ Keeps everything written by 'out' in memory """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, ascii_char):
+        """ keeps 'ascii_char' """
+        self._chunks.append(ascii_char)
+
+    def flush(self):
+        """ nothing to flush, the output is only kept in memory """
+        pass
+
+    def getvalue(self):
+        """ returns everything written so far """
+        if len(self._chunks) > 1:
+            self._chunks[:] = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+
+class RingBufferOutput(object):
+    """ Keeps only the last 'size' characters written by 'out', for long runs nobody is watching """
+
+    def __init__(self, size=4096):
+        self._chars = deque(maxlen=size)
+
+    def write(self, ascii_char):
+        """ keeps 'ascii_char', dropping the oldest character once the buffer is full """
+        self._chars.append(ascii_char)
+
+    def flush(self):
+        """ nothing to flush, the output is only kept in memory """
+        pass
+
+    def getvalue(self):
+        """ returns the last characters written """
+        return ''.join(self._chars)
+
+
+class NullOutput(object):
+    """ Throws away everything written by 'out' """
+
+    def write(self, ascii_char):
+        pass
+
+    def flush(self):
+        pass
+
+
+class TeeOutput(object):
+    """ Writes everything written by 'out' to each of 'outputs' """
+
+    def __init__(self, *outputs):
+        self.outputs = outputs
+
+    def write(self, ascii_char):
+        for output in self.outputs:
+            output.write(ascii_char)
+
+    def flush(self):
+        for output in self.outputs:
+            output.flush()
+
+
+class TerminalInput(object):
+    """
+    Reads input for 'in' a whole line at a time from 'stream'
+    with no 'stream' it reads from whatever sys.stdin is at the time
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def readline(self):
+        """ returns the next line, or '' once there is no more input """
+        stream = self.stream if self.stream is not None else sys.stdin
+        return stream.readline()
+
+
+class ScriptedInput(object):
+    """
+    Reads input for 'in' from 'lines', any iterable of strings such as a list, a generator,
+    an open script file or a pipe, so the program never waits on a terminal
+    once it runs out more lines can be fed in with 'feed'
+    """
+
+    def __init__(self, lines=()):
+        self._sources = deque([iter(lines)])
+
+    @classmethod
+    def from_file(cls, file_name):
+        """ reads the script in 'file_name' lazily, a line at a time """
+        def read_lines():
+            with open(file_name) as f:
+                yield from f
+        return cls(read_lines())
+
+    def feed(self, lines):
+        """ queues up more input, either a single line or an iterable of lines """
+        if isinstance(lines, str):
+            lines = [lines]
+        self._sources.append(iter(lines))
+
+    def readline(self):
+        """ returns the next line, always ending in a newline, or '' once the script has run out """
+        while self._sources:
+            line = next(self._sources[0], None)
+            if line is None:
+                self._sources.popleft()
+                continue
+
+            if not line.endswith('\n'):
+                line += '\n'
+            return line
+
+        return ''
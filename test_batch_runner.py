@@ -0,0 +1,36 @@
+from batch_runner import program_image, run_batch, run_job
+from engines import ENGINES
+
+
+def test_run_job():
+    """ A job reports its output, how many instructions it ran and why it stopped """
+    image = program_image([19, 104, 20, 32768, 19, 32768, 0])
+    result = run_job(0, ['i'], image=image, engine=ENGINES['fast'])
+
+    assert 'hi' == result.output
+    assert 3 == result.instructions
+    assert 'halted' == result.halt_reason
+
+    result = run_job(1, [], image=image, engine=ENGINES['fast'])
+    assert 'h' == result.output
+    assert 'input_exhausted' == result.halt_reason
+
+
+def test_run_batch():
+    """ Every script is run, jobs with the same input end in the same state """
+    scripts = [['take tablet'], ['look'], ['take tablet']]
+    results = sorted(run_batch('challenge.bin', scripts, from_file=True, max_workers=2))
+
+    assert [0, 1, 2] == [result.job for result in results]
+    assert all('input_exhausted' == result.halt_reason for result in results)
+    assert 'Taken.' in results[0].output
+    assert results[0].state_hash == results[2].state_hash
+    assert results[0].state_hash != results[1].state_hash
+    assert results[0].instructions == results[2].instructions
+
+
+def test_errors_are_reported():
+    """ A job that fails reports the error rather than stopping the batch """
+    image = program_image([3, 32768])
+    result = run_job(0, [], image=image, engine=ENGINES['reference'])
+    assert result.halt_reason.startswith('error: EmptyStackError')
@@ -0,0 +1,26 @@
+from benchmark import Benchmark, find_regressions, measure, run_once
+from engines import ENGINES
+from test_helpers import TestPrograms
+
+
+def test_measure():
+    """ Each measurement is reported for a small benchmark """
+    benchmark = Benchmark('tiny', TestPrograms.count_down(10), False, [])
+    cpu, startup, load, run = run_once(ENGINES['fast'], benchmark)
+    assert 0 == cpu.registers.read_word(0)
+
+    measurements = measure(ENGINES['fast'], benchmark, instructions=23, repeat=1)
+    assert 23 == measurements['instructions']
+    assert measurements['instructions_per_second'] > 0
+    assert measurements['peak_memory_bytes'] > 0
+
+
+def test_find_regressions():
+    """ Only results that fall further below the baseline than the tolerance are regressions """
+    baseline = {'fast': {'loop': {'instructions_per_second': 1000}}}
+
+    assert [] == find_regressions({'fast': {'loop': {'instructions_per_second': 800}}}, baseline, tolerance=0.25)
+    assert 1 == len(find_regressions({'fast': {'loop': {'instructions_per_second': 700}}}, baseline, tolerance=0.25))
+
+    # Benchmarks missing from the baseline are not compared
+    assert [] == find_regressions({'fast': {'other': {'instructions_per_second': 1}}}, baseline)
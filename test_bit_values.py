@@ -48,3 +48,21 @@ def test_16_bit_happy_path():
     value_16_bit = Value16Bit(value_in_bytes)
     assert value == value_16_bit.value
 
+
+
+def test_values_are_interned():
+    """ Building the same value twice gives back the same shared instance """
+    assert Value16Bit(1234) is Value16Bit(1234)
+    assert Value16Bit(1234) is Value16Bit((1234).to_bytes(length=2, byteorder='little'))
+    assert Value15Bit(1234) is not Value16Bit(1234)
+    assert Value15Bit(1234) != Value16Bit(1234)
+
+
+def test_values_cannot_change():
+    value = Value16Bit(5)
+    with pytest.raises(AttributeError):
+        value.value = 6
+    with pytest.raises(AttributeError):
+        value.other = 6
+    assert 5 == Value16Bit(5).value
+
@@ -0,0 +1,74 @@
+from block_compiler import CompiledCentralProcessingUnit
+from central_processing_unit import HALTED, CentralProcessingUnit, ProgramTerminated
+from terminal_io import ScriptedInput
+import io
+import pytest
+
+
+def test_matches_reference_on_challenge(monkeypatch):
+    """ Compiled blocks should reach the first prompt of the challenge in exactly the same state """
+    states = []
+    for cpu in [CentralProcessingUnit(capture_terminal_log=True), CompiledCentralProcessingUnit(capture_terminal_log=True)]:
+        monkeypatch.setattr('sys.stdin', io.StringIO(''))
+        with pytest.raises(EOFError):
+            cpu.run_program('challenge.bin', from_file=True)
+
+        stack = cpu.stack.values()
+        states.append((cpu.terminal_log, cpu.program_pointer, cpu.instruction_count,
+                       cpu.registers._memory, cpu.memory._memory, stack, cpu.stack.peak_depth))
+
+    assert states[0] == states[1]
+
+
+def test_blocks_end_at_jumps():
+    """ A block runs up to and including the instruction that ends it """
+    cpu = CompiledCentralProcessingUnit()
+    cpu.memory.load_program([9, 32768, 1, 2, 21, 6, 9, 0])
+
+    instructions, end = cpu.read_block(0)
+    assert [0, 4, 5] == [address for address, opcode, operands in instructions]
+    assert 7 == end
+
+
+def test_overwritten_block_is_recompiled():
+    """ A wmem into a compiled block drops it so the new code runs the next time round """
+    cpu = CompiledCentralProcessingUnit(capture_terminal_log=True)
+    program = [
+        19, 97,         # 0: out 'a'
+        16, 1, 98,      # 2: wmem the operand at 1 with 'b'
+        7, 32768, 13,   # 5: jt r0 to the halt
+        1, 32768, 1,    # 8: set r0 1
+        6, 0,           # 11: jmp back to the start
+        0,              # 13: halt
+    ]
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(program)
+
+    assert 'ab' == cpu.terminal_log
+    assert 14 == cpu.program_pointer
+    assert 8 == cpu.instruction_count
+
+    # The block at 0 rewrites itself so it is dropped on every pass
+    assert 0 not in cpu.blocks
+
+    # Writing through the cpu drops a block as well
+    assert 5 in cpu.blocks
+    cpu.write_memory(6, 32769)
+    assert 5 not in cpu.blocks
+    assert 6 not in cpu.covered
+
+
+def test_overwritten_interpreted_instruction():
+    """ A wmem over an instruction the interpreter decoded, an 'in' say, drops it as well """
+    program = [
+        20, 32768,      # 0: in r0
+        16, 0, 0,       # 2: wmem 0 with 0, a halt
+        6, 0,           # 5: jmp back to the start
+    ]
+    results = []
+    for cpu in [CentralProcessingUnit(input_source=ScriptedInput(['ab'])),
+                CompiledCentralProcessingUnit(input_source=ScriptedInput(['ab']))]:
+        cpu.memory.load_program(program)
+        results.append((cpu.run().status, cpu.instruction_count))
+
+    assert [(HALTED, 3), (HALTED, 3)] == results
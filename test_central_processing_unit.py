@@ -1,7 +1,12 @@
-from central_processing_unit import CentralProcessingUnit, ProgramTerminated, NoCommandError
+from central_processing_unit import CentralProcessingUnit, ProgramTerminated, NoCommandError, EmptyStackError
+from central_processing_unit import BUDGET_EXHAUSTED, ENDED, ERROR, HALTED, UNTIL, WAITING_FOR_INPUT
+from engines import ENGINES
+import io
 import pytest
 from test_helpers import *
+from memory_storage import EMPTY, SharedImage
 from random import randint
+from terminal_io import ScriptedInput
 
 
 def test_halt():
@@ -158,3 +163,284 @@ def test_jf():
 
 
 
+
+
+def test_instruction_cache_invalidation():
+    """ Test that writing over a decoded instruction drops it from the cache """
+    cpu = CentralProcessingUnit(capture_terminal_log=True)
+    program = [19, 97, 9, 32768, 1, 2]
+    cpu.run_program(program)
+    assert 'a' == cpu.terminal_log
+    assert 2 == len(cpu.instruction_cache)
+
+    # Overwrite the last operand of the add, only the add should be dropped
+    cpu.write_memory(5, 3)
+    assert 1 == len(cpu.instruction_cache)
+    assert 3 == cpu.instruction_cache.get(2).operands[2].literal
+
+    # Writing to an address past every cached instruction keeps them all
+    cpu.write_memory(6, 21)
+    assert 2 == len(cpu.instruction_cache)
+
+
+@pytest.fixture(params=sorted(ENGINES))
+def engine(request):
+    """ each CPU implementation that can be selected to run a program """
+    return ENGINES[request.param]
+
+
+@pytest.mark.parametrize('opcode, b, c, expected', [
+    (4, 7, 7, 1),           # eq
+    (4, 7, 8, 0),
+    (5, 8, 7, 1),           # gt
+    (5, 7, 7, 0),
+    (9, 32758, 15, 5),      # add
+    (10, 300, 300, 24464),  # mult
+    (11, 17, 5, 2),         # mod
+    (12, 12, 10, 8),        # and
+    (13, 12, 10, 14),       # or
+])
+def test_arithmetic(engine, opcode, b, c, expected):
+    """ Test the three operand opcodes that write a result into a register """
+    cpu = engine()
+    cpu.run_program([opcode, 32768, b, c])
+    assert expected == cpu.registers.read_word(0)
+
+
+def test_set_not(engine):
+    """ Test set and the 15-bit not """
+    cpu = engine()
+    cpu.run_program([1, 32769, 5, 14, 32768, 32769])
+    assert 5 == cpu.registers.read_word(1)
+    assert 32762 == cpu.registers.read_word(0)
+
+
+def test_push_pop(engine):
+    """ Test values come off the stack in reverse order """
+    cpu = engine()
+    cpu.run_program([2, 3, 2, 4, 3, 32768, 3, 32769])
+    assert 4 == cpu.registers.read_word(0)
+    assert 3 == cpu.registers.read_word(1)
+    assert 2 == cpu.stack.peak_depth
+
+    # Popping from an empty stack is an error
+    cpu = engine()
+    with pytest.raises(EmptyStackError):
+        cpu.run_program([2, 3, 3, 32768, 3, 32768])
+    assert 4 == cpu.program_pointer
+    assert 2 == cpu.instruction_count
+
+
+def test_rmem_wmem(engine):
+    """ Test reading and writing memory, including code the program is about to run """
+    cpu = engine(capture_terminal_log=True)
+    # Overwrite the operand of the 'out' at address 6, then copy it into register 0
+    program = [16, 7, 98, 15, 32768, 7, 19, 97]
+    cpu.run_program(program)
+    assert 'b' == cpu.terminal_log
+    assert 98 == cpu.registers.read_word(0)
+
+
+def test_wmem_marks_pages(engine):
+    """ Every engine stamps the pages wmem writes to """
+    cpu = engine()
+    # wmem 20000 5, wmem r0 6, halt
+    cpu.memory.load_program([16, 20000, 5, 16, 32768, 6, 0])
+    cpu.registers.write_word(0, 300)
+    cpu.clear_caches()
+
+    marker = cpu.memory.mark()
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+    assert [300 >> 8, 20000 >> 8] == cpu.memory.pages_written_since(marker)
+
+
+def test_call_ret(engine):
+    """ Test call pushes the return address and ret jumps back to it """
+    cpu = engine(capture_terminal_log=True)
+    program = [17, 5, 19, 98, 0, 19, 97, 18]
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(program)
+    assert 'ab' == cpu.terminal_log
+
+    # ret with an empty stack halts
+    cpu = engine()
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program([18])
+
+
+def test_in(engine, monkeypatch):
+    """ Test in reads a line at a time and hands it out one character at a time """
+    monkeypatch.setattr('sys.stdin', io.StringIO('hi\n'))
+    cpu = engine()
+    cpu.run_program([20, 32768, 20, 32769])
+    assert ord('h') == cpu.registers.read_word(0)
+    assert ord('i') == cpu.registers.read_word(1)
+    assert '\n' == cpu.pending_input
+
+    # Running out of input leaves the program pointing at the 'in'
+    cpu = engine()
+    with pytest.raises(EOFError):
+        cpu.run_program([21, 20, 32768])
+    assert 1 == cpu.program_pointer
+
+
+def test_count_down(engine):
+    """ Test the count down loop used by the benchmarks """
+    cpu = engine()
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(TestPrograms.count_down(50))
+    assert 0 == cpu.registers.read_word(0)
+
+    # The halt raises so it is not counted
+    assert 2 + 50 * 2 + 2 == cpu.instruction_count
+
+
+def test_copy_memory(engine):
+    """ Test the memory copying loop used by the benchmarks """
+    cpu = engine()
+    program = TestPrograms.copy_memory(20, destination=100)
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(program)
+
+    for address in range(1, 21):
+        expected = program[address] if address < len(program) else 0
+        assert expected == cpu.memory.read_word(100 + address)
+
+
+def test_recurse(engine):
+    """ Test the recursive routine used by the benchmarks """
+    cpu = engine()
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(TestPrograms.recurse(depth=30, times=3))
+    assert 0 == cpu.registers.read_word(1)
+    assert 0 == len(cpu.stack)
+
+    # The first call, then a push and a call for each of the 30 levels
+    assert 61 == cpu.stack.peak_depth
+
+
+def test_execute_budget(engine):
+    """ A budget stops the run early, and running again carries on from where it stopped """
+    cpu = engine()
+    cpu.memory.load_program(TestPrograms.count_down(50))
+    cpu.clear_caches()
+
+    cpu.execute(max_instructions=20)
+    # compiled engines finish the block they are in
+    assert 20 <= cpu.instruction_count < 24
+    assert 0 < cpu.registers.read_word(0) < 50
+
+    with pytest.raises(ProgramTerminated):
+        while True:
+            cpu.execute(max_instructions=7)
+    assert 2 + 50 * 2 + 2 == cpu.instruction_count
+
+
+def test_run_statuses(engine):
+    """ run says why it stopped, and calling it again carries on from there """
+    script = ScriptedInput()
+    cpu = engine(capture_terminal_log=True, input_source=script)
+    # 0: in r0, 2: out r0, 4: halt
+    cpu.memory.load_program([20, 32768, 19, 32768, 0])
+    cpu.clear_caches()
+
+    assert (WAITING_FOR_INPUT, 0, None) == cpu.run()
+    assert 0 == cpu.program_pointer
+
+    script.feed('x')
+    assert (HALTED, 2, None) == cpu.run()
+    assert 'x' == cpu.terminal_log
+
+    # a halted program stays halted
+    assert (HALTED, 0, None) == cpu.run()
+
+    cpu = engine()
+    cpu.memory.load_program([21, 3, 32768])
+    cpu.clear_caches()
+    status, instructions, error = cpu.run()
+    assert (ERROR, 1) == (status, instructions)
+    assert isinstance(error, EmptyStackError)
+    assert 1 == cpu.program_pointer
+
+    cpu = engine()
+    cpu.memory.load_program([21, 21])
+    cpu.clear_caches()
+    assert (ENDED, 2, None) == cpu.run()
+
+
+def test_run_error_stops_on_instruction(engine):
+    """ An instruction that raises leaves the cpu on it, with everything before it done exactly once """
+    cpu = engine(capture_terminal_log=True)
+    # 0: push 5, 2: out 'A', 4: mod r0 1 0
+    cpu.memory.load_program([2, 5, 19, 65, 11, 32768, 1, 0])
+    cpu.clear_caches()
+
+    for _ in range(2):
+        status, instructions, error = cpu.run()
+        assert ERROR == status
+        assert isinstance(error, ZeroDivisionError)
+        assert (4, 2) == (cpu.program_pointer, cpu.instruction_count)
+        assert [5] == cpu.stack.values()
+        assert 'A' == cpu.terminal_log
+
+
+@pytest.mark.parametrize('program', [
+    [1, 32767, 42, 0],  # set a word that is not a register
+    [2, 32780, 0],      # push a word above the registers, which is a literal
+])
+def test_run_operands_outside_registers(engine, program):
+    """ Every engine treats words that are not register addresses exactly as the reference does """
+    results = []
+    for cpu in (CentralProcessingUnit(), engine()):
+        cpu.memory.load_program(program)
+        cpu.clear_caches()
+        status, instructions, error = cpu.run()
+        results.append((status, instructions, type(error), str(error), cpu.registers._memory.tolist(),
+                        cpu.stack.values()))
+
+    assert results[0] == results[1]
+
+
+def test_run_budget(engine):
+    """ Running in slices ends up in the same place as running it all at once """
+    cpu = engine()
+    cpu.memory.load_program(TestPrograms.count_down(50))
+    cpu.clear_caches()
+
+    statuses = []
+    while not statuses or statuses[-1] == BUDGET_EXHAUSTED:
+        statuses.append(cpu.run(max_instructions=10).status)
+    assert HALTED == statuses[-1]
+    assert len(statuses) > 5
+    assert 2 + 50 * 2 + 2 == cpu.instruction_count
+
+
+def test_run_until(engine):
+    """ run stops once 'until' holds """
+    cpu = engine()
+    cpu.memory.load_program(TestPrograms.count_down(50))
+    cpu.clear_caches()
+
+    status, instructions, error = cpu.run(until=lambda cpu: cpu.registers.read_word(0) == 30)
+    assert UNTIL == status
+    assert 30 == cpu.registers.read_word(0)
+    assert instructions == cpu.instruction_count
+
+    # it is only checked after instructions have run, so the next call makes progress
+    assert UNTIL == cpu.run(until=lambda cpu: cpu.registers.read_word(0) < 30).status
+    assert HALTED == cpu.run().status
+    assert 0 == cpu.registers.read_word(0)
+
+
+def test_from_image(engine):
+    """ cpus made from a shared image run as if the program had been loaded, without seeing each other's writes """
+    image = SharedImage(TestPrograms.copy_memory(20, destination=100))
+    cpus = [engine.from_image(image) for _ in range(2)]
+
+    assert HALTED == cpus[0].run().status
+    assert cpus[0].memory.read_word(1) == cpus[0].memory.read_word(101)
+    assert EMPTY == cpus[1].memory.read_word(101)
+
+    assert HALTED == cpus[1].run().status
+    assert cpus[0].memory._memory == cpus[1].memory._memory
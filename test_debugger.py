@@ -0,0 +1,161 @@
+from block_compiler import CompiledCentralProcessingUnit
+from central_processing_unit import HALTED, ProgramTerminated
+from debugger import BREAKPOINT, PAUSED, DebuggingCentralProcessingUnit
+from snapshot import state_hash
+from terminal_io import ScriptedInput
+from test_helpers import TestPrograms
+import pytest
+
+
+def load(program, **kwargs):
+    cpu = DebuggingCentralProcessingUnit(**kwargs)
+    cpu.memory.load_program(program)
+    cpu.clear_caches()
+    return cpu
+
+
+def test_breakpoint_callback():
+    """ The callback runs every time the breakpoint is reached and the run carries on after it """
+    cpu = load(TestPrograms.count_down(5))
+    seen = []
+    cpu.add_breakpoint(10, callback=lambda cpu, hit: seen.append(cpu.registers.read_word(0)))
+
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+
+    assert [4, 3, 2, 1, 0] == seen
+    assert [] == cpu.hits
+
+
+def test_same_as_compiled():
+    """ Breakpoints and watches that change nothing leave the run exactly as it is without them """
+    program = TestPrograms.recurse(depth=20, times=3)
+    compiled = CompiledCentralProcessingUnit()
+    with pytest.raises(ProgramTerminated):
+        compiled.run_program(program)
+
+    cpu = load(program)
+    cpu.add_breakpoint(21, callback=lambda cpu, hit: None)
+    cpu.watch_register(0, callback=lambda cpu, hit: None)
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+
+    assert state_hash(compiled) == state_hash(cpu)
+    assert compiled.instruction_count == cpu.instruction_count
+
+
+def test_condition_and_pause():
+    """ A breakpoint with no callback pauses when its condition holds, execute carries on from it """
+    cpu = load(TestPrograms.count_down(5))
+    cpu.add_breakpoint(10, condition=lambda cpu: cpu.registers.read_word(0) == 2)
+
+    cpu.execute()
+    assert 10 == cpu.program_pointer
+    assert 2 == cpu.registers.read_word(0)
+    assert BREAKPOINT == cpu.hits[0].watch.kind
+
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+    assert 0 == cpu.registers.read_word(0)
+
+
+def test_run_pauses():
+    """ run returns PAUSED on a hit and carries on from it when called again """
+    cpu = load(TestPrograms.count_down(5))
+    cpu.watch_register(0, condition=lambda cpu: cpu.registers.read_word(0) == 3)
+
+    assert PAUSED == cpu.run().status
+    assert 3 == cpu.registers.read_word(0)
+    assert HALTED == cpu.run().status
+
+
+def test_run_pauses_with_until():
+    """ A pause is reported however often 'until' is checked, even when it comes on the last instruction checked """
+    for check_every in (1, 3, 100):
+        cpu = load(TestPrograms.count_down(5))
+        cpu.watch_register(0, condition=lambda cpu: cpu.registers.read_word(0) == 3)
+
+        assert PAUSED == cpu.run(until=lambda cpu: False, check_every=check_every).status
+        assert 3 == cpu.registers.read_word(0)
+        assert (4, 3) == (cpu.hits[0].old, cpu.hits[0].new)
+        assert HALTED == cpu.run(until=lambda cpu: False, check_every=check_every).status
+
+
+def test_callback_changes_state():
+    """ A callback can change registers and the program pointer before the run carries on """
+    cpu = load(TestPrograms.count_down(1000))
+
+    def skip_loop(cpu, hit):
+        cpu.registers.write_word(0, 7)
+        cpu.program_pointer = 13
+
+    cpu.add_breakpoint(6, callback=skip_loop)
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+
+    # set r1, set r0, then the outer add and jt without going round the loop
+    assert 4 == cpu.instruction_count
+    assert 7 == cpu.registers.read_word(0)
+
+
+def test_breakpoint_set_while_compiled():
+    """ A breakpoint inside a block that is already compiled still stops the run """
+    cpu = load(TestPrograms.count_down(3, times=2))
+    cpu.add_breakpoint(3, condition=lambda cpu: cpu.registers.read_word(1) == 1)
+    cpu.execute()
+
+    cpu.add_breakpoint(10)
+    cpu.execute()
+    assert 10 == cpu.program_pointer
+    assert 2 == cpu.registers.read_word(0)
+
+
+def test_watch_memory():
+    """ A memory watch stops after the write with the old and new values """
+    cpu = load(TestPrograms.copy_memory(3, destination=100))
+    writes = []
+    cpu.watch_memory(102, callback=lambda cpu, hit: writes.append((hit.old, hit.new, cpu.program_pointer)))
+
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+
+    assert [(-1, 1, 16)] == writes
+
+
+def test_watch_register():
+    """ A register watch stops after each write, here with a condition on the value written """
+    cpu = load(TestPrograms.count_down(5))
+    cpu.watch_register(0, condition=lambda cpu: cpu.registers.read_word(0) == 3)
+
+    cpu.execute()
+    hit = cpu.hits[0]
+    assert (4, 3) == (hit.old, hit.new)
+    assert 10 == cpu.program_pointer
+
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+
+
+def test_interpreted_instructions():
+    """ Breakpoints and watches work on the instructions that are not compiled as well """
+    cpu = load([20, 32768, 0], input_source=ScriptedInput(['a']))
+    cpu.add_breakpoint(2)
+    cpu.watch_register(0)
+
+    cpu.execute()
+    assert (0, 97) == (cpu.hits[0].old, cpu.hits[0].new)
+
+    cpu.execute()
+    assert 2 == cpu.program_pointer
+    assert BREAKPOINT == cpu.hits[0].watch.kind
+
+
+def test_remove():
+    cpu = load(TestPrograms.count_down(5))
+    watch = cpu.add_breakpoint(10)
+    cpu.execute()
+    cpu.remove(watch)
+
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+    assert {} == cpu.breakpoints
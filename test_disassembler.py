@@ -0,0 +1,69 @@
+from disassembler import InstructionIndex, OutRun, decode, listing, sweep
+from memory_storage import Memory
+from test_helpers import TestPrograms
+
+
+def load(program):
+    memory = Memory()
+    memory.load_program(program)
+    return memory
+
+
+def test_decode():
+    """ Operands are split into registers and literals, and a literal jump target is picked out """
+    memory = load([7, 32768, 6, 17, 32769])
+
+    instruction = decode(memory, 0)
+    assert 7 == instruction.opcode
+    assert 0 == instruction.operands[0].register
+    assert instruction.operands[1].register is None
+    assert 6 == instruction.target
+    assert 3 == instruction.next_address
+
+    # a call through a register has no target that can be known without running it
+    assert decode(memory, 3).target is None
+
+
+def test_decode_data():
+    """ Unknown opcodes and instructions running into empty memory are data, empty memory is nothing """
+    memory = load([22, 9, 1])
+
+    assert decode(memory, 0).opcode is None
+    assert 22 == decode(memory, 0).operands[0].literal
+    assert decode(memory, 1).opcode is None
+    assert decode(memory, 5) is None
+
+
+def test_sweep_is_lazy():
+    """ The sweep yields as it goes instead of decoding all of memory up front """
+    instructions = sweep(load(TestPrograms.count_down(5)))
+
+    assert 0 == next(instructions).address
+    assert 3 == next(instructions).address
+
+
+def test_listing():
+    """ Back to back literal outs are listed as one string """
+    program = [19, 104, 19, 105, 19, 32768, 19, 10, 0]
+
+    assert [
+        "    0: out 'hi'",
+        "    4: out r0",
+        "    6: out '\\n'",
+        "    8: halt",
+    ] == list(listing(load(program)))
+
+
+def test_index():
+    """ The index knows every instruction, who jumps where and which addresses are routines """
+    index = InstructionIndex(load(TestPrograms.recurse(depth=3, times=1) + [19, 111, 19, 107]))
+
+    assert 16 in index
+    assert [6, 25] == index.referrers[16]
+    assert {16} == index.routines
+    assert [OutRun(30, 'ok', 34)] == index.strings
+    # the outs in a string are indexed as instructions as well
+    assert 19 == index.get(32).opcode
+    assert [34] == index.successors(32)
+    assert [19, 29] == index.successors(16)
+    assert [] == index.successors(29)
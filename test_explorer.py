@@ -0,0 +1,61 @@
+from explorer import CHALLENGE_INPUT_BUFFER, CODE, DFS, ROOM, Explorer, commands_for
+import pytest
+
+ROOM_OUTPUT = """== Moss cavern ==
+Whatever it was, it was too high to reach.
+
+Things of interest here:
+- empty lantern
+
+There are 2 exits:
+- west
+- east
+
+What do you do?
+"""
+
+
+def explorer(**kwargs):
+    return Explorer.from_program('challenge.bin', from_file=True, ignore=[CHALLENGE_INPUT_BUFFER], **kwargs)
+
+
+def test_commands_for():
+    """ Every exit and thing listed is turned into a command, and everything held into a use """
+    assert ['take empty lantern', 'go west', 'go east'] == commands_for(ROOM_OUTPUT)
+    assert ['use tablet'] == commands_for("Your inventory:\n- tablet\n")
+    assert [] == commands_for("Taken.\n")
+
+
+def test_explore_challenge():
+    """ The first few commands reach the cave and the code on the tablet, without trying the same state twice """
+    explore = explorer(max_workers=1)
+    found = list(explore.explore(max_depth=3))
+
+    assert ('take tablet', 'use tablet') == explore.codes['zcLcpEJylerq']
+    assert ('go doorway',) == explore.rooms['Dark cave']
+    assert {ROOM, CODE} == {kind for kind, value, path in found}
+    # going south and back leaves the game as it was, which is not counted again
+    assert len(explore.seen) < 20
+
+
+def test_explore_in_parallel():
+    """ Spreading the frontier across processes reaches the same states """
+    alone = explorer(max_workers=1)
+    list(alone.explore(max_depth=2))
+
+    parallel = explorer(max_workers=2, order=DFS)
+    list(parallel.explore(max_depth=2))
+
+    assert alone.seen == parallel.seen
+    assert alone.rooms.keys() == parallel.rooms.keys()
+    assert alone.codes.keys() == parallel.codes.keys()
+
+
+def test_max_states():
+    """ Exploring stops once enough states have been reached """
+    explore = explorer(max_workers=1)
+    list(explore.explore(max_states=5))
+    assert 5 == len(explore.seen)
+
+    with pytest.raises(ValueError):
+        explorer(order='sideways')
@@ -0,0 +1,39 @@
+from central_processing_unit import CentralProcessingUnit, NoCommandError
+from fast_processing_unit import FastCentralProcessingUnit
+import io
+import pytest
+
+
+def run_until_input(cpu, monkeypatch):
+    """ Runs the challenge binary until it asks for input that never comes """
+    monkeypatch.setattr('sys.stdin', io.StringIO(''))
+    with pytest.raises(EOFError):
+        cpu.run_program('challenge.bin', from_file=True)
+
+
+def test_matches_reference_on_challenge(monkeypatch):
+    """ Both engines should reach the first prompt of the challenge in exactly the same state """
+    reference = CentralProcessingUnit(capture_terminal_log=True)
+    run_until_input(reference, monkeypatch)
+
+    fast = FastCentralProcessingUnit(capture_terminal_log=True)
+    run_until_input(fast, monkeypatch)
+
+    assert 'self-test complete' in fast.terminal_log
+    assert reference.terminal_log == fast.terminal_log
+    assert reference.program_pointer == fast.program_pointer
+    assert reference.instruction_count == fast.instruction_count
+    assert reference.registers._memory == fast.registers._memory
+    assert reference.memory._memory == fast.memory._memory
+    assert reference.stack.values() == fast.stack.values()
+    assert reference.stack.peak_depth == fast.stack.peak_depth
+
+
+def test_state_written_back_on_error():
+    """ The program pointer and stack are written back to the CPU when the loop raises """
+    cpu = FastCentralProcessingUnit()
+    with pytest.raises(NoCommandError):
+        cpu.run_program([2, 7, 22])
+
+    assert 2 == cpu.program_pointer
+    assert 7 == cpu.stack.pop()
@@ -18,3 +18,72 @@ class TestPrograms(object):
     def print_rand_char():
         c = randint(97, 122)
         return [19, c]
+
+    @staticmethod
+    def count_down(n, times=1):
+        """ 'times' over, a tight loop that counts register 0 down from 'n' to 0, then halts """
+        return [
+            1, 32769, times,            # 0: set r1 times
+            1, 32768, n,                # 3: set r0 n
+            9, 32768, 32768, 32767,     # 6: add r0 r0 -1
+            7, 32768, 6,                # 10: jt r0 6
+            9, 32769, 32769, 32767,     # 13: add r1 r1 -1
+            7, 32769, 3,                # 17: jt r1 3
+            0,                          # 20: halt
+        ]
+
+    @staticmethod
+    def copy_memory(n, times=1, destination=10000):
+        """ 'times' over, copies the words at addresses n..1 to 'destination' + n..1 with rmem and wmem, then halts """
+        return [
+            1, 32771, times,                    # 0: set r3 times
+            1, 32768, n,                        # 3: set r0 n
+            15, 32769, 32768,                   # 6: rmem r1 r0
+            9, 32770, 32768, destination,       # 9: add r2 r0 destination
+            16, 32770, 32769,                   # 13: wmem r2 r1
+            9, 32768, 32768, 32767,             # 16: add r0 r0 -1
+            7, 32768, 6,                        # 20: jt r0 6
+            9, 32771, 32771, 32767,             # 23: add r3 r3 -1
+            7, 32771, 3,                        # 27: jt r3 3
+            0,                                  # 30: halt
+        ]
+
+    @staticmethod
+    def recurse(depth, times):
+        """ 'times' over, calls a routine that recurses 'depth' levels deep pushing and popping as it goes """
+        return [
+            1, 32769, times,            # 0: set r1 times
+            1, 32768, depth,            # 3: set r0 depth
+            17, 16,                     # 6: call 16
+            9, 32769, 32769, 32767,     # 8: add r1 r1 -1
+            7, 32769, 3,                # 12: jt r1 3
+            0,                          # 15: halt
+            8, 32768, 29,               # 16: jf r0 29
+            2, 32768,                   # 19: push r0
+            9, 32768, 32768, 32767,     # 21: add r0 r0 -1
+            17, 16,                     # 25: call 16
+            3, 32768,                   # 27: pop r0
+            18,                         # 29: ret
+        ]
+
+    @staticmethod
+    def fibonacci(n):
+        """ leaves fibonacci number 'n' in register 0, worked out by a routine that calls itself twice, then halts """
+        return [
+            1, 32768, n,                # 0: set r0 n
+            17, 6,                      # 3: call 6
+            0,                          # 5: halt
+            5, 32769, 32768, 1,         # 6: gt r1 r0 1
+            7, 32769, 14,               # 10: jt r1 14
+            18,                         # 13: ret
+            2, 32768,                   # 14: push r0
+            9, 32768, 32768, 32767,     # 16: add r0 r0 -1
+            17, 6,                      # 20: call 6
+            3, 32769,                   # 22: pop r1
+            2, 32768,                   # 24: push r0
+            9, 32768, 32769, 32766,     # 26: add r0 r1 -2
+            17, 6,                      # 30: call 6
+            3, 32769,                   # 32: pop r1
+            9, 32768, 32768, 32769,     # 34: add r0 r0 r1
+            18,                         # 38: ret
+        ]
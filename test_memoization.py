@@ -0,0 +1,108 @@
+from central_processing_unit import CentralProcessingUnit, ProgramTerminated
+from memoization import LRUCache, MemoizingCentralProcessingUnit, analyse_routine
+from memory_storage import Memory
+from snapshot import state_hash
+from test_helpers import TestPrograms
+import pytest
+
+
+def load(program):
+    memory = Memory()
+    memory.load_program(program)
+    return memory
+
+
+def run(cpu, program):
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(program)
+    return cpu
+
+
+def test_analyse_recursive_routine():
+    """ A routine that calls itself is pure, reading only the registers it needs before writing them """
+    routine = analyse_routine(load(TestPrograms.fibonacci(10)), 6)
+
+    assert (0,) == routine.inputs
+    assert (0, 1) == routine.outputs
+    assert 6 in routine.addresses and 38 in routine.addresses and 5 not in routine.addresses
+
+
+def test_analyse_partly_written_output():
+    """ An output that is only written on some paths keeps the caller's value on the others, so it is an input """
+    # 0: jf r0 7, 3: set r1 5, 6: ret, 7: ret
+    routine = analyse_routine(load([8, 32768, 7, 1, 32769, 5, 18, 18]), 0)
+
+    assert (0, 1) == routine.inputs
+    assert (1,) == routine.outputs
+
+
+@pytest.mark.parametrize('program', [
+    [16, 100, 32768, 18],           # wmem
+    [15, 32768, 100, 18],           # rmem
+    [19, 97, 18],                   # out
+    [20, 32768, 18],                # in
+    [6, 32768],                     # jump to a register
+    [3, 32768, 18],                 # pop what the caller pushed
+    [2, 32768, 18],                 # return with something left on the stack
+    [17, 4, 18, 0, 19, 97, 18],     # call an impure routine
+])
+def test_analyse_impure(program):
+    """ Routines that touch memory, do i/o, jump somewhere unknown or unbalance the stack are not pure """
+    assert analyse_routine(load(program), 0) is None
+
+
+def test_same_result():
+    """ Memoized calls end in exactly the same state as running them """
+    program = TestPrograms.fibonacci(18)
+    reference = run(CentralProcessingUnit(), program)
+    memoizing = run(MemoizingCentralProcessingUnit(), program)
+
+    assert 2584 == memoizing.registers.read_word(0)
+    assert state_hash(reference) == state_hash(memoizing)
+    assert memoizing.hits > 0
+    assert memoizing.instruction_count < reference.instruction_count
+
+
+def test_declared_routine():
+    """ A routine declared pure is memoized without being analysed """
+    cpu = run(MemoizingCentralProcessingUnit(pure_routines={6: ((0,), (0, 1))}, detect=False),
+              TestPrograms.fibonacci(18))
+
+    assert 2584 == cpu.registers.read_word(0)
+    assert cpu.hits > 0
+    assert {} == cpu.analysed_routines
+
+
+def test_not_memoized_without_detect():
+    """ Without detection only declared routines are memoized """
+    cpu = run(MemoizingCentralProcessingUnit(detect=False), TestPrograms.fibonacci(10))
+
+    assert 55 == cpu.registers.read_word(0)
+    assert 0 == cpu.hits == cpu.misses
+
+
+def test_write_to_routine_forgets_it():
+    """ Rewriting the code of an analysed routine drops what was known about it """
+    cpu = run(MemoizingCentralProcessingUnit(), TestPrograms.fibonacci(5))
+    assert 6 in cpu.routine_code
+
+    cpu.write_memory(100, 1)
+    assert cpu.analysed_routines
+
+    cpu.write_memory(6, 5)
+    assert not cpu.analysed_routines
+    assert 0 == len(cpu.results)
+
+
+def test_lru_cache():
+    """ The least recently used result is dropped first """
+    cache = LRUCache(size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert 1 == cache.get('a')
+    assert cache.get('b') is None
+    assert 3 == cache.get('c')
+    assert 2 == len(cache)
@@ -0,0 +1,69 @@
+from central_processing_unit import CentralProcessingUnit
+from fast_processing_unit import FastCentralProcessingUnit
+from memory_storage import EMPTY
+from terminal_io import NullOutput, ScriptedInput
+import pytest
+
+np = pytest.importorskip('numpy')
+from memory_search import (MachineState, Search, diff, find_sequence, find_strings, find_text, find_value,
+                           string_tables)
+
+
+def state_of(program):
+    cpu = CentralProcessingUnit()
+    cpu.memory.load_program(program)
+    return MachineState.from_cpu(cpu)
+
+
+def test_find():
+    """ Values, runs of words and text are found wherever they are """
+    state = state_of([7, 104, 105, 7, 0, 7, 104, 105])
+    assert [0, 3, 5] == find_value(state, 7).tolist()
+    assert [0, 5] == find_sequence(state, [7, 104]).tolist()
+    assert [1, 6] == find_text(state, 'hi').tolist()
+    assert [] == find_text(state, 'hii').tolist()
+    assert 32768 - 8 == len(find_value(state, EMPTY))
+
+
+def test_find_strings():
+    """ Length prefixed strings are found, and those back to back grouped into tables """
+    state = state_of([1, 3, 97, 98, 99, 2, 104, 105, 0, 4, 119, 104, 97, 116, 5, 33])
+    strings = find_strings(state, min_length=2)
+    assert [(1, 'abc'), (5, 'hi'), (9, 'what')] == strings
+    assert [strings[:2]] == string_tables(strings)
+
+
+def test_snapshots_and_diff():
+    """ Snapshots load in order, delta snapshots on top of the one before """
+    cpu = CentralProcessingUnit()
+    cpu.memory.load_program([1, 2, 3])
+    snapshots = [cpu.save_state()]
+    cpu.write_memory(1, 9)
+    snapshots.append(cpu.save_delta())
+
+    before, after = MachineState.from_snapshots(snapshots)
+    addresses, old, new = diff(before, after)
+    assert ([1], [2], [9]) == (addresses.tolist(), old.tolist(), new.tolist())
+
+
+def test_search_challenge():
+    """ Taking and dropping the tablet narrows the search down to where the game keeps its location """
+    script = ScriptedInput()
+    cpu = FastCentralProcessingUnit(output=NullOutput(), input_source=script)
+    cpu.memory.load_program('challenge.bin', from_file=True)
+    cpu.clear_caches()
+    cpu.run()
+
+    search = Search(MachineState.from_cpu(cpu))
+    for command in ['take tablet', 'drop tablet']:
+        script.feed([command])
+        cpu.run()
+        search.add(MachineState.from_cpu(cpu)).changed()
+
+    assert 2670 in search.addresses
+    assert len(search) < 10
+
+    # after the self-test the game's text sits in memory as tables of length prefixed strings
+    strings = find_strings(search.states[-1])
+    assert 'Foothills' in [string.text for string in strings]
+    assert max(len(table) for table in string_tables(strings)) > 100
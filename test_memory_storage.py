@@ -1,5 +1,5 @@
 import pytest
-from memory_storage import Memory, Registers, Stack
+from memory_storage import EMPTY, EmptyStackError, Memory, Registers, SharedImage, Stack
 from random import randint
 
 
@@ -59,6 +59,31 @@ def test_memory_write_to_out_of_range():
         memory.write_to(address, 655358)
 
 
+def test_memory_words():
+    """ test the plain int read_word / write_word methods """
+    memory = Memory()
+
+    # A word written to memory should be returned as a plain int
+    address = randint(0, 32766)
+    value = randint(0, 65535)
+    memory.write_word(address, value)
+    assert value == memory.read_word(address)
+    assert value == memory.read_from(address).value
+
+    # An address that was never written holds EMPTY
+    assert EMPTY == memory.read_word(address + 1)
+
+    # Negative addresses must not wrap around to the end of the buffer
+    with pytest.raises(IndexError):
+        memory.read_word(-1)
+
+    with pytest.raises(IndexError):
+        memory.write_word(-1, 5)
+
+    with pytest.raises(IndexError):
+        memory.write_word(address, 65536)
+
+
 def test_registers_read_from():
     """ test the registers read_from method """
     registers = Registers()
@@ -139,19 +164,24 @@ def test_stack():
     """ Tests the stack memory model """
     stack = Stack()
 
-    # Assert that an empty stack returns None
-    assert stack.pop() is None
+    # Assert that popping an empty stack is an error
+    with pytest.raises(EmptyStackError):
+        stack.pop()
 
     # Assert that values pushed onto a stack are popped in reverse order
-    values = [randint(0, 65535) in range(5)]
+    values = [randint(0, 65535) for _ in range(5)]
     for value in values:
         stack.push(value)
 
+    assert values == stack.values()
     for value in values[::-1]:
-        assert value == stack.pop().value
+        assert value == stack.pop()
 
-    # Assert stack is empty now
-    assert stack.pop() is None
+    # Assert stack is empty now, having been 5 deep at most
+    assert 0 == len(stack)
+    assert 5 == stack.peak_depth
+    with pytest.raises(EmptyStackError):
+        stack.pop()
 
     # Assert pushing onto stack with out of range values fails with ValueError
     with pytest.raises(ValueError):
@@ -159,3 +189,95 @@ def test_stack():
 
     with pytest.raises(ValueError):
         stack.push(70000)
+
+
+def test_stack_replace():
+    """ Replacing the whole stack keeps the deepest it has been """
+    stack = Stack()
+    stack.replace([1, 2, 3])
+    stack.replace([4])
+
+    assert [4] == stack.values()
+    assert 3 == stack.peak_depth
+
+
+def test_memory_load_image():
+    """ Test loading a little-endian binary image in bulk """
+    memory = Memory()
+
+    values = [randint(0, 32775) for _ in range(5)]
+    image = b''.join(value.to_bytes(length=2, byteorder='little') for value in values)
+    memory.load_program(image)
+
+    assert len(values) == memory.occupied_memory_addresses
+    for address, value in enumerate(values):
+        assert value == memory.read_word(address)
+    assert EMPTY == memory.read_word(len(values))
+
+    # Values 32776..65535 are invalid in a program and nothing should be loaded
+    memory = Memory()
+    with pytest.raises(IndexError):
+        memory.load_program(image + (32776).to_bytes(length=2, byteorder='little'))
+    assert EMPTY == memory.read_word(0)
+
+
+def test_memory_load_challenge_file():
+    """ Test that the challenge binary loads word for word """
+    memory = Memory()
+    memory.load_program('challenge.bin', from_file=True)
+
+    with open('challenge.bin', 'rb') as f:
+        data = f.read()
+
+    assert len(data) // 2 == memory.occupied_memory_addresses
+    assert int.from_bytes(data[:2], 'little') == memory.read_word(0)
+    assert int.from_bytes(data[-2:], 'little') == memory.read_word(len(data) // 2 - 1)
+
+
+def test_shared_image():
+    """ Memories mapped from one image start out with it and only see their own writes """
+    image = SharedImage([9, 32768, 1, 2])
+    first = Memory()
+    first.load_shared(image)
+    # or made from it to begin with
+    second = Memory(image)
+
+    assert 4 == first.occupied_memory_addresses
+    assert [9, 32768, 1, 2, EMPTY] == [first.read_word(address) for address in range(5)]
+
+    first.write_word(1, 7)
+    first.write_word(30000, 5)
+    assert 7 == first.read_word(1)
+    assert 32768 == second.read_word(1)
+    assert EMPTY == second.read_word(30000)
+
+    # later memories still get the image as it was loaded
+    third = Memory(image)
+    assert 32768 == third.read_word(1)
+
+    image.close()
+    assert 7 == first.read_word(1)
+
+    with pytest.raises(IndexError):
+        SharedImage((32776).to_bytes(length=2, byteorder='little'))
+
+
+def test_memory_pages_written():
+    """ Pages written after a mark are listed, whichever mark is asked about """
+    memory = Memory()
+    first = memory.mark()
+    assert [] == memory.pages_written_since(first)
+
+    memory.write_word(300, 1)
+    second = memory.mark()
+    memory.write_word(32767, 2)
+
+    assert [1, 127] == memory.pages_written_since(first)
+    assert [127] == memory.pages_written_since(second)
+    assert 1 == memory.read_page(1)[300 - 256]
+
+    # loading a whole image replaces every page
+    memory.load_program([1, 2])
+    assert [0, 127] == memory.pages_written_since(second)
+    memory.load_program(b'\x01\x00')
+    assert list(range(Memory.PAGES)) == memory.pages_written_since(second)
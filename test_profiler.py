@@ -0,0 +1,71 @@
+from central_processing_unit import HALTED, WAITING_FOR_INPUT, ProgramTerminated
+from profiler import ProfilingCentralProcessingUnit
+from terminal_io import ScriptedInput
+import json
+import pytest
+
+
+def run_profiled(program):
+    cpu = ProfilingCentralProcessingUnit()
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(program)
+    return cpu.profile
+
+
+# 0: call 6, 2: call 6, 4: halt, 6: add r0 r0 1, 10: call 13, 12: ret, 13: noop, 14: ret
+CALLING_PROGRAM = [17, 6, 17, 6, 0, 0, 9, 32768, 32768, 1, 17, 13, 18, 21, 18]
+
+
+def test_counts():
+    """ Every instruction run is counted by opcode and by address """
+    profile = run_profiled(CALLING_PROGRAM)
+
+    # the halt stops the program rather than running, so it is not counted, as on the cpu
+    assert 12 == profile.instructions
+    assert 2 == profile.address_hits[6]
+    assert 0 == profile.address_hits[4]
+    assert 0 == profile.address_hits[5]
+    assert 4 == profile.opcode_counts[17]
+    assert 4 == profile.opcode_counts[18]
+
+
+def test_counts_match_cpu():
+    """ An 'in' that waits for input is only counted once it runs, however many times it is retried """
+    script = ScriptedInput()
+    cpu = ProfilingCentralProcessingUnit(input_source=script)
+    cpu.memory.load_program([20, 32768, 0])
+    cpu.clear_caches()
+
+    assert WAITING_FOR_INPUT == cpu.run().status
+    assert WAITING_FOR_INPUT == cpu.run().status
+    assert 0 == cpu.profile.instructions
+
+    script.feed('x')
+    assert HALTED == cpu.run().status
+    assert 1 == cpu.instruction_count == cpu.profile.instructions
+    assert 1 == cpu.profile.address_hits[0]
+
+
+def test_routines():
+    """ Calls are paired with their rets, counting every instruction run until the ret """
+    profile = run_profiled(CALLING_PROGRAM)
+
+    # Each call to 6 runs add, call, noop, ret and its own ret
+    assert [2, 10] == profile.routines[6]
+    assert [2, 4] == profile.routines[13]
+
+    report = json.loads(json.dumps(profile.report()))
+    assert 6 == report['routines'][0]['address']
+    assert 12 == report['instructions']
+
+
+def test_folded_stacks(tmpdir):
+    """ Instructions are charged to the call stack that ran them """
+    profile = run_profiled(CALLING_PROGRAM)
+
+    file_name = str(tmpdir.join('profile.folded'))
+    profile.write_folded(file_name)
+    with open(file_name) as f:
+        lines = f.read().splitlines()
+
+    assert ['main 2', 'main;sub_6 6', 'main;sub_6;sub_13 4'] == lines
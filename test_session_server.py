@@ -0,0 +1,66 @@
+from session_server import SessionServer
+import asyncio
+import time
+
+# 0: in r0, 2: out r0, 4: set r1 ..., 7: add r1 r1 -1, 11: jt r1 7, 14: jmp 0
+# echoes each character, then counts r1 down before reading the next one
+def echo_program(busy=1):
+    return [20, 32768, 19, 32768, 1, 32769, busy, 9, 32769, 32769, 32767, 7, 32769, 7, 6, 0]
+
+
+async def talk(port, text, expected_length):
+    """ sends 'text', returns what comes back once there is 'expected_length' of it and when it arrived """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(text.encode('ascii'))
+    await writer.drain()
+
+    received = await asyncio.wait_for(reader.readexactly(expected_length), timeout=30)
+    arrived = time.perf_counter()
+    writer.close()
+    await writer.wait_closed()
+    return received.decode('ascii'), arrived
+
+
+def serve_and(session_server, *conversations):
+    """ runs 'conversations' against 'session_server' at once, returns their results """
+    async def run():
+        server = await session_server.start_tcp()
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            results = await asyncio.gather(*(talk(port, *conversation) for conversation in conversations))
+            await session_server.shutdown()
+            return results
+
+    return asyncio.run(run())
+
+
+def test_echo():
+    """ Input comes from the connection and output goes back to it """
+    [(received, arrived)] = serve_and(SessionServer(echo_program()), ('hi\n', 3))
+    assert 'hi\n' == received
+
+
+def test_sessions_share_the_process():
+    """ A session that keeps running does not hold up the others """
+    session_server = SessionServer(echo_program(busy=30000), slice_size=1000)
+    (slow, slow_arrived), (quick, quick_arrived) = serve_and(session_server, ('abc\n', 4), ('d\n', 1))
+
+    assert 'abc\n' == slow
+    assert 'd' == quick
+    assert quick_arrived < slow_arrived
+
+
+def test_session_ends():
+    """ A program that halts closes the connection with its output sent """
+    async def run():
+        session_server = SessionServer([19, 111, 19, 107, 0])
+        server = await session_server.start_tcp()
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            received = await asyncio.wait_for(reader.read(), timeout=30)
+            writer.close()
+            await session_server.shutdown()
+            return received, session_server.sessions
+
+    assert (b'ok', {}) == asyncio.run(run())
@@ -0,0 +1,109 @@
+from central_processing_unit import CentralProcessingUnit
+from engines import ENGINES
+import io
+import pytest
+import snapshot
+
+
+def test_round_trip():
+    """ A restored cpu should hold exactly the state that was saved """
+    cpu = CentralProcessingUnit()
+    cpu.memory.load_program([9, 32768, 32769, 4, 19, 32768])
+    cpu.registers.write_word(1, 65)
+    cpu.stack.push(7)
+    cpu.stack.push(65535)
+    cpu.pending_input = 'go north\n'
+    cpu.program_pointer = 4
+
+    data = cpu.save_state()
+    restored = CentralProcessingUnit()
+    restored.load_state(data)
+
+    assert cpu.memory._memory == restored.memory._memory
+    assert cpu.memory.occupied_memory_addresses == restored.memory.occupied_memory_addresses
+    assert cpu.registers._memory == restored.registers._memory
+    assert [7, 65535] == restored.stack.values()
+    assert 'go north\n' == restored.pending_input
+    assert 4 == restored.program_pointer
+    assert cpu.memory.origin == restored.memory.origin
+
+    # Mostly empty memory compresses well
+    assert len(data) < 1024
+
+    # a version 1 snapshot, from before the origin was kept, loads without one
+    old = bytearray(data[:4]) + (1).to_bytes(length=2, byteorder='little') + data[6 + 16:]
+    restored = CentralProcessingUnit()
+    restored.load_state(bytes(old))
+    assert cpu.memory._memory == restored.memory._memory
+    assert restored.memory.origin is None
+
+
+def test_resume_on_every_engine(monkeypatch, tmpdir):
+    """ A snapshot taken at the first prompt of the challenge can be resumed by any engine """
+    cpu = ENGINES['fast']()
+    monkeypatch.setattr('sys.stdin', io.StringIO(''))
+    with pytest.raises(EOFError):
+        cpu.run_program('challenge.bin', from_file=True)
+
+    file_name = str(tmpdir.join('state.bin'))
+    cpu.save_state(file_name)
+
+    for engine in ENGINES.values():
+        restored = engine(capture_terminal_log=True)
+        restored.load_state(file_name=file_name)
+
+        monkeypatch.setattr('sys.stdin', io.StringIO('look\n'))
+        with pytest.raises(EOFError):
+            restored.execute()
+        assert 'Foothills' in restored.terminal_log
+
+
+def test_invalid_snapshots():
+    """ Snapshots from an unknown version, or that are cut short, are rejected """
+    data = CentralProcessingUnit().save_state()
+    cpu = CentralProcessingUnit()
+
+    with pytest.raises(ValueError):
+        cpu.load_state(data[:-1])
+
+    with pytest.raises(ValueError):
+        cpu.load_state(b'NOPE' + data[4:])
+
+    newer = bytearray(data)
+    newer[4:6] = (snapshot.VERSION + 1).to_bytes(length=2, byteorder='little')
+    with pytest.raises(ValueError):
+        cpu.load_state(bytes(newer))
+
+
+def test_delta():
+    """ A delta holds only the pages written since its parent and loads on top of the parent's state """
+    cpu = CentralProcessingUnit()
+    cpu.memory.load_program([9, 32768, 32769, 4, 19, 32768])
+    parent = cpu.save_state()
+
+    cpu.write_memory(3, 5)
+    cpu.write_memory(20000, 7)
+    cpu.stack.push(9)
+    cpu.pending_input = 'north\n'
+    cpu.program_pointer = 4
+    delta = cpu.save_delta()
+    assert [0, 20000 >> 8] == snapshot.delta_pages(delta)
+    assert len(delta) < 256
+
+    restored = CentralProcessingUnit()
+    restored.load_state(parent)
+    restored.load_state(delta)
+    assert snapshot.state_hash(cpu) == snapshot.state_hash(restored)
+
+    # deltas chain, each against the one before
+    cpu.write_memory(3, 6)
+    second = cpu.save_delta()
+    restored.load_state(second)
+    assert snapshot.state_hash(cpu) == snapshot.state_hash(restored)
+    assert [0] == snapshot.delta_pages(second)
+
+    # a delta only loads into a cpu in its parent's state
+    with pytest.raises(ValueError):
+        restored.load_state(delta)
+    with pytest.raises(ValueError):
+        CentralProcessingUnit().save_delta()
@@ -0,0 +1,107 @@
+from central_processing_unit import CentralProcessingUnit, InputExhausted, ProgramTerminated
+from engines import ENGINES
+from terminal_io import CaptureOutput, RingBufferOutput, ScriptedInput, TerminalOutput
+import io
+import pytest
+
+
+def test_terminal_output_flushes_on_newline():
+    """ Characters are only written to the stream a line at a time, or when flushed """
+    stream = io.StringIO()
+    output = TerminalOutput(stream)
+
+    for ascii_char in 'ab\ncd':
+        output.write(ascii_char)
+    assert 'ab\n' == stream.getvalue()
+
+    output.flush()
+    assert 'ab\ncd' == stream.getvalue()
+
+
+def test_output_flushed_on_halt():
+    """ Anything still buffered is written when the program halts """
+    stream = io.StringIO()
+    cpu = CentralProcessingUnit(output=TerminalOutput(stream))
+
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program([19, 104, 19, 105, 0])
+    assert 'hi' == stream.getvalue()
+
+
+def test_output_flushed_before_input(monkeypatch):
+    """ A prompt is written out before the program waits for input """
+    stream = io.StringIO()
+    cpu = CentralProcessingUnit(output=TerminalOutput(stream))
+
+    def read_line():
+        assert '>' == stream.getvalue()
+        return 'x\n'
+    monkeypatch.setattr('sys.stdin', io.StringIO())
+    monkeypatch.setattr('sys.stdin.readline', read_line)
+
+    cpu.run_program([19, 62, 20, 32768])
+    assert ord('x') == cpu.registers.read_word(0)
+
+
+def test_capture_output():
+    """ Captured output can be read back at any point """
+    output = CaptureOutput()
+    for ascii_char in 'abc':
+        output.write(ascii_char)
+    assert 'abc' == output.getvalue()
+
+    output.write('d')
+    assert 'abcd' == output.getvalue()
+
+
+def test_ring_buffer_output():
+    """ Only the most recent characters are kept """
+    output = RingBufferOutput(size=3)
+    for ascii_char in 'abcde':
+        output.write(ascii_char)
+    assert 'cde' == output.getvalue()
+
+    cpu = CentralProcessingUnit(output=RingBufferOutput(size=2))
+    cpu.run_program([19, 97, 19, 98, 19, 99])
+    assert 'bc' == cpu.output.getvalue()
+
+
+def test_scripted_input():
+    """ Lines come out in order, always ending in a newline, and more can be fed in once they run out """
+    script = ScriptedInput(iter(['look', 'take tablet\n']))
+    assert 'look\n' == script.readline()
+    assert 'take tablet\n' == script.readline()
+    assert '' == script.readline()
+
+    script.feed('north')
+    assert 'north\n' == script.readline()
+    assert '' == script.readline()
+
+
+def test_scripted_input_from_file(tmpdir):
+    """ A script file is read a line at a time """
+    script_file = tmpdir.join('script.txt')
+    script_file.write('look\nnorth\n')
+
+    script = ScriptedInput.from_file(str(script_file))
+    assert 'look\n' == script.readline()
+    assert 'north\n' == script.readline()
+    assert '' == script.readline()
+
+
+@pytest.mark.parametrize('engine_name', sorted(ENGINES))
+def test_input_exhausted_and_resumed(engine_name, monkeypatch):
+    """ Running out of scripted input stops at the 'in', feeding more lets the program carry on """
+    # Fail if anything tries to read from the terminal
+    monkeypatch.setattr('sys.stdin', None)
+
+    script = ScriptedInput(['a'])
+    cpu = ENGINES[engine_name](input_source=script)
+    with pytest.raises(InputExhausted):
+        cpu.run_program([20, 32768, 20, 32769, 20, 32770])
+    assert 4 == cpu.program_pointer
+
+    script.feed('b')
+    cpu.execute()
+    assert [ord('a'), ord('\n'), ord('b')] == list(cpu.registers._memory[:3])
+    assert '\n' == cpu.pending_input
@@ -0,0 +1,98 @@
+from central_processing_unit import CentralProcessingUnit, HALTED, WAITING_FOR_INPUT
+from memory_storage import EMPTY
+from snapshot import state_hash
+from terminal_io import ScriptedInput
+from test_helpers import TestPrograms
+from time_travel import Recorder, Replay
+import pytest
+
+# 0: in r0, 2: out r0, 4: set r1 50, 7: add r1 r1 -1, 11: jt r1 7, 14: jmp 0
+# echoes each character, then counts r1 down before reading the next one
+ECHO = [20, 32768, 19, 32768, 1, 32769, 50, 9, 32769, 32769, 32767, 7, 32769, 7, 6, 0]
+
+
+def record(program, lines=(), interval=100, full_every=3):
+    cpu = CentralProcessingUnit(capture_terminal_log=True, input_source=ScriptedInput(lines))
+    cpu.memory.load_program(program)
+    cpu.clear_caches()
+    recorder = Recorder(cpu, interval, full_every)
+    return cpu, recorder
+
+
+def test_record_and_seek():
+    """ Seeking to any instruction count gives the state the recorded run was in at that count """
+    cpu, recorder = record(TestPrograms.count_down(200), interval=64)
+
+    # the state after every instruction, recorded the slow way
+    states = [state_hash(cpu)]
+    while True:
+        result = recorder.run(max_instructions=1)
+        states.append(state_hash(cpu))
+        if result.status == HALTED:
+            break
+    assert len(recorder.recording.checkpoints) == 1 + (len(states) - 2) // 64
+
+    replay = Replay(recorder.recording)
+    for instruction_count in [300, 5, 64, 63, 401, 0, 200, 199]:
+        replay.seek(instruction_count)
+        assert instruction_count == replay.cpu.instruction_count
+        assert states[instruction_count] == state_hash(replay.cpu)
+
+    replay.step_back(10)
+    assert 189 == replay.cpu.instruction_count
+    assert states[189] == state_hash(replay.cpu)
+
+
+def test_replays_input():
+    """ Only the lines read are logged, and replaying them repeats the run """
+    cpu, recorder = record(ECHO, ['ab\n'])
+    assert WAITING_FOR_INPUT == recorder.run().status
+    cpu.input_source.source.feed(['cd\n'])
+    assert WAITING_FOR_INPUT == recorder.run().status
+    assert ['ab\n', 'cd\n'] == recorder.recording.lines
+    end = cpu.instruction_count
+
+    replay = Replay(recorder.recording)
+    assert WAITING_FOR_INPUT == replay.seek(end + 1000).status
+    assert end == replay.cpu.instruction_count
+    assert state_hash(cpu) == state_hash(replay.cpu)
+
+    # back to the middle of the first line, where the rest of it is still waiting to be read
+    checkpoint = recorder.recording.checkpoints[1]
+    replay.seek(checkpoint.instruction_count + 3)
+    assert 'cd\n' == replay.cpu.input_source.readline()
+
+
+def test_find_last():
+    """ find_last goes back to the last time a condition held """
+    cpu, recorder = record(ECHO, ['abcd\n'])
+    recorder.run()
+
+    replay = Replay(recorder.recording)
+    replay.seek(cpu.instruction_count)
+    found = replay.find_last(lambda cpu: cpu.registers.read_word(0) == ord('b'))
+    # the 'in' that read 'c' is the next one
+    assert ord('b') == replay.cpu.registers.read_word(0)
+    assert found == replay.cpu.instruction_count
+    replay.seek(found + 1)
+    assert ord('c') == replay.cpu.registers.read_word(0)
+
+    replay.seek(cpu.instruction_count)
+    assert replay.find_last(lambda cpu: cpu.registers.read_word(0) == ord('z')) is None
+    assert cpu.instruction_count == replay.cpu.instruction_count
+
+    with pytest.raises(ValueError):
+        replay.seek(-1)
+
+
+def test_changes():
+    """ changes lists the words that differ between two instruction counts """
+    program = TestPrograms.copy_memory(20, destination=20000)
+    cpu, recorder = record(program, interval=16)
+    recorder.run()
+    assert len(recorder.recording.checkpoints) > 6
+
+    replay = Replay(recorder.recording)
+    changes = replay.changes(0, cpu.instruction_count)
+    assert [(20000 + address, EMPTY, program[address]) for address in range(1, 21)] == changes
+    assert [] == replay.changes(5, 5)
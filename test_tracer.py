@@ -0,0 +1,108 @@
+from central_processing_unit import InputExhausted, NoCommandError, ProgramTerminated
+from terminal_io import ScriptedInput
+from test_helpers import TestPrograms
+from tracer import InstructionTrace, TracingCentralProcessingUnit
+import io
+import pytest
+
+
+def make_traced(trace_size=8, **kwargs):
+    trace_file = io.StringIO()
+    cpu = TracingCentralProcessingUnit(trace_size=trace_size, trace_file=trace_file, **kwargs)
+    return cpu, trace_file
+
+
+def test_entries():
+    """ Operand values are what the registers held when the instruction ran, with the register it changed """
+    # 0: set r0 5, 3: add r1 r0 2, 7: halt
+    cpu, trace_file = make_traced()
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program([1, 32768, 5, 9, 32769, 32768, 2, 0])
+
+    entries = list(cpu.trace.entries())
+    assert [0, 3, 7] == [entry.address for entry in entries]
+
+    add = entries[1]
+    assert 9 == add.opcode
+    assert (0, 5, 2) == add.values
+    assert (1, 0, 7) == (add.register, add.before, add.after)
+    assert entries[2].register is None
+
+
+def test_ring_keeps_last():
+    """ Only the newest instructions are kept once the ring is full """
+    cpu, trace_file = make_traced(trace_size=4)
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(TestPrograms.count_down(10))
+
+    entries = list(cpu.trace.entries())
+    assert 4 == len(entries) == len(cpu.trace)
+    assert cpu.instruction_count + 1 == cpu.trace.count
+    assert [10, 13, 17, 20] == [entry.address for entry in entries]
+    assert (1, 1, 0) == (entries[1].register, entries[1].before, entries[1].after)
+
+
+def test_dump_on_error():
+    """ The trace is written when an instruction fails, marking the one that failed """
+    cpu, trace_file = make_traced()
+    with pytest.raises(NoCommandError):
+        cpu.run_program([1, 32768, 5, 22])
+
+    lines = trace_file.getvalue().splitlines()
+    assert "last 2 of 2 instructions run" == lines[0]
+    assert "    0: set r0 5  r0: 0 -> 5" == lines[1]
+    assert lines[2].startswith("    3: <22>  <- NoCommandError")
+
+
+def test_no_dump():
+    """ Dumping on errors can be left to the caller """
+    cpu, trace_file = make_traced(dump_on_error=False)
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program([0])
+
+    assert "" == trace_file.getvalue()
+    cpu.dump_trace()
+    assert "    0: halt" == trace_file.getvalue().splitlines()[-1]
+
+
+def test_waiting_for_input():
+    """ Running out of input is not an error, and the in is traced once when it does run """
+    cpu, trace_file = make_traced(input_source=ScriptedInput([]))
+    with pytest.raises(InputExhausted):
+        cpu.run_program([20, 32768, 0])
+
+    assert "" == trace_file.getvalue()
+    assert 0 == cpu.trace.count
+
+    cpu.input_source.feed('a')
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+
+    entries = list(cpu.trace.entries())
+    assert [0, 2] == [entry.address for entry in entries]
+    assert (0, 0, 97) == (entries[0].register, entries[0].before, entries[0].after)
+
+
+def test_waiting_for_input_with_full_ring():
+    """ An in that waits for input leaves a full ring holding what it did """
+    # 0: set r0 1, 3: set r1 2, 6: set r2 3, 9: in r3, 11: halt
+    program = [1, 32768, 1, 1, 32769, 2, 1, 32770, 3, 20, 32771, 0]
+    cpu, trace_file = make_traced(trace_size=3, input_source=ScriptedInput([]))
+    with pytest.raises(InputExhausted):
+        cpu.run_program(program)
+
+    entries = list(cpu.trace.entries())
+    assert [0, 3, 6] == [entry.address for entry in entries]
+    assert (2, 0, 3) == (entries[2].register, entries[2].before, entries[2].after)
+
+    cpu.input_source.feed('a')
+    with pytest.raises(ProgramTerminated):
+        cpu.execute()
+    entries = list(cpu.trace.entries())
+    assert [6, 9, 11] == [entry.address for entry in entries]
+    assert (3, 0, 97) == (entries[1].register, entries[1].before, entries[1].after)
+
+
+def test_size():
+    with pytest.raises(ValueError):
+        InstructionTrace(0)
@@ -0,0 +1,85 @@
+from block_compiler import CompiledCentralProcessingUnit
+from central_processing_unit import ProgramTerminated
+from memory_storage import Memory
+from snapshot import state_hash
+import io
+import pytest
+import translator
+
+
+@pytest.fixture
+def engine():
+    """ the translated engine, which conftest gives a cache of its own in each test """
+    return translator.TranslatedCentralProcessingUnit
+
+
+def test_matches_compiled_on_challenge(engine, monkeypatch):
+    """ Translated blocks should reach the first prompt of the challenge in exactly the same state """
+    cpus = [CompiledCentralProcessingUnit(capture_terminal_log=True), engine(capture_terminal_log=True)]
+    for cpu in cpus:
+        monkeypatch.setattr('sys.stdin', io.StringIO(''))
+        with pytest.raises(EOFError):
+            cpu.run_program('challenge.bin', from_file=True)
+
+    assert cpus[0].terminal_log == cpus[1].terminal_log
+    assert state_hash(cpus[0]) == state_hash(cpus[1])
+    assert cpus[0].instruction_count == cpus[1].instruction_count
+    assert cpus[1].translated_blocks > 0
+
+
+def test_translation_is_cached(engine, monkeypatch):
+    """ A program translated once is loaded from the cache after, even in a new process """
+    program = [19, 97, 0]
+    memory = Memory()
+    memory.load_program(program)
+    first = translator.translate(memory, engine.cache_dir)
+    assert [0] == sorted(first.blocks)
+
+    monkeypatch.setattr(translator, '_loaded', {})
+    monkeypatch.setattr(translator, 'module_source', None)
+    assert first.key == translator.translate(memory, engine.cache_dir).key
+
+    # Loading the program and clearing the caches is enough for the engine to find it
+    cpu = engine(capture_terminal_log=True)
+    cpu.memory.load_program(program)
+    cpu.clear_caches()
+    assert cpu.translation.key == first.key
+
+
+def test_overwritten_code_is_compiled(engine):
+    """ A translated block that the program writes over is compiled from what memory holds instead """
+    cpu = engine(capture_terminal_log=True)
+    program = [
+        19, 97,         # 0: out 'a'
+        16, 1, 98,      # 2: wmem the operand at 1 with 'b'
+        7, 32768, 13,   # 5: jt r0 to the halt
+        1, 32768, 1,    # 8: set r0 1
+        6, 0,           # 11: jmp back to the start
+        0,              # 13: halt
+    ]
+    with pytest.raises(ProgramTerminated):
+        cpu.run_program(program)
+
+    assert 'ab' == cpu.terminal_log
+    assert 8 == cpu.instruction_count
+    # the blocks at 0, 5 and 8 once each, the one at 0 no longer matches the second time round so is compiled
+    assert 3 == cpu.translated_blocks
+
+
+def test_snapshot_keeps_translation(engine, monkeypatch):
+    """ A machine restored from a snapshot uses the translation of the program it was loaded with """
+    cpu = engine()
+    monkeypatch.setattr('sys.stdin', io.StringIO(''))
+    with pytest.raises(EOFError):
+        cpu.run_program('challenge.bin', from_file=True)
+    data = cpu.save_state()
+
+    restored = engine(capture_terminal_log=True)
+    restored.load_state(data)
+    assert cpu.translation.key == restored.translation.key
+
+    monkeypatch.setattr('sys.stdin', io.StringIO('look\n'))
+    with pytest.raises(EOFError):
+        restored.execute()
+    assert 'Foothills' in restored.terminal_log
+    assert restored.translated_blocks > 0
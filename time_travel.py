@@ -0,0 +1,204 @@
+"""
+Time-travel debugging: record a run once, then jump to any instruction count in it
+
+a run is decided entirely by the program and the lines 'in' reads, so a Recording only logs those lines
+and a snapshot of the machine every 'interval' instructions. A Replay seeks to an instruction count by
+restoring the last checkpoint at or before it and running forward from there, so seeking anywhere in the run
+costs at most 'interval' instructions however long the run was
+
+most checkpoints are delta snapshots holding only the pages written since the one before, with a full
+snapshot every 'full_every' checkpoints so restoring one never loads more than that many
+"""
+from array import array
+from bisect import bisect_right
+from central_processing_unit import BUDGET_EXHAUSTED, UNTIL
+from collections import namedtuple
+from fast_processing_unit import FastCentralProcessingUnit
+from memory_storage import PAGE_BITS
+from terminal_io import NullOutput, ScriptedInput
+
+# Instructions run between checkpoints
+DEFAULT_INTERVAL = 1000000
+
+# Checkpoints from one full snapshot to the next
+DEFAULT_FULL_EVERY = 16
+
+# 'lines_read' is how many lines of the input log 'in' had read when the snapshot 'state' was taken
+Checkpoint = namedtuple('Checkpoint', ['instruction_count', 'lines_read', 'state'])
+
+
+class RecordingInput(object):
+    """ Input for 'in' that reads from 'source' and appends every line it hands out to 'lines' """
+
+    def __init__(self, source, lines):
+        self.source = source
+        self.lines = lines
+
+    def readline(self):
+        line = self.source.readline()
+        if line:
+            self.lines.append(line)
+        return line
+
+
+class Recording(object):
+    """ The input log and checkpoints of one run """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, full_every=DEFAULT_FULL_EVERY):
+        if interval < 1 or full_every < 1:
+            raise ValueError("Checkpoint interval and full snapshot spacing must be at least 1")
+
+        self.interval = interval
+        self.full_every = full_every
+        self.lines = []
+        # in order of instruction count, the first one taken when recording started
+        self.checkpoints = []
+
+    @property
+    def instruction_count(self):
+        """ the instruction count of the last checkpoint """
+        return self.checkpoints[-1].instruction_count
+
+    def checkpoint_before(self, instruction_count):
+        """ returns the index of the last checkpoint at or before 'instruction_count' """
+        counts = [checkpoint.instruction_count for checkpoint in self.checkpoints]
+        index = bisect_right(counts, instruction_count) - 1
+        if index < 0:
+            raise ValueError(f"Recording starts at instruction [{self.checkpoints[0].instruction_count}]")
+        return index
+
+    def size(self):
+        """ returns the bytes held by the checkpoints """
+        return sum(len(checkpoint.state) for checkpoint in self.checkpoints)
+
+
+class Recorder(object):
+    """
+    Records the run of 'cpu' from where it is now
+    run it through the recorder's run rather than the cpu's own, so checkpoints are taken as it goes
+    saving or loading snapshots on the cpu while it is recorded breaks the chain of delta snapshots
+    """
+
+    def __init__(self, cpu, interval=DEFAULT_INTERVAL, full_every=DEFAULT_FULL_EVERY):
+        self.cpu = cpu
+        self.recording = Recording(interval, full_every)
+        cpu.input_source = RecordingInput(cpu.input_source, self.recording.lines)
+        self.checkpoint()
+
+    def checkpoint(self):
+        """ adds a checkpoint of the cpu as it is now """
+        cpu = self.cpu
+        recording = self.recording
+        if len(recording.checkpoints) % recording.full_every:
+            state = cpu.save_delta()
+        else:
+            state = cpu.save_state()
+        recording.checkpoints.append(Checkpoint(cpu.instruction_count, len(recording.lines), state))
+
+    def run(self, max_instructions=None, until=None, check_every=1):
+        """ as the cpu's run, taking a checkpoint each time another 'interval' instructions have run """
+        cpu = self.cpu
+        started = cpu.instruction_count
+        remaining = max_instructions
+
+        while True:
+            budget = self.recording.instruction_count + self.recording.interval - cpu.instruction_count
+            if remaining is not None:
+                budget = min(budget, remaining)
+
+            result = cpu.run(max_instructions=budget, until=until, check_every=check_every)
+            if cpu.instruction_count >= self.recording.instruction_count + self.recording.interval:
+                self.checkpoint()
+
+            if remaining is not None:
+                remaining -= result.instructions
+
+            if result.status != BUDGET_EXHAUSTED or (remaining is not None and remaining <= 0):
+                return result._replace(instructions=cpu.instruction_count - started)
+
+
+class Replay(object):
+    """
+    Replays a Recording on a cpu of its own, which can be moved to any instruction count with seek
+    the replay runs on the fast engine by default, as it stops on exactly the instruction it is asked to
+    """
+
+    def __init__(self, recording, engine=FastCentralProcessingUnit, output=None):
+        self.recording = recording
+        self.cpu = engine(output=output if output is not None else NullOutput(), input_source=ScriptedInput())
+        self.restore(0)
+
+    def restore(self, index):
+        """ puts the cpu back in the state of checkpoint number 'index' """
+        cpu = self.cpu
+        full = index - index % self.recording.full_every
+        for checkpoint in self.recording.checkpoints[full:index + 1]:
+            cpu.load_state(checkpoint.state)
+        cpu.instruction_count = checkpoint.instruction_count
+        cpu.input_source = ScriptedInput(self.recording.lines[checkpoint.lines_read:])
+
+    def seek(self, instruction_count, until=None):
+        """
+        moves the cpu to 'instruction_count', returns the RunResult of running forward to it
+        the cpu carries on from where it is when that is nearer than any checkpoint
+        it stops early where the recorded run stopped, or once 'until' holds
+        """
+        cpu = self.cpu
+        index = self.recording.checkpoint_before(instruction_count)
+        start = self.recording.checkpoints[index].instruction_count
+        if not start <= cpu.instruction_count <= instruction_count or cpu.halted:
+            self.restore(index)
+
+        return cpu.run(max_instructions=instruction_count - cpu.instruction_count, until=until)
+
+    def step_back(self, instructions=1):
+        """ moves the cpu back 'instructions' instructions """
+        start = self.recording.checkpoints[0].instruction_count
+        return self.seek(max(self.cpu.instruction_count - instructions, start))
+
+    def find_last(self, condition, before=None):
+        """
+        returns the last instruction count before 'before', or the cpu's own count, at which 'condition' held
+        after an instruction ran, leaving the cpu there. Returns None with the cpu where it was if it never held
+        """
+        before = self.cpu.instruction_count if before is None else before
+        found = None
+        end = before
+        # search back a checkpoint at a time, the latest one first, each up to where the one after it starts
+        for index in reversed(range(len(self.recording.checkpoints))):
+            checkpoint = self.recording.checkpoints[index]
+            if checkpoint.instruction_count >= end:
+                continue
+
+            self.restore(index)
+            while True:
+                result = self.cpu.run(max_instructions=end - self.cpu.instruction_count, until=condition)
+                if result.status != UNTIL or self.cpu.instruction_count >= end:
+                    break
+                found = self.cpu.instruction_count
+            end = checkpoint.instruction_count
+
+            if found is not None:
+                break
+
+        self.seek(found if found is not None else before)
+        return found
+
+    def changes(self, start, end):
+        """
+        returns (address, old, new) for each word of memory that differs between instruction counts 'start' and 'end'
+        only the pages written on the way from one to the other are compared
+        """
+        self.seek(start)
+        memory = self.cpu.memory
+        before = array('i', memory._memory)
+        marker = memory.mark()
+        self.seek(end)
+
+        after = memory._memory
+        changes = []
+        for page in memory.pages_written_since(marker):
+            for address in range(page << PAGE_BITS, (page + 1) << PAGE_BITS):
+                if before[address] != after[address]:
+                    changes.append((address, before[address], after[address]))
+        return changes
@@ -0,0 +1,166 @@
+from array import array
+from central_processing_unit import NO_LIMIT, CentralProcessingUnit, InputExhausted
+from collections import namedtuple
+from disassembler import format_operand
+from instruction_cache import OPCODE_NAMES, WRITES_REGISTER
+from memory_storage import Registers
+import sys
+
+# How many of the most recent instructions are kept
+DEFAULT_TRACE_SIZE = 1024
+
+# 'operands' are instruction_cache.Operand, 'values' what each operand held when the instruction ran
+# 'register' is the register the instruction wrote or None, with its value 'before' and 'after'
+TraceEntry = namedtuple('TraceEntry', ['address', 'opcode', 'operands', 'values', 'register', 'before', 'after'])
+
+
+class InstructionTrace(object):
+    """
+    The last 'size' instructions run, kept in a ring preallocated up front so tracing never allocates as it goes
+    each slot holds the decoded instruction and a copy of the registers from just before it ran,
+    operand values and register changes are only worked out from those when the trace is read
+    """
+
+    def __init__(self, size=DEFAULT_TRACE_SIZE):
+        if size < 1:
+            raise ValueError("A trace must hold at least one instruction")
+
+        self.size = size
+        self.instructions = [None] * size
+        self.registers = array('i', [0]) * (size * Registers.SIZE)
+
+        # the registers as the run stopped, which are the 'after' of the newest instruction
+        self.final_registers = array('i', [0]) * Registers.SIZE
+
+        # instructions traced since the start, the newest is in slot (count - 1) % size
+        self.count = 0
+
+    def registers_before(self, index):
+        base = (index % self.size) * Registers.SIZE
+        return self.registers[base:base + Registers.SIZE]
+
+    def entries(self):
+        """ yields a TraceEntry for each instruction held, oldest first """
+        for index in range(max(0, self.count - self.size), self.count):
+            instruction = self.instructions[index % self.size]
+            before = self.registers_before(index)
+            after = self.registers_before(index + 1) if index + 1 < self.count else self.final_registers
+
+            values = tuple(operand.literal if operand.register is None else before[operand.register]
+                           for operand in instruction.operands)
+
+            register = None
+            if instruction.opcode in WRITES_REGISTER and instruction.operands:
+                register = instruction.operands[0].register
+
+            if register is None:
+                yield TraceEntry(instruction.address, instruction.opcode, instruction.operands, values,
+                                 None, None, None)
+            else:
+                yield TraceEntry(instruction.address, instruction.opcode, instruction.operands, values,
+                                 register, before[register], after[register])
+
+    def clear(self):
+        self.count = 0
+        self.instructions[:] = [None] * self.size
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def format_lines(self, reason=None):
+        """ yields the trace as lines of text, oldest first, marking the last instruction with 'reason' if given """
+        yield f"last {len(self)} of {self.count} instructions run"
+        entries = list(self.entries())
+        for position, entry in enumerate(entries):
+            line = format_entry(entry)
+            if reason is not None and position == len(entries) - 1:
+                line += f"  <- {reason.__class__.__name__}: {reason}"
+            yield line
+
+    def dump(self, file=None, reason=None):
+        """ writes the trace to 'file', stderr by default """
+        file = sys.stderr if file is None else file
+        for line in self.format_lines(reason):
+            file.write(line + '\n')
+        file.flush()
+
+
+def format_entry(entry):
+    """ returns one line for a TraceEntry, showing what each register operand held """
+    name = OPCODE_NAMES.get(entry.opcode, f"<{entry.opcode}>")
+    parts = [name]
+    for position, (operand, value) in enumerate(zip(entry.operands, entry.values)):
+        if operand.register is None or (position == 0 and entry.register is not None):
+            # a literal, or the register being written, whose change is shown at the end
+            parts.append(format_operand(operand))
+        else:
+            parts.append(f"{format_operand(operand)}={value}")
+
+    line = f"{entry.address:5}: {' '.join(parts)}"
+    if entry.register is not None and entry.before != entry.after:
+        line += f"  r{entry.register}: {entry.before} -> {entry.after}"
+    return line
+
+
+class TracingCentralProcessingUnit(CentralProcessingUnit):
+    """
+    Models the CPU using the reference implementation of each opcode, keeping the last instructions run in 'trace'
+    the trace is written to 'trace_file' whenever the program stops on an exception, halting included,
+    apart from InputExhausted which only means the run is waiting for input
+    """
+
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None,
+                 trace_size=DEFAULT_TRACE_SIZE, trace_file=None, dump_on_error=True, image=None):
+        super(TracingCentralProcessingUnit, self).__init__(capture_terminal_log, output, input_source, image)
+        self.trace = InstructionTrace(trace_size)
+        self.trace_file = trace_file
+        self.dump_on_error = dump_on_error
+
+    def dump_trace(self, file=None):
+        """ writes the trace now """
+        self.trace.dump(file if file is not None else self.trace_file)
+
+    def run_instructions(self, limit=None):
+        """ runs from the current program pointer until the program stops or 'instruction_count' reaches 'limit' """
+        trace = self.trace
+        instructions = trace.instructions
+        saved_registers = trace.registers
+        size = trace.size
+        registers = self.registers._memory
+        register_count = len(registers)
+        get_instruction = self.instruction_cache.get
+        execute_command = self.execute_command
+
+        count = trace.count
+        limit = NO_LIMIT if limit is None else limit
+        try:
+            while self.instruction_count < limit:
+                instruction = get_instruction(self.program_pointer)
+                if instruction is None:
+                    break
+
+                slot = count % size
+                base = slot * register_count
+                if instruction.opcode == 20:
+                    # in may have no input and wait to run again, the slot has to hold what it did until then
+                    held = instructions[slot], saved_registers[base:base + register_count]
+                instructions[slot] = instruction
+                saved_registers[base:base + register_count] = registers
+
+                count += 1
+                execute_command(instruction)
+                self.instruction_count += 1
+        except InputExhausted:
+            # the in will run again once there is input, so it takes the same slot then
+            count -= 1
+            instructions[slot], saved_registers[base:base + register_count] = held
+            raise
+        except BaseException as e:
+            trace.count = count
+            trace.final_registers[:] = registers
+            if self.dump_on_error:
+                trace.dump(self.trace_file, reason=e)
+            raise
+        finally:
+            trace.count = count
+            trace.final_registers[:] = registers
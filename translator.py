@@ -0,0 +1,220 @@
+"""
+Ahead-of-time translation of a program image into a python module of compiled blocks, cached on disk
+
+the image is swept once for every address a block can start at, the entry point, literal jump and call targets
+and the instruction after each one that ends a block, and each block is written out as the compiled engine
+would compile it. The module is named by a hash of the image and of the block compiler, and imported like any
+other module, so after the first time a start is an unmarshal of its .pyc with no decoding or compiling at all.
+memory keeps the digest of the image it was loaded from through snapshots, so a machine restored from one
+finds the translation of its program however much of memory the program has written over since
+"""
+from block_compiler import BLOCK_TERMINATORS, INTERPRETED_OPCODES, CompiledCentralProcessingUnit
+from collections import namedtuple
+from disassembler import sweep
+from memory_storage import Memory, image_digest
+import argparse
+import block_compiler
+import hashlib
+import importlib.util
+import os
+import sys
+
+# Where translated modules are written, their .pyc files go in a __pycache__ inside it
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__translated__')
+
+# 'blocks' maps each entry address to the function that binds its block to a cpu,
+# the number of instructions in it and the words of memory it was translated from
+Translation = namedtuple('Translation', ['key', 'blocks'])
+
+MODULE_HEADER = '''"""
+Translated from the program image with key {key} by translator.py, do not edit
+"""
+from block_compiler import EmptyStackError, ProgramTerminated
+
+KEY = {key!r}
+'''
+
+# Translations already imported, keyed by image key
+_loaded = {}
+_generator_digest = None
+
+
+def generator_digest():
+    """ returns a digest of the block compiler's source, so a change to the code it generates makes new keys """
+    global _generator_digest
+    if _generator_digest is None:
+        digest = hashlib.blake2b(digest_size=16)
+        for module in (block_compiler, sys.modules[__name__]):
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        _generator_digest = digest.digest()
+    return _generator_digest
+
+
+def image_key(memory):
+    """
+    returns the key of the program image 'memory' was loaded from,
+    or of the words up to its occupied addresses if it was never loaded with one
+    """
+    origin = memory.origin
+    if origin is None:
+        origin = image_digest(memory._memory[:memory.occupied_memory_addresses])
+
+    digest = hashlib.blake2b(generator_digest(), digest_size=16)
+    digest.update(origin)
+    return digest.hexdigest()
+
+
+def module_path(key, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, f"image_{key}.py")
+
+
+def block_starts(memory):
+    """ returns every address a block of the program in 'memory' can be seen to start at without running it """
+    starts = {0}
+    for instruction in sweep(memory):
+        if instruction.opcode is None:
+            continue
+        if instruction.target is not None:
+            starts.add(instruction.target)
+        if instruction.opcode in BLOCK_TERMINATORS or instruction.opcode in INTERPRETED_OPCODES:
+            starts.add(instruction.next_address)
+    return sorted(address for address in starts if address < memory.SIZE)
+
+
+def module_source(memory, key):
+    """ returns the source of the translated module for the program in 'memory' """
+    compiler = CompiledCentralProcessingUnit()
+    compiler.memory = memory
+
+    parts = [MODULE_HEADER.format(key=key)]
+    entries = []
+    for address in block_starts(memory):
+        compiled = compiler.block_source(address)
+        if compiled is None:
+            continue
+
+        source, size, end = compiled
+        body = '\n'.join('    ' + line if line else line for line in source.splitlines())
+        parts.append(
+            f"\ndef bind_{address}(regs, mem, stack, push, pop, peak, covered, written, invalidate, forget,\n"
+            f"        write_output, cpu, **names):\n"
+            f"{body}\n"
+            f"    return block_{address}\n"
+        )
+        words = tuple(memory._memory[address:end])
+        entries.append(f"    {address}: (bind_{address}, {size}, {words!r}),")
+
+    parts.append('\nBLOCKS = {\n' + '\n'.join(entries) + '\n}\n')
+    return ''.join(parts)
+
+
+def load_translation(key, cache_dir=DEFAULT_CACHE_DIR):
+    """ returns the Translation with 'key' if it has been translated before, otherwise None """
+    translation = _loaded.get(key)
+    if translation is not None:
+        return translation
+
+    path = module_path(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+
+    spec = importlib.util.spec_from_file_location(f"translated_{key}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    translation = _loaded[key] = Translation(key, module.BLOCKS)
+    return translation
+
+
+def translate(memory, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    returns the Translation of the image 'memory' was loaded from, if there is none yet
+    the program as memory holds it now is translated and written to the cache
+    """
+    key = image_key(memory)
+    translation = load_translation(key, cache_dir)
+    if translation is not None:
+        return translation
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = module_path(key, cache_dir)
+    # written under another name first, so no other process ever imports half a module
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, 'w') as f:
+        f.write(module_source(memory, key))
+    os.replace(partial, path)
+
+    return load_translation(key, cache_dir)
+
+
+class TranslatedCentralProcessingUnit(CompiledCentralProcessingUnit):
+    """
+    Models the CPU with blocks translated ahead of time, falling back to compiling blocks as they run
+    whenever memory is replaced wholesale, by loading a program or a snapshot, the translation of the image it was
+    loaded from is looked up in the cache, and run_program translates a program that has not been before.
+    A translated block is only used while memory holds the words it was translated from, so code written over at
+    runtime, and any block the translator could not see, like the target of a jump to a register, is compiled as
+    it runs, as on the compiled engine
+    """
+
+    cache_dir = DEFAULT_CACHE_DIR
+
+    def __init__(self, capture_terminal_log=False, output=None, input_source=None, image=None):
+        super(TranslatedCentralProcessingUnit, self).__init__(capture_terminal_log, output, input_source, image)
+
+        # the translation in use, which stays in use until memory is replaced by a program that has another one
+        self.translation = None
+        # how many blocks have come from the translation rather than being compiled
+        self.translated_blocks = 0
+
+    def translate(self):
+        """ translates the program in memory, if it has not been before, and uses the translation """
+        self.translation = translate(self.memory, self.cache_dir)
+
+    def clear_caches(self):
+        """ as the compiled engine, then picks up the translation of the image memory was loaded from, if any """
+        super(TranslatedCentralProcessingUnit, self).clear_caches()
+        translation = load_translation(image_key(self.memory), self.cache_dir)
+        if translation is not None:
+            self.translation = translation
+
+    def compile_block(self, address):
+        """ binds the translated block at 'address' if memory still holds its words, otherwise compiles it """
+        translated = self.translation.blocks.get(address) if self.translation is not None else None
+        if translated is not None:
+            bind, size, words = translated
+            end = address + len(words)
+            if tuple(self.memory._memory[address:end]) == words:
+                self.translated_blocks += 1
+                return self.install_block(address, bind(**self.block_namespace()), size, end)
+
+        return super(TranslatedCentralProcessingUnit, self).compile_block(address)
+
+    def run_program(self, program, from_file=False):
+        """ runs the program, translating it first if it has not been before """
+        self.program_pointer = 0
+        self.halted = False
+        self.memory.load_program(program, from_file)
+        self.clear_caches()
+        self.translate()
+        self.execute()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Translate a program into a cached python module ahead of time")
+    parser.add_argument('program', nargs='?', default='challenge.bin', help="binary to translate")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="where translated modules are kept")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    memory = Memory()
+    memory.load_program(args.program, from_file=True)
+    translation = translate(memory, args.cache_dir)
+    sys.stdout.write(f"{module_path(translation.key, args.cache_dir)}: {len(translation.blocks)} blocks\n")
+
+
+if __name__ == '__main__':
+    main()